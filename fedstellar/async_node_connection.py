@@ -0,0 +1,351 @@
+#
+# This file an adaptation and extension of the p2pfl library (https://pypi.org/project/p2pfl/).
+# Refer to the LICENSE file for licensing information.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+
+from fedstellar.communication_protocol import CommunicationProtocol
+from fedstellar.config.config import Config
+from fedstellar.encrypter import AESCipher
+from fedstellar.node_connection import NodeConnection
+from fedstellar.utils.observer import Events
+
+
+#############################
+#    AsyncNodeConnection    #
+#############################
+
+
+class AsyncNodeConnection(NodeConnection):
+    """
+    Connection to a node for the asyncio transport (``TRANSPORT = "asyncio"``). Instead of a thread with a blocking socket,
+    the connection is a coroutine running in the event loop of the node, which reads the frames using a ``StreamReader``.
+
+    It has the same interface (and notifies the same events) as ``NodeConnection``, so the node logic does not depend on the transport.
+    Sending is thread safe and never blocks: frames are written to the ``StreamWriter`` from the event loop.
+    Models are written by a coroutine that waits for the writer to drain after each fragment, so text messages are not blocked behind a model.
+    Text messages are coalesced: they are written together ``SEND_MAX_LATENCY`` seconds after the first pending one was sent.
+
+    Args:
+        parent_node_name: The name of the parent node of this connection.
+        reader: The ``StreamReader`` of the connection.
+        writer: The ``StreamWriter`` of the connection.
+        addr: The address of the node that is connected to.
+        aes_cipher: The cipher of the connection (None if it is not encrypted).
+        loop: The event loop of the node.
+        processed_messages: Set of processed messages shared by all the connections of the node.
+    """
+
+    ##############
+    #    Init    #
+    ##############
+
+    def __init__(
+            self, parent_node_name, reader, writer, addr, aes_cipher, loop, config: Config = None, processed_messages=None
+    ):
+        NodeConnection.__init__(
+            self, parent_node_name, None, addr, aes_cipher, config=config, processed_messages=processed_messages
+        )
+        self.__terminate_flag = threading.Event()
+        self.__reader = reader
+        self.__writer = writer
+        self.__aes_cipher = aes_cipher
+        self.__loop = loop
+        # Text messages waiting to be written (by __flush_control_frames)
+        self.__control_frames = []
+        self.__control_lock = threading.Lock()
+        # Models waiting to be sent (by __send_models)
+        self.__models = deque()
+        self.__models_lock = threading.Lock()
+        self.__sending_models = False
+
+    ###################
+    #    Main Loop    #
+    ###################
+
+    def start(self, force=False):
+        """
+        Start the connection. The receiving loop is scheduled in the event loop of the node.
+
+        Args:
+            force: Determine if connection is going to keep alive even if it should not.
+        """
+        self.notify(Events.NODE_CONNECTED_EVENT, (self, force))
+        asyncio.run_coroutine_threadsafe(self.__run(), self.__loop)
+
+    async def __run(self):
+        """
+        Receive and process frames (same protocol as ``NodeConnection.run``).
+
+        The last fragment of a model is processed in the default executor (decoding and aggregation are CPU bound),
+        the connection waits for it, so the messages of a connection are still processed in order.
+        """
+        header_size = CommunicationProtocol.FRAME_HEADER.size
+        timeout = self.config.participant["NODE_TIMEOUT"]
+        while not self.__terminate_flag.is_set():
+            try:
+                # Receive frame header
+                header = await asyncio.wait_for(self.__reader.readexactly(header_size), timeout)
+                version, frame_type, length = CommunicationProtocol.parse_frame_header(header)
+                if version != CommunicationProtocol.WIRE_VERSION:
+                    logging.info(
+                        "[ASYNC_NODE_CONNECTION] Unsupported wire version {} (expected {})".format(version, CommunicationProtocol.WIRE_VERSION)
+                    )
+                    break
+                if length > CommunicationProtocol.MAX_FRAME_LENGTH:
+                    logging.info(
+                        "[ASYNC_NODE_CONNECTION] Frame too long: {} bytes (maximum {})".format(length, CommunicationProtocol.MAX_FRAME_LENGTH)
+                    )
+                    break
+
+                # Receive payload (encrypted payloads are followed by the authentication tag)
+                wire_length = length
+                if self.__aes_cipher is not None:
+                    wire_length = length + AESCipher.TAG_SIZE
+                msg = memoryview(await asyncio.wait_for(self.__reader.readexactly(wire_length), timeout))
+
+                # Decrypt message
+                if self.__aes_cipher is not None:
+                    msg = memoryview(self.__aes_cipher.decrypt(msg[:length], msg[length:], header=header))
+
+                # Process message
+                if frame_type == CommunicationProtocol.FRAME_PARAMS_END:
+                    error = await self.__loop.run_in_executor(None, self.process_frame, frame_type, msg)
+                else:
+                    error = self.process_frame(frame_type, msg)
+
+                # Error happened
+                if error:
+                    logging.info(
+                        "[ASYNC_NODE_CONNECTION] An error happened. Frame type: {} | Length: {}".format(frame_type, length)
+                    )
+                    break
+
+            except asyncio.IncompleteReadError:
+                break
+
+            except asyncio.TimeoutError:
+                logging.info(
+                    "[ASYNC_NODE_CONNECTION] (AsyncNodeConnection Loop) Timeout"
+                )
+                break
+
+            except Exception as e:
+                logging.info(
+                    "[ASYNC_NODE_CONNECTION] (AsyncNodeConnection Loop) Exception: {}".format(str(e))
+                )
+                break
+
+        # Down Connection
+        self.__terminate_flag.set()
+        logging.info("[ASYNC_NODE_CONNECTION] Closed connection: {}".format(self.get_name()))
+        self.notify(Events.END_CONNECTION_EVENT, self)
+        self.__writer.close()
+
+    @staticmethod
+    async def read_frame(reader):
+        """
+        Receive a single text frame. It is used before the connection is established (handshake).
+
+        Args:
+            reader: The ``StreamReader``.
+
+        Returns:
+            The payload of the frame, or None if the connection was closed or the frame is not a valid text frame.
+        """
+        try:
+            header = await reader.readexactly(CommunicationProtocol.FRAME_HEADER.size)
+            version, frame_type, length = CommunicationProtocol.parse_frame_header(header)
+            if version != CommunicationProtocol.WIRE_VERSION or frame_type != CommunicationProtocol.FRAME_TEXT or length > CommunicationProtocol.MAX_FRAME_LENGTH:
+                return None
+            return await reader.readexactly(length)
+        except asyncio.IncompleteReadError:
+            return None
+
+    def stop(self, local=False):
+        """
+        Stop the connection. Closes the writer, so the receiving loop ends.
+
+        Args:
+            local: If true, the connection will be closed without notifying the other node.
+        """
+        if not local:
+            self.send(CommunicationProtocol.build_stop_msg())
+        self.__terminate_flag.set()
+        try:
+            self.__loop.call_soon_threadsafe(self.__close_writer)
+        except RuntimeError:
+            # Event loop already closed
+            pass
+
+    def __close_writer(self):
+        # Pending text messages (e.g. STOP) are written before closing
+        self.__flush_control_frames()
+        self.__writer.close()
+
+    ##################
+    #    Messages    #
+    ##################
+
+    def send(self, data, frame_type=CommunicationProtocol.FRAME_TEXT):
+        """
+        Tries to send a message to the other node. The frame is encrypted and written from the event loop (in order).
+
+        Args:
+            data: The message to send.
+            frame_type: The type of the frame (text by default).
+
+        Returns:
+            True if the message was queued to be sent, False otherwise.
+        """
+        # The other node would close the connection (text messages are not split)
+        if len(data) > CommunicationProtocol.MAX_FRAME_LENGTH:
+            logging.error(
+                "[ASYNC_NODE_CONNECTION] Message too long: {} bytes (maximum {})".format(len(data), CommunicationProtocol.MAX_FRAME_LENGTH)
+            )
+            return False
+        # Check if the connection is still alive
+        if not self.__terminate_flag.is_set():
+            try:
+                self.record_frame_sent()
+                if frame_type != CommunicationProtocol.FRAME_TEXT:
+                    self.__loop.call_soon_threadsafe(self.__write_frame, data, frame_type)
+                    return True
+                # Text messages are written together (the first pending one schedules the flush)
+                self.__control_lock.acquire()
+                self.__control_frames.append(data)
+                schedule = len(self.__control_frames) == 1
+                self.__control_lock.release()
+                if schedule:
+                    self.__loop.call_soon_threadsafe(
+                        self.__loop.call_later, self.config.participant["SEND_MAX_LATENCY"], self.__flush_control_frames
+                    )
+                return True
+
+            except Exception as e:
+                # If some error happened, the connection is closed
+                self.__terminate_flag.set()
+                return False
+        else:
+            return False
+
+    def send_model(self, encoded_msgs):
+        """
+        Tries to send a model (its fragments) to the other node. If there are ``SEND_QUEUE_SIZE`` models queued, the model is discarded
+        (it will be gossiped again).
+
+        Args:
+            encoded_msgs: List of (frame_type, fragment) of the model.
+
+        Returns:
+            True if the model was queued, False otherwise.
+        """
+        if self.__terminate_flag.is_set():
+            return False
+        self.__models_lock.acquire()
+        try:
+            if self.is_send_queue_full():
+                return False
+            self.__models.append(encoded_msgs)
+            self.record_frame_sent()
+            if self.__sending_models:
+                return True
+            self.__sending_models = True
+        finally:
+            self.__models_lock.release()
+        try:
+            asyncio.run_coroutine_threadsafe(self.__send_models(), self.__loop)
+        except RuntimeError:
+            # Event loop already closed
+            return False
+        return True
+
+    def __flush_control_frames(self):
+        """
+        Write the pending text messages (from the event loop).
+        """
+        self.__control_lock.acquire()
+        frames = self.__control_frames
+        self.__control_frames = []
+        self.__control_lock.release()
+        if frames and not self.__writer.is_closing():
+            buffers = []
+            for data in frames:
+                buffers.extend(self.__build_frame(data, CommunicationProtocol.FRAME_TEXT))
+            self.__writer.writelines(buffers)
+
+    def is_send_queue_full(self):
+        """
+        Returns:
+            True if there are ``SEND_QUEUE_SIZE`` models queued.
+        """
+        return self.get_pending_models() >= self.config.participant["SEND_QUEUE_SIZE"]
+
+    def get_pending_models(self):
+        """
+        Returns:
+            Number of models queued or being sent.
+        """
+        return len(self.__models) + self.__sending_models
+
+    async def __send_models(self):
+        """
+        Write the queued models (one by one). Text messages written meanwhile are sent between the fragments.
+        """
+        while True:
+            self.__models_lock.acquire()
+            if not self.__models or self.__terminate_flag.is_set():
+                self.__models.clear()
+                self.__sending_models = False
+                self.__models_lock.release()
+                return
+            encoded_msgs = self.__models.popleft()
+            self.__models_lock.release()
+            try:
+                start = time.monotonic()
+                for frame_type, msg in encoded_msgs:
+                    if self.__terminate_flag.is_set():
+                        break
+                    self.__write_frame(msg, frame_type)
+                    await self.__writer.drain()
+                else:
+                    self.record_model_sent(sum(len(msg) for _, msg in encoded_msgs), time.monotonic() - start)
+            except Exception as e:
+                # If some error happened, the connection is closed
+                self.__terminate_flag.set()
+
+    def __write_frame(self, data, frame_type):
+        if not self.__writer.is_closing():
+            self.__writer.writelines(self.__build_frame(data, frame_type))
+
+    def __build_frame(self, data, frame_type):
+        """
+        Build the buffers of a frame. It is called from the event loop, so frames are encrypted in the same order they are written.
+
+        Returns:
+            List of buffers (header, payload and, if encrypted, authentication tag).
+        """
+        # The header carries the length of the message
+        header = CommunicationProtocol.build_frame_header(frame_type, len(data))
+        # Encrypt message
+        if self.__aes_cipher is not None:
+            return [header, *self.__aes_cipher.encrypt(data, header=header)]
+        return [header, data]
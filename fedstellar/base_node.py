@@ -14,21 +14,29 @@
 # You should have received a copy of the GNU General Public License
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 #
+import asyncio
 import json
 import logging
 import os
+import queue
 import socket
 import threading
 from datetime import datetime
 from logging import Formatter, FileHandler
 from logging.handlers import RotatingFileHandler
 
+from Crypto.Random import get_random_bytes
+
+from fedstellar.async_node_connection import AsyncNodeConnection
 from fedstellar.communication_protocol import CommunicationProtocol
-from fedstellar.encrypter import AESCipher, RSACipher
+from fedstellar.encrypter import AESCipher, RSACipher, SessionTickets
 from fedstellar.gossiper import Gossiper
 from fedstellar.heartbeater import Heartbeater
+from fedstellar.loopback_node_connection import LoopbackNetwork, LoopbackNodeConnection
 from fedstellar.node_connection import NodeConnection
+from fedstellar.utils.neighbors import NeighborRegistry
 from fedstellar.utils.observer import Events, Observer
+from fedstellar.utils.processed_messages import ProcessedMessages
 
 
 class BaseNode(threading.Thread, Observer):
@@ -44,6 +52,8 @@ class BaseNode(threading.Thread, Observer):
         host (str): The host of the node.
         port (int): The port of the node.
         simulation (bool): If the node is in simulation mode or not. Basically, simulation nodes don't have encryption and metrics aren't sent to network nodes.
+        transport (str): ``thread`` (a thread per connection), ``asyncio`` (connections, heartbeater and gossiper are coroutines in an event loop run by the node thread)
+            or ``loopback`` (in-memory connections with the nodes of the same process, frames are processed by the node thread).
         heartbeater (Heartbeater): The heartbeater of the node.
         gossiper (Gossiper): The gossiper of the node.
     """
@@ -61,22 +71,40 @@ class BaseNode(threading.Thread, Observer):
         self.encrypt = encrypt
         self.simulation = config.participant["scenario_args"]["simulation"]
         self.config = config
+        self.transport = config.participant["TRANSPORT"]
 
         # Super init
         threading.Thread.__init__(self, name="node-" + self.get_name())
         self._terminate_flag = threading.Event()
 
         # Setting Up Node Socket (listening)
-        self.__node_socket = socket.socket(
-            socket.AF_INET, socket.SOCK_STREAM
-        )  # TCP Socket
-        if port is None:
-            self.__node_socket.bind((host, 0))  # gets a random free port
-            self.port = self.__node_socket.getsockname()[1]
+        self.__node_socket = None
+        self.__inbox = None
+        # Addresses this node is connecting to (loopback transport), to resolve nodes connecting to each other at the same time
+        self.__loopback_connecting = set()
+        if self.transport == "loopback":
+            # No sockets, frames of all the connections are received in the inbox
+            self.__inbox = queue.Queue()
+            if port is None:
+                self.port = LoopbackNetwork.get_free_port()
         else:
-            logging.info("[BASENODE] Trying to bind to {}:{}".format(host, port))
-            self.__node_socket.bind((host, port))
-        self.__node_socket.listen(50)  # no more than 50 connections at queue
+            self.__node_socket = socket.socket(
+                socket.AF_INET, socket.SOCK_STREAM
+            )  # TCP Socket
+            if port is None:
+                self.__node_socket.bind((host, 0))  # gets a random free port
+                self.port = self.__node_socket.getsockname()[1]
+            else:
+                logging.info("[BASENODE] Trying to bind to {}:{}".format(host, port))
+                self.__node_socket.bind((host, port))
+            self.__node_socket.listen(50)  # no more than 50 connections at queue
+
+        # Event loop (asyncio transport)
+        self.__loop = None
+        self.__stop_event = None
+        if self.transport == "asyncio":
+            self.__loop = asyncio.new_event_loop()
+            self.__stop_event = asyncio.Event()
 
         # Setting up network resources
         if not self.simulation and config.participant["network_args"]:
@@ -85,8 +113,17 @@ class BaseNode(threading.Thread, Observer):
             os.system(f"tcset --device {config.participant['network_args']['interface']} --rate {config.participant['network_args']['rate']} --delay {config.participant['network_args']['delay']} --delay-distro {config.participant['network_args']['delay-distro']} --loss {config.participant['network_args']['loss']}")
 
         # Neighbors
-        self.__neighbors = []  # private to avoid concurrency issues
-        self.__nei_lock = threading.Lock()
+        self.__neighbors = NeighborRegistry()  # lookups do not lock (copy-on-write)
+        self.__nei_lock = threading.Lock()  # serializes the establishment of connections
+        # Processed messages (shared by all the connections)
+        self.__processed_messages = ProcessedMessages(config.participant["AMOUNT_LAST_MESSAGES_SAVED"])
+
+        # Encryption: identity key (generated once) and session tickets
+        self.__rsa = None
+        self.__session_tickets = None
+        if self.encrypt:
+            self.__rsa = RSACipher()
+            self.__session_tickets = SessionTickets(config.participant["SESSION_TICKET_TTL"])
 
         # Logging
         self.log_dir = os.path.join(config.participant['tracking_args']["log_dir"], self.experiment_name)
@@ -168,6 +205,8 @@ class BaseNode(threading.Thread, Observer):
         Note that a node is a thread, so an instance can only be started once.
         """
         # Main Loop
+        if self.transport == "loopback":
+            LoopbackNetwork.register(self.get_addr(), self)
         super().start()
         # Heartbeater and Gossiper
         self.heartbeater = Heartbeater(self.get_name(), self.__neighbors, self.config)
@@ -176,14 +215,28 @@ class BaseNode(threading.Thread, Observer):
         )  # thread safe, only read
         self.heartbeater.add_observer(self)
         self.gossiper.add_observer(self)
-        self.heartbeater.start()
-        self.gossiper.start()
+        if self.transport == "asyncio":
+            asyncio.run_coroutine_threadsafe(self.heartbeater.run_async(), self.__loop)
+            asyncio.run_coroutine_threadsafe(self.gossiper.run_async(), self.__loop)
+        else:
+            self.heartbeater.start()
+            self.gossiper.start()
 
     def stop(self):
         """
         Stops the node. Heartbeater and Gossiper will be stopped too.
         """
         self._terminate_flag.set()
+        if self.transport == "asyncio":
+            try:
+                self.__loop.call_soon_threadsafe(self.__stop_event.set)
+            except RuntimeError:
+                # Event loop already closed
+                pass
+            return
+        if self.transport == "loopback":
+            self.__inbox.put(None)
+            return
         try:
             # Send a self message to the loop to avoid the wait of the next recv
             self.__send(self.host, self.port, b"")
@@ -200,10 +253,15 @@ class BaseNode(threading.Thread, Observer):
         """
         # Process new connections loop
         logging.info("[BASENODE] Node started")
+        if self.transport == "asyncio":
+            asyncio.set_event_loop(self.__loop)
+            self.__loop.run_until_complete(self.__run_async())
+        elif self.transport == "loopback":
+            self.__run_loopback()
         while not self._terminate_flag.is_set():
             try:
                 (ns, _) = self.__node_socket.accept()
-                msg = ns.recv(self.config.participant["BLOCK_SIZE"])
+                msg = NodeConnection.recv_frame(ns)
 
                 # Process new connection
                 if msg:
@@ -213,6 +271,8 @@ class BaseNode(threading.Thread, Observer):
                     )
                     if not CommunicationProtocol.process_connection(msg, callback):
                         ns.close()
+                else:
+                    ns.close()
             except Exception as e:
                 logging.exception(e)
 
@@ -229,65 +289,235 @@ class BaseNode(threading.Thread, Observer):
         nei_copy_list = self.get_neighbors()
         for n in nei_copy_list:
             n.stop()
-        self.__node_socket.close()
+        if self.__node_socket is not None:
+            self.__node_socket.close()
+        if self.transport == "asyncio":
+            self.__loop.close()
+        elif self.transport == "loopback":
+            LoopbackNetwork.unregister(self.get_addr())
+            # Process the end of the connections (other frames are discarded)
+            while not self.__inbox.empty():
+                item = self.__inbox.get_nowait()
+                if item is not None and item[1] is None:
+                    item[0].deliver(None, None)
+
+    def __run_loopback(self):
+        """
+        Main loop of the node (loopback transport). It processes the frames received by all the connections (in order) until the node is stopped.
+        """
+        while not self._terminate_flag.is_set():
+            item = self.__inbox.get()
+            if item is None:
+                break
+            nc, frame_type, msg = item
+            nc.deliver(frame_type, msg)
 
-    def __process_new_connection(self, node_socket, h, p, full, force):
+    async def __run_async(self):
+        """
+        Main coroutine of the node (asyncio transport). It accepts new connections until the node is stopped,
+        then it stops the connections and waits for them (and the rest of tasks) to finish.
+        """
+        server = await asyncio.start_server(self.__process_new_connection_async, sock=self.__node_socket)
+        await self.__stop_event.wait()
+        server.close()
+        self.heartbeater.stop()
+        self.gossiper.stop()
+        for n in self.get_neighbors():
+            n.stop()
+        tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+        if len(tasks) > 0:
+            await asyncio.wait(tasks, timeout=self.config.participant["HEARTBEAT_PERIOD"])
+
+    async def __process_new_connection_async(self, reader, writer):
+        """
+        Handshake of a new connection (asyncio transport). Same steps as ``__process_new_connection``.
+        """
+        msg = await AsyncNodeConnection.read_frame(reader)
+        args = []
+        if msg is None or not CommunicationProtocol.process_connection(msg.decode("UTF-8"), lambda *a: args.extend(a)):
+            writer.close()
+            return
+        h, p, full, force = args
+
+        nc = None
         try:
             # Check if connection with the node already exist
+            if self.get_neighbor(h, p) is not None:
+                writer.close()
+                return
+
+            # Encryption
+            aes_cipher = None
+            if self.encrypt:
+                reply, aes_cipher = self.__accept_session(
+                    await asyncio.wait_for(AsyncNodeConnection.read_frame(reader), self.config.participant["NODE_TIMEOUT"])
+                )
+                writer.write(CommunicationProtocol.build_frame_header(CommunicationProtocol.FRAME_TEXT, len(reply)) + reply)
+
+            # Add neighbor (no awaits while the lock is held, the handshake is done)
             self.__nei_lock.acquire()
-            if self.get_neighbor(h, p, thread_safe=False) is None:
+            try:
+                if self.get_neighbor(h, p) is None:
+                    logging.info(
+                        "{} Connection accepted with {}:{}".format(
+                            self.get_name(), h, p
+                        )
+                    )
+                    nc = AsyncNodeConnection(
+                        self.get_name(), reader, writer, (h, p), aes_cipher, self.__loop, config=self.config, processed_messages=self.__processed_messages
+                    )
+                    nc.add_observer(self)
+                    logging.info("[BASENODE.__process_new_connection_async] New neighbor: {}".format(nc.get_name()))
+                    self.__neighbors.add(nc)
+                    nc.start(force=force)
 
-                # Check if ip and port are correct
-                s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                s.settimeout(2)
-                result = s.connect_ex((h, p))
-                s.close()
+                    if full:
+                        self.broadcast(
+                            CommunicationProtocol.build_connect_to_msg(h, p),
+                            exc=[nc],
+                        )
+                else:
+                    writer.close()
+            finally:
+                self.__nei_lock.release()
 
-                # Encryption
-                aes_cipher = None
-                if self.encrypt:
-                    # Asymmetric
-                    rsa = RSACipher()
-                    node_socket.sendall(rsa.get_key())
-                    rsa.load_pair_public_key(node_socket.recv(len(rsa.get_key())))
+        except Exception as e:
+            logging.info(
+                "[BASENODE] Connection refused with {}:{}".format(h, p)
+            )
+            writer.close()
+            if nc is not None:
+                self.rm_neighbor(nc)
+
+    def __process_new_connection(self, node_socket, h, p, full, force):
+        nc = None
+        try:
+            # Check if connection with the node already exist
+            if self.get_neighbor(h, p) is not None:
+                node_socket.close()
+                return
 
-                    # Symmetric
-                    aes_cipher = AESCipher()
-                    node_socket.sendall(aes_cipher.get_key())
+            # Encryption (before taking the lock, the handshake waits for the other node)
+            aes_cipher = None
+            if self.encrypt:
+                node_socket.settimeout(self.config.participant["NODE_TIMEOUT"])
+                reply, aes_cipher = self.__accept_session(NodeConnection.recv_frame(node_socket))
+                node_socket.sendall(CommunicationProtocol.build_frame_header(CommunicationProtocol.FRAME_TEXT, len(reply)) + reply)
 
-                # Add neighbor
-                if result == 0:
+            # Add neighbor
+            self.__nei_lock.acquire()
+            try:
+                if self.get_neighbor(h, p) is None:
                     logging.info(
                         "{} Connection accepted with {}:{}".format(
                             self.get_name(), h, p
                         )
                     )
                     nc = NodeConnection(
-                        self.get_name(), node_socket, (h, p), aes_cipher, config=self.config
+                        self.get_name(), node_socket, (h, p), aes_cipher, config=self.config, processed_messages=self.__processed_messages
                     )
                     nc.add_observer(self)
                     logging.info("[BASENODE.__process_new_connection] New neighbor: {}".format(nc.get_name()))
-                    self.__neighbors.append(nc)
+                    self.__neighbors.add(nc)
                     nc.start(force=force)
 
                     if full:
                         self.broadcast(
                             CommunicationProtocol.build_connect_to_msg(h, p),
                             exc=[nc],
-                            thread_safe=False,
                         )
-            else:
-                node_socket.close()
-
-            self.__nei_lock.release()
+                else:
+                    node_socket.close()
+            finally:
+                self.__nei_lock.release()
 
         except Exception as e:
             logging.info(
                 "[BASENODE] Connection refused with {}:{}".format(h, p)
             )
-            self.__nei_lock.release()
             node_socket.close()
-            self.rm_neighbor(nc)
+            if nc is not None:
+                self.rm_neighbor(nc)
+
+    ####################
+    #    Encryption    #
+    ####################
+
+    def __start_session(self, h, p):
+        """
+        Build the handshake message of the node that starts an encrypted connection.
+        If the node has a session ticket of the other node, the session can be resumed (without the RSA exchange).
+
+        Args:
+            h: The host of the other node.
+            p: The port of the other node.
+
+        Returns:
+            (hello message, nonce)
+        """
+        ticket, _ = self.__session_tickets.get_ticket((h, p))
+        nonce = get_random_bytes(16)
+        return CommunicationProtocol.build_hello_msg(self.__rsa.get_key(), ticket, nonce), nonce
+
+    def __accept_session(self, msg):
+        """
+        Process the handshake message of a node that starts an encrypted connection.
+        If the ticket is valid, the session is resumed. Otherwise, a new key (and ticket) is sent encrypted with the RSA key of the node.
+
+        Args:
+            msg: The hello message.
+
+        Returns:
+            (reply message, cipher of the connection)
+        """
+        handshake = CommunicationProtocol.process_handshake(msg) if msg is not None else None
+        if handshake is None or handshake[0] != CommunicationProtocol.HELLO:
+            raise ValueError("Invalid handshake message")
+        public_key, ticket, client_nonce = handshake[1]
+
+        # Resume session
+        secret = self.__session_tickets.get_secret(ticket) if ticket is not None else None
+        if secret is not None:
+            server_nonce = get_random_bytes(16)
+            key = SessionTickets.derive_key(secret, client_nonce, server_nonce)
+            return CommunicationProtocol.build_session_resume_msg(server_nonce), AESCipher(key=key)
+
+        # New session
+        key = get_random_bytes(AESCipher.key_len())
+        ticket, secret = self.__session_tickets.issue()
+        encrypted_key = self.__rsa.encrypt(key + (secret if secret is not None else b""), pair_key=public_key)
+        return CommunicationProtocol.build_session_key_msg(encrypted_key, ticket), AESCipher(key=key)
+
+    def __finish_session(self, msg, h, p, nonce):
+        """
+        Process the handshake reply of the node that accepted an encrypted connection.
+
+        Args:
+            msg: The reply message.
+            h: The host of the other node.
+            p: The port of the other node.
+            nonce: The nonce sent in the hello message.
+
+        Returns:
+            The cipher of the connection.
+        """
+        handshake = CommunicationProtocol.process_handshake(msg) if msg is not None else None
+        if handshake is None:
+            raise ValueError("Invalid handshake message")
+        if handshake[0] == CommunicationProtocol.SESSION_RESUME:
+            ticket, secret = self.__session_tickets.get_ticket((h, p))
+            if secret is None:
+                raise ValueError("Session resumed without ticket")
+            key = SessionTickets.derive_key(secret, nonce, handshake[1][0])
+            logging.info("[BASENODE] Session resumed with {}:{}".format(h, p))
+        elif handshake[0] == CommunicationProtocol.SESSION_KEY:
+            encrypted_key, ticket = handshake[1]
+            data = self.__rsa.decrypt(encrypted_key)
+            key = data[:AESCipher.key_len()]
+            self.__session_tickets.store((h, p), ticket, data[AESCipher.key_len():])
+        else:
+            raise ValueError("Invalid handshake message")
+        return AESCipher(key=key, initiator=True)
 
     #############################
     #  Neighborhood management  #
@@ -331,33 +561,49 @@ class BaseNode(threading.Thread, Observer):
         else:
             force = "0"
 
+        if self.transport == "loopback":
+            return self.__connect_to_loopback(h, p, full, force)
+
+        if self.transport == "asyncio":
+            coro = self.__connect_to_async(h, p, full, force)
+            if threading.current_thread() is self:
+                # Called from the event loop, it can't wait for the connection
+                self.__loop.create_task(coro)
+                return None
+            try:
+                return asyncio.run_coroutine_threadsafe(coro, self.__loop).result(timeout=self.config.participant["NODE_TIMEOUT"])
+            except Exception as e:
+                logging.info(
+                    "{} Can't connect to the node {}:{}".format(self.get_name(), h, p)
+                )
+                return None
+
         try:
             # Check if connection with the node already exist
             h = socket.gethostbyname(h)
             self.__nei_lock.acquire()
-            if self.get_neighbor(h, p, thread_safe=False) is None:
+            if self.get_neighbor(h, p) is None:
 
                 # Send connection request
                 msg = CommunicationProtocol.build_connect_msg(
                     self.host, self.port, full, force
                 )
+                msg = CommunicationProtocol.build_frame_header(CommunicationProtocol.FRAME_TEXT, len(msg)) + msg
                 s = self.__send(h, p, msg, persist=True)
 
                 # Encryption
                 aes_cipher = None
-                if not self.simulation:
-                    # Asymmetric
-                    rsa = RSACipher()
-                    rsa.load_pair_public_key(s.recv(len(rsa.get_key())))
-                    s.sendall(rsa.get_key())
-                    # Symmetric
-                    aes_cipher = AESCipher(key=s.recv(AESCipher.key_len()))
+                if self.encrypt:
+                    s.settimeout(self.config.participant["NODE_TIMEOUT"])
+                    hello, nonce = self.__start_session(h, p)
+                    s.sendall(CommunicationProtocol.build_frame_header(CommunicationProtocol.FRAME_TEXT, len(hello)) + hello)
+                    aes_cipher = self.__finish_session(NodeConnection.recv_frame(s), h, p, nonce)
 
                 # Add socket to neighbors
-                nc = NodeConnection(self.get_name(), s, (h, p), aes_cipher, config=self.config)
+                nc = NodeConnection(self.get_name(), s, (h, p), aes_cipher, config=self.config, processed_messages=self.__processed_messages)
                 nc.add_observer(self)
                 logging.info("[BASENODE_connect_to] Connected to {}:{} -> New neighbor {}".format(h, p, nc.get_name()))
-                self.__neighbors.append(nc)
+                self.__neighbors.add(nc)
                 nc.start(force=force)
                 self.__nei_lock.release()
                 return nc
@@ -379,6 +625,159 @@ class BaseNode(threading.Thread, Observer):
                 pass
             return None
 
+    async def __connect_to_async(self, h, p, full, force):
+        """
+        Connects a node to another (asyncio transport). Same steps as ``connect_to``.
+        """
+        writer = None
+        nc = None
+        try:
+            # Check if connection with the node already exist
+            h = socket.gethostbyname(h)
+            if self.get_neighbor(h, p) is not None:
+                logging.info(
+                    "{} Already connected to {}:{}".format(self.get_name(), h, p)
+                )
+                return None
+
+            # Send connection request
+            reader, writer = await asyncio.open_connection(h, p)
+            msg = CommunicationProtocol.build_connect_msg(
+                self.host, self.port, full, force
+            )
+            writer.write(CommunicationProtocol.build_frame_header(CommunicationProtocol.FRAME_TEXT, len(msg)) + msg)
+
+            # Encryption
+            aes_cipher = None
+            if self.encrypt:
+                hello, nonce = self.__start_session(h, p)
+                writer.write(CommunicationProtocol.build_frame_header(CommunicationProtocol.FRAME_TEXT, len(hello)) + hello)
+                aes_cipher = self.__finish_session(
+                    await asyncio.wait_for(AsyncNodeConnection.read_frame(reader), self.config.participant["NODE_TIMEOUT"]), h, p, nonce
+                )
+
+            # Add connection to neighbors (no awaits while the lock is held)
+            self.__nei_lock.acquire()
+            try:
+                if self.get_neighbor(h, p) is not None:
+                    writer.close()
+                    return None
+                nc = AsyncNodeConnection(self.get_name(), reader, writer, (h, p), aes_cipher, self.__loop, config=self.config, processed_messages=self.__processed_messages)
+                nc.add_observer(self)
+                logging.info("[BASENODE_connect_to] Connected to {}:{} -> New neighbor {}".format(h, p, nc.get_name()))
+                self.__neighbors.add(nc)
+                nc.start(force=force)
+            finally:
+                self.__nei_lock.release()
+            return nc
+
+        except Exception as e:
+            logging.info(
+                "{} Can't connect to the node {}:{}".format(self.get_name(), h, p)
+            )
+            if writer is not None:
+                writer.close()
+            if nc is not None:
+                self.rm_neighbor(nc)
+            return None
+
+    def __connect_to_loopback(self, h, p, full, force):
+        """
+        Connects a node to another of the same process (loopback transport). Same steps as ``connect_to``, but the connection
+        is accepted by calling the other node (the lock of the neighbors is not held meanwhile, so nodes can connect to each other at the same time).
+
+        While connecting, the address is in ``__loopback_connecting``: if the other node connects to this one at the same time, only the
+        connection started by the node with the lower address is accepted (see ``__process_new_connection_loopback``), so exactly one pair remains.
+        """
+        try:
+            # Check if connection with the node already exist (or it is being established)
+            h = socket.gethostbyname(h)
+            self.__nei_lock.acquire()
+            try:
+                if self.get_neighbor(h, p) is not None or (h, p) in self.__loopback_connecting:
+                    logging.info(
+                        "{} Already connected to {}:{}".format(self.get_name(), h, p)
+                    )
+                    return None
+                self.__loopback_connecting.add((h, p))
+            finally:
+                self.__nei_lock.release()
+
+            try:
+                # Send connection request
+                node = LoopbackNetwork.get_node((h, p))
+                if node is None:
+                    raise ConnectionRefusedError()
+                nc = LoopbackNodeConnection(self.get_name(), (h, p), self.__inbox, config=self.config, processed_messages=self.__processed_messages)
+                nc.add_observer(self)
+                peer = node.__process_new_connection_loopback(nc, self.host, self.port, full == "1", force == "1")
+                if peer is None:
+                    return None
+
+                # Add connection to neighbors (the tiebreak guarantees that the other node was not accepted meanwhile)
+                self.__nei_lock.acquire()
+                try:
+                    logging.info("[BASENODE_connect_to] Connected to {}:{} -> New neighbor {}".format(h, p, nc.get_name()))
+                    self.__neighbors.add(nc)
+                    nc.start(force=force)
+                finally:
+                    self.__nei_lock.release()
+                return nc
+            finally:
+                self.__nei_lock.acquire()
+                self.__loopback_connecting.discard((h, p))
+                self.__nei_lock.release()
+
+        except Exception as e:
+            logging.info(
+                "{} Can't connect to the node {}:{}".format(self.get_name(), h, p)
+            )
+            return None
+
+    def __process_new_connection_loopback(self, nc, h, p, full, force):
+        """
+        Accept a connection from a node of the same process (loopback transport).
+
+        If this node is connecting to the other one at the same time, the connection started by the node with the lower address is the
+        one accepted (the other node refuses this node's request too), so exactly one pair of connections remains.
+
+        Args:
+            nc: The connection of the other node.
+
+        Returns:
+            LoopbackNodeConnection: The connection of this node (paired with ``nc``), or None if the connection was not accepted.
+        """
+        self.__nei_lock.acquire()
+        try:
+            # Check if connection with the node already exist
+            if self.get_neighbor(h, p) is not None:
+                return None
+            # Both nodes are connecting to each other: keep the connection of the lower address
+            if (h, p) in self.__loopback_connecting and (h, p) > (self.host, self.port):
+                return None
+
+            # Add neighbor
+            logging.info(
+                "{} Connection accepted with {}:{}".format(
+                    self.get_name(), h, p
+                )
+            )
+            peer = LoopbackNodeConnection(self.get_name(), (h, p), self.__inbox, config=self.config, processed_messages=self.__processed_messages)
+            LoopbackNodeConnection.pair(nc, peer)
+            peer.add_observer(self)
+            logging.info("[BASENODE.__process_new_connection_loopback] New neighbor: {}".format(peer.get_name()))
+            self.__neighbors.add(peer)
+            peer.start(force=force)
+
+            if full:
+                self.broadcast(
+                    CommunicationProtocol.build_connect_to_msg(h, p),
+                    exc=[peer],
+                )
+            return peer
+        finally:
+            self.__nei_lock.release()
+
     def disconnect_from(self, h, p):
         """
         Disconnects from a node.
@@ -389,68 +788,58 @@ class BaseNode(threading.Thread, Observer):
         """
         self.get_neighbor(h, p).stop()
 
-    def get_neighbor(self, h, p, thread_safe=True):
+    def get_neighbor(self, h, p):
         """
-         Get a ``NodeConnection`` from the neighbors list.
+        Get a ``NodeConnection`` from the neighbors (O(1), it does not lock).
 
-         Args:
-             h (str): The host of the node.
-             p (int): The port of the node.
-            thread_safe (bool): If True, the method will be thread safe.
-
-         Returns:
-             NodeConnection: The connection with the node.
-         """
+        Args:
+            h (str): The host of the node.
+            p (int): The port of the node.
 
-        if thread_safe:
-            self.__nei_lock.acquire()
+        Returns:
+            NodeConnection: The connection with the node, or None.
+        """
+        return self.__neighbors.get((h, p))
 
-        return_node = None
-        for n in self.__neighbors:
-            if n.get_addr() == (h, p):
-                return_node = n
-                break
+    def get_neighbor_by_name(self, name):
+        """
+        Get a ``NodeConnection`` from the neighbors by the name of the node (O(1), it does not lock).
 
-        if thread_safe:
-            self.__nei_lock.release()
+        Args:
+            name (str): The name of the node (``host:port``).
 
-        return return_node
+        Returns:
+            NodeConnection: The connection with the node, or None.
+        """
+        return self.__neighbors.get_by_name(name)
 
     def get_neighbors(self):
         """
         Returns:
-            list: The neighbors of the node.
+            tuple: Snapshot of the neighbors of the node (it is not modified when neighbors are added or removed).
         """
-        self.__nei_lock.acquire()
-        n = self.__neighbors.copy()
-        self.__nei_lock.release()
-        return n
+        return self.__neighbors.snapshot()
 
     def get_neighbors_names(self):
         """
         Returns:
             list: The names of the neighbors of the node.
         """
-        self.__nei_lock.acquire()
-        n = [nc.get_name() for nc in self.__neighbors]
-        self.__nei_lock.release()
-        return n
+        return [nc.get_name() for nc in self.__neighbors.snapshot()]
 
     def rm_neighbor(self, n):
         """
-        Removes a neighbor from the neighbors list.
+        Removes a neighbor from the neighbors and stops the connection.
 
         Args:
             n (NodeConnection): The neighbor to be removed.
         """
-        self.__nei_lock.acquire()
-        try:
+        if self.__neighbors.remove(n):
             logging.info("[BASENODE.rm_neighbor] Remove neighbor: {}".format(n.get_name()))
-            self.__neighbors.remove(n)
-            n.stop()
-        except Exception as e:
-            pass
-        self.__nei_lock.release()
+            try:
+                n.stop()
+            except Exception as e:
+                pass
 
     def get_network_nodes(self):
         """
@@ -463,28 +852,22 @@ class BaseNode(threading.Thread, Observer):
     #     Msg management     #
     ##########################
 
-    def broadcast(self, msg, exc=[], thread_safe=True):
+    def broadcast(self, msg, exc=[]):
         """
         Broadcasts a message to all the neighbors.
 
         Args:
             msg (str): The message to be broadcast.
             exc (list): The neighbors to be excluded.
-            thread_safe (bool): If True, the broadcast will access the neighbors list in a thread safe mode.
 
         """
-        if thread_safe:
-            self.__nei_lock.acquire()
-
-        logging.debug("[BASENODE.broadcast] {} --> to: {} | Excluded: {}".format(msg, self.__neighbors, exc))
+        neighbors = self.__neighbors.snapshot()
+        logging.debug("[BASENODE.broadcast] {} --> to: {} | Excluded: {}".format(msg, neighbors, exc))
 
-        for n in self.__neighbors:
+        for n in neighbors:
             if not (n in exc):
                 n.send(msg)
 
-        if thread_safe:
-            self.__nei_lock.release()
-
     ###########################
     #     Observer Events     #
     ###########################
@@ -509,7 +892,10 @@ class BaseNode(threading.Thread, Observer):
             # Este evento lo notifica NodeConnection. Previamente se ha tenido que conectar con el nodo.
             logging.debug("[BASENODE.update (observer) | Events.NODE_CONNECTED_EVENT] Connecting to: {}".format(obj[0]))
             n, _ = obj
-            n.send(CommunicationProtocol.build_beat_msg(self.get_name()))
+            if self.config.participant["HEARTBEAT_MODE"] == "digest":
+                self.heartbeater.send_digests([n])
+            else:
+                n.send(CommunicationProtocol.build_beat_msg(self.get_name()))
 
         elif event == Events.CONN_TO_EVENT:
             logging.debug("[BASENODE.update (observer) | Events.CONN_TO_EVENT] Connecting to: {} {}".format(obj[0], obj[1]))
@@ -518,22 +904,28 @@ class BaseNode(threading.Thread, Observer):
         elif event == Events.SEND_BEAT_EVENT:
             self.broadcast(CommunicationProtocol.build_beat_msg(self.get_name()))
 
-        elif event == Events.GOSSIP_BROADCAST_EVENT:
-            self.broadcast(obj[0], exc=obj[1])
+        elif event == Events.GOSSIP_SEND_EVENT:
+            msg, nodes = obj
+            for n in nodes:
+                n.send(msg)
 
         elif event == Events.PROCESSED_MESSAGES_EVENT:
             node, msgs = obj
-            # Communicate to connections the new messages processed
-            for nc in self.__neighbors:
-                if nc != node:
-                    nc.add_processed_messages(list(msgs.keys()))
+            # The connections share the set of processed messages, so there is no need to communicate them
             # Gossip the new messages
             if len(str(obj)) > 300:
                 logging.debug("[BASENODE.update (observer) | Events.PROCESSED_MESSAGES_EVENT] Add messages to gossiper: Too long [...] | Node: {}".format(node))
             else:
                 logging.debug("[BASENODE.update (observer) | Events.PROCESSED_MESSAGES_EVENT] Add messages to gossiper: {} | Node: {}".format(list(msgs.values()), node))
-            self.gossiper.add_messages(list(msgs.values()), node)
+            self.gossiper.add_messages(msgs, node)
 
         elif event == Events.BEAT_RECEIVED_EVENT:
             # Update the heartbeater with the active neighbor
             self.heartbeater.add_node(obj)
+
+        elif event == Events.LIVENESS_RECEIVED_EVENT:
+            # Update the heartbeater with the liveness table of the neighbor
+            self.heartbeater.add_digest(obj[0], obj[1])
+
+        elif event == Events.SEND_LIVENESS_EVENT:
+            obj[0].send(obj[1])
@@ -158,6 +158,24 @@ class Model_initialized_cmd(Command):
         self.node_connection.set_model_initialized(True)
 
 
+class Compression_cmd(Command):
+    """
+    Command that should be executed as a response to a **compression** message.
+    """
+
+    def execute(self, quantization, delta, topk):
+        self.node_connection.notify_compression(quantization, delta, topk)
+
+
+class Liveness_cmd(Command):
+    """
+    Command that should be executed as a response to a **liveness** message.
+    """
+
+    def execute(self, entries):
+        self.node_connection.notify_liveness(entries)
+
+
 class Transfer_leadership_cmd(Command):
     """
     Command that should be executed as a response to a **transfer_leadership** message.
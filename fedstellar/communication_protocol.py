@@ -16,12 +16,14 @@
 #
 
 
+import base64
 import logging
 import random
-import threading
+import struct
 from datetime import datetime
 
 from fedstellar.config.config import Config
+from fedstellar.utils.processed_messages import ProcessedMessages
 
 
 ###############################
@@ -47,21 +49,33 @@ class CommunicationProtocol:
             - CONNECT <ip> <port> <full> <force>
             - CONNECT_TO <ip> <port>
             - STOP
-            - PARAMS <data> \PARAMS
+            - PARAMS <data>
             - MODELS_READY <round>
             - MODELS_AGGREGATED <node>* MODELS_AGGREGATED_CLOSE
             - MODEL_INITIALIZED
+            - COMPRESSION <quantization> <delta> <topk>
+            - LIVENESS (<node> <version> <role>)* LIVENESS_CLOSE
+
+        Handshake messages (encryption, after CONNECT):
+            - HELLO <public key> <ticket> <nonce>
+            - SESSION_KEY <encrypted key> <ticket>
+            - SESSION_RESUME <nonce>
 
     Furthermore, all messages consist of encoded text (utf-8), except the `PARAMS` message, which contains serialized binaries.
 
+    On the wire, every message travels inside a frame: a fixed header (wire version, frame type and payload length) followed by the payload.
+    Text messages use ``FRAME_TEXT`` frames, and the serialized model is split into ``FRAME_PARAMS`` fragments terminated by a ``FRAME_PARAMS_END`` fragment.
+    This way, the receiver knows in advance how many bytes it has to read and messages never need to be scanned for delimiters.
+
     Non-static methods are used to process the different messages. Static methods are used to build messages and process only the `CONNECT` message (handshake).
 
     Args:
         command_dict: Dictionary with the callbacks to execute at `process_message`.
+        last_messages: Set of processed messages (shared by the connections of a node). If None, a new one is created.
 
     Attributes:
         command_dict: Dictionary with the callbacks to execute at `process_message`.
-        last_messages: List of the last messages received.
+        last_messages: Set of the last messages received.
     """
 
     """
@@ -101,10 +115,6 @@ class CommunicationProtocol:
     """
     PARAMS = "PARAMS"  # special case (binary)
     """
-    Parameters message closing.
-    """
-    PARAMS_CLOSE = "\PARAMS"  # special case (binary)
-    """
     Models ready message header.
     """
     MODELS_READY = "MODELS_READY"
@@ -132,32 +142,72 @@ class CommunicationProtocol:
     Model initialized message header.
     """
     MODEL_INITIALIZED = "MODEL_INITIALIZED"
+    """
+    Compression settings message header.
+    """
+    COMPRESSION = "COMPRESSION"
+    """
+    Liveness digest message header.
+    """
+    LIVENESS = "LIVENESS"
+    """
+    Liveness digest message closing.
+    """
+    LIVENESS_CLOSE = "\\LIVENESS"
+    """
+    Encryption handshake message headers.
+    """
+    HELLO = "HELLO"
+    SESSION_KEY = "SESSION_KEY"
+    SESSION_RESUME = "SESSION_RESUME"
+
+    """
+    Version of the wire format. Frames with a different version are rejected.
+    """
+    WIRE_VERSION = 1
+    """
+    Frame header: version (1 byte), frame type (1 byte) and payload length (4 bytes, network order).
+    """
+    FRAME_HEADER = struct.Struct("!BBI")
+    """
+    Maximum payload length of a frame (same for all the nodes, it does not depend on ``BLOCK_SIZE``). Longer frames are malformed
+    (or hostile): the connection is closed before the payload is allocated.
+    Models are sent in fragments of at most ``min(BLOCK_SIZE, MAX_FRAME_LENGTH)`` bytes. Text messages are not split, so they must
+    be shorter (e.g. a liveness digest is about 40 bytes per node): longer ones are not sent.
+    """
+    MAX_FRAME_LENGTH = 16 * 1024 * 1024
+    """
+    Frame type of text messages (commands).
+    """
+    FRAME_TEXT = 0x01
+    """
+    Frame type of a fragment of the serialized model.
+    """
+    FRAME_PARAMS = 0x02
+    """
+    Frame type of the last fragment of the serialized model.
+    """
+    FRAME_PARAMS_END = 0x03
 
     ############################################
     #    MSG PROCESSING (Non Static Methods)   #
     ############################################
 
-    def __init__(self, command_dict, config: Config):
+    def __init__(self, command_dict, config: Config, last_messages: ProcessedMessages = None):
         self.command_dict = command_dict
         self.config = config
-        self.last_messages = []
-        self.__last_messages_lock = threading.Lock()
+        if last_messages is None:
+            last_messages = ProcessedMessages(self.config.participant["AMOUNT_LAST_MESSAGES_SAVED"])
+        self.last_messages = last_messages
 
     def add_processed_messages(self, messages):
         """
-        Add messages to the last messages list. If ammount is higher than ``AMOUNT_LAST_MESSAGES_SAVED`` remove the oldest to keep the size.
+        Add messages to the last messages set. If ammount is higher than ``AMOUNT_LAST_MESSAGES_SAVED`` the oldest are removed to keep the size.
 
         Args:
             messages: List of hashes of the messages.
         """
-        self.__last_messages_lock.acquire()
-        self.last_messages = self.last_messages + messages
-        # Remove oldest messages
-        if len(self.last_messages) > self.config.participant["AMOUNT_LAST_MESSAGES_SAVED"]:
-            self.last_messages = self.last_messages[
-                                 len(self.last_messages) - self.config.participant["AMOUNT_LAST_MESSAGES_SAVED"]:
-                                 ]
-        self.__last_messages_lock.release()
+        self.last_messages.add_all(messages)
 
     def process_message(self, msg):
         """
@@ -173,290 +223,335 @@ class CommunicationProtocol:
         self.tmp_exec_msgs = {}
         error = False
 
-        # Determine if is a binary message or not
-        header = CommunicationProtocol.PARAMS.encode("utf-8")
-        if msg[0: len(header)] == header:
-            end = CommunicationProtocol.PARAMS_CLOSE.encode("utf-8")
-
-            # Check if done
-            end_pos = msg.find(end)
-            if end_pos != -1:
-                return [], not self.__exec(
-                    CommunicationProtocol.PARAMS,
-                    None,
-                    None,
-                    msg[len(header): end_pos],
-                    True,
-                )
-
-            return [], not self.__exec(
-                CommunicationProtocol.PARAMS, None, None, msg[len(header):], False
-            )
+        # Try to decode the message
+        message = ""
+        try:
+            message = msg.decode("utf-8")
+            message = message.split()
+        except UnicodeDecodeError:
+            error = True
+
+        # Process messages
+        while len(message) > 0:
+
+            # Beat
+            if message[0] == CommunicationProtocol.BEAT:
+                if len(message) > 2:
+                    hash_ = message[2]
+                    cmd_text = (" ".join(message[0:3]) + "\n").encode("utf-8")
+                    if self.__exec(
+                            CommunicationProtocol.BEAT, hash_, cmd_text, message[1]
+                    ):
+                        message = message[3:]  # Remove the BEAT message from the list (3 elements: BEAT <node> <hash>)
+                    else:
+                        error = True
+                        break
+                else:
+                    error = True
+                    break
 
-        else:
-            # Try to decode the message
-            message = ""
-            try:
-                message = msg.decode("utf-8")
-                message = message.split()
-            except UnicodeDecodeError:
-                error = True
+            # Role
+            elif message[0] == CommunicationProtocol.ROLE:
+                if len(message) > 3:
+                    hash_ = message[3]
+                    cmd_text = (" ".join(message[0:4]) + "\n").encode("utf-8")
+                    if self.__exec(
+                            CommunicationProtocol.ROLE, hash_, cmd_text, message[1], message[2]
+                    ):
+                        message = message[4:]  # Remove the ROLE message from the list
+                    else:
+                        error = True
+                        break
+                else:
+                    error = True
+                    break
 
-            # Process messages
-            while len(message) > 0:
+            # Stop (non gossiped)
+            elif message[0] == CommunicationProtocol.STOP:
+                if self.__exec(CommunicationProtocol.STOP, None, None):
+                    message = message[1:]
+                else:
+                    error = True
+                    break
 
-                # Beat
-                if message[0] == CommunicationProtocol.BEAT:
-                    if len(message) > 2:
-                        hash_ = message[2]
-                        cmd_text = (" ".join(message[0:3]) + "\n").encode("utf-8")
+            # Connect to
+            elif message[0] == CommunicationProtocol.CONN_TO:
+                if len(message) > 2:
+                    if message[2].isdigit():
                         if self.__exec(
-                                CommunicationProtocol.BEAT, hash_, cmd_text, message[1]
+                                CommunicationProtocol.CONN_TO,
+                                None,
+                                None,
+                                message[1],
+                                int(message[2]),
                         ):
-                            message = message[3:]  # Remove the BEAT message from the list (3 elements: BEAT <node> <hash>)
+                            message = message[3:]
                         else:
                             error = True
                             break
                     else:
                         error = True
                         break
+                else:
+                    error = True
+                    break
 
-                # Role
-                elif message[0] == CommunicationProtocol.ROLE:
-                    if len(message) > 3:
+            # Start learning
+            elif message[0] == CommunicationProtocol.START_LEARNING:
+                if len(message) > 3:
+                    if message[1].isdigit() and message[2].isdigit():
                         hash_ = message[3]
                         cmd_text = (" ".join(message[0:4]) + "\n").encode("utf-8")
                         if self.__exec(
-                                CommunicationProtocol.ROLE, hash_, cmd_text, message[1], message[2]
+                                CommunicationProtocol.START_LEARNING,
+                                hash_,
+                                cmd_text,
+                                int(message[1]),
+                                int(message[2]),
                         ):
-                            message = message[4:]  # Remove the ROLE message from the list
+                            message = message[4:]
                         else:
                             error = True
                             break
                     else:
                         error = True
                         break
+                else:
+                    error = True
+                    break
 
-                # Stop (non gossiped)
-                elif message[0] == CommunicationProtocol.STOP:
-                    if self.__exec(CommunicationProtocol.STOP, None, None):
-                        message = message[1:]
-                    else:
-                        error = True
-                        break
-
-                # Connect to
-                elif message[0] == CommunicationProtocol.CONN_TO:
-                    if len(message) > 2:
-                        if message[2].isdigit():
-                            if self.__exec(
-                                    CommunicationProtocol.CONN_TO,
-                                    None,
-                                    None,
-                                    message[1],
-                                    int(message[2]),
-                            ):
-                                message = message[3:]
-                            else:
-                                error = True
-                                break
+            # Stop learning
+            elif message[0] == CommunicationProtocol.STOP_LEARNING:
+                if len(message) > 1:
+                    if message[1].isdigit():
+                        hash_ = message[1]
+                        cmd_text = (" ".join(message[0:2]) + "\n").encode("utf-8")
+                        if self.__exec(
+                                CommunicationProtocol.STOP_LEARNING, hash_, cmd_text
+                        ):
+                            message = message[2:]
                         else:
                             error = True
                             break
                     else:
                         error = True
                         break
+                else:
+                    error = True
+                    break
 
-                # Start learning
-                elif message[0] == CommunicationProtocol.START_LEARNING:
-                    if len(message) > 3:
-                        if message[1].isdigit() and message[2].isdigit():
-                            hash_ = message[3]
-                            cmd_text = (" ".join(message[0:4]) + "\n").encode("utf-8")
-                            if self.__exec(
-                                    CommunicationProtocol.START_LEARNING,
-                                    hash_,
-                                    cmd_text,
-                                    int(message[1]),
-                                    int(message[2]),
-                            ):
-                                message = message[4:]
-                            else:
-                                error = True
-                                break
+            # Models Ready
+            elif message[0] == CommunicationProtocol.MODELS_READY:
+                if len(message) > 1:
+                    if message[1].isdigit():
+                        if self.__exec(
+                                CommunicationProtocol.MODELS_READY,
+                                None,
+                                None,
+                                int(message[1]),
+                        ):
+                            message = message[2:]
                         else:
                             error = True
                             break
                     else:
                         error = True
                         break
+                else:
+                    error = True
+                    break
 
-                # Stop learning
-                elif message[0] == CommunicationProtocol.STOP_LEARNING:
-                    if len(message) > 1:
-                        if message[1].isdigit():
-                            hash_ = message[1]
-                            cmd_text = (" ".join(message[0:2]) + "\n").encode("utf-8")
-                            if self.__exec(
-                                    CommunicationProtocol.STOP_LEARNING, hash_, cmd_text
-                            ):
-                                message = message[2:]
-                            else:
-                                error = True
-                                break
+            # Metrics
+            elif message[0] == CommunicationProtocol.METRICS:
+                if len(message) > 5:
+                    try:
+                        hash_ = message[5]
+                        cmd_text = (" ".join(message[0:6]) + "\n").encode("utf-8")
+                        if self.__exec(
+                                CommunicationProtocol.METRICS,
+                                hash_,
+                                cmd_text,
+                                message[1],
+                                int(message[2]),
+                                float(message[3]),
+                                float(message[4]),
+                        ):
+                            message = message[6:]
                         else:
                             error = True
                             break
-                    else:
+                    except Exception as e:
                         error = True
                         break
+                else:
+                    error = True
+                    break
 
-                # Models Ready
-                elif message[0] == CommunicationProtocol.MODELS_READY:
-                    if len(message) > 1:
-                        if message[1].isdigit():
-                            if self.__exec(
-                                    CommunicationProtocol.MODELS_READY,
-                                    None,
-                                    None,
-                                    int(message[1]),
-                            ):
-                                message = message[2:]
-                            else:
-                                error = True
-                                break
-                        else:
-                            error = True
-                            break
-                    else:
+            # Vote train set
+            elif message[0] == CommunicationProtocol.VOTE_TRAIN_SET:
+                try:
+                    # Divide messages and check length of message
+                    close_pos = message.index(
+                        CommunicationProtocol.VOTE_TRAIN_SET_CLOSE
+                    )
+                    node = message[1]
+                    vote_msg = message[2:close_pos]
+                    hash_ = message[close_pos + 1]
+                    cmd_text = (" ".join(message[0: close_pos + 2]) + "\n").encode(
+                        "utf-8"
+                    )
+
+                    if len(vote_msg) % 2 != 0:
+                        raise Exception("Invalid vote message")
+                    message = message[close_pos + 2:]
+
+                    # Process vote message
+                    votes = []
+                    for i in range(0, len(vote_msg), 2):
+                        votes.append((vote_msg[i], int(vote_msg[i + 1])))
+
+                    if not self.__exec(
+                            CommunicationProtocol.VOTE_TRAIN_SET,
+                            hash_,
+                            cmd_text,
+                            node,
+                            dict(votes),
+                    ):
                         error = True
                         break
 
-                # Metrics
-                elif message[0] == CommunicationProtocol.METRICS:
-                    if len(message) > 5:
-                        try:
-                            hash_ = message[5]
-                            cmd_text = (" ".join(message[0:6]) + "\n").encode("utf-8")
-                            if self.__exec(
-                                    CommunicationProtocol.METRICS,
-                                    hash_,
-                                    cmd_text,
-                                    message[1],
-                                    int(message[2]),
-                                    float(message[3]),
-                                    float(message[4]),
-                            ):
-                                message = message[6:]
-                            else:
-                                error = True
-                                break
-                        except Exception as e:
-                            error = True
-                            break
-                    else:
+                except Exception as e:
+                    logging.exception(e)
+                    error = True
+                    break
+
+            # Models Aggregated
+            elif message[0] == CommunicationProtocol.MODELS_AGGREGATED:
+                try:
+                    # Divide messages and check length of message
+                    close_pos = message.index(
+                        CommunicationProtocol.MODELS_AGGREGATED_CLOSE
+                    )
+                    content = message[1:close_pos]
+                    message = message[close_pos + 1:]
+
+                    # Get Nodes
+                    nodes = []
+                    for n in content:
+                        nodes.append(n)
+                    logging.info("[COMM_PROTOCOL.MODELS_AGGREGATED] Received models_aggregated message with {}".format(nodes))
+                    # Exec
+                    if not self.__exec(
+                            CommunicationProtocol.MODELS_AGGREGATED, None, None, nodes
+                    ):
                         error = True
                         break
 
-                # Vote train set
-                elif message[0] == CommunicationProtocol.VOTE_TRAIN_SET:
-                    try:
-                        # Divide messages and check length of message
-                        close_pos = message.index(
-                            CommunicationProtocol.VOTE_TRAIN_SET_CLOSE
-                        )
-                        node = message[1]
-                        vote_msg = message[2:close_pos]
-                        hash_ = message[close_pos + 1]
-                        cmd_text = (" ".join(message[0: close_pos + 2]) + "\n").encode(
-                            "utf-8"
-                        )
-
-                        if len(vote_msg) % 2 != 0:
-                            raise Exception("Invalid vote message")
-                        message = message[close_pos + 2:]
-
-                        # Process vote message
-                        votes = []
-                        for i in range(0, len(vote_msg), 2):
-                            votes.append((vote_msg[i], int(vote_msg[i + 1])))
-
-                        if not self.__exec(
-                                CommunicationProtocol.VOTE_TRAIN_SET,
-                                hash_,
-                                cmd_text,
-                                node,
-                                dict(votes),
-                        ):
-                            error = True
-                            break
+                except Exception as e:
+                    logging.exception(e)
+                    error = True
+                    break
 
-                    except Exception as e:
-                        logging.exception(e)
-                        error = True
-                        break
+            # Model Initialized
+            elif message[0] == CommunicationProtocol.MODEL_INITIALIZED:
+                if self.__exec(CommunicationProtocol.MODEL_INITIALIZED, None, None):
+                    message = message[1:]
+                else:
+                    error = True
+                    break
 
-                # Models Aggregated
-                elif message[0] == CommunicationProtocol.MODELS_AGGREGATED:
+            # Compression
+            elif message[0] == CommunicationProtocol.COMPRESSION:
+                if len(message) > 3:
                     try:
-                        # Divide messages and check length of message
-                        close_pos = message.index(
-                            CommunicationProtocol.MODELS_AGGREGATED_CLOSE
-                        )
-                        content = message[1:close_pos]
-                        message = message[close_pos + 1:]
-
-                        # Get Nodes
-                        nodes = []
-                        for n in content:
-                            nodes.append(n)
-                        logging.info("[COMM_PROTOCOL.MODELS_AGGREGATED] Received models_aggregated message with {}".format(nodes))
-                        # Exec
-                        if not self.__exec(
-                                CommunicationProtocol.MODELS_AGGREGATED, None, None, nodes
+                        if self.__exec(
+                                CommunicationProtocol.COMPRESSION,
+                                None,
+                                None,
+                                message[1],
+                                message[2] == "1",
+                                float(message[3]),
                         ):
+                            message = message[4:]
+                        else:
                             error = True
                             break
-
                     except Exception as e:
-                        logging.exception(e)
                         error = True
                         break
+                else:
+                    error = True
+                    break
 
-                # Model Initialized
-                elif message[0] == CommunicationProtocol.MODEL_INITIALIZED:
-                    if self.__exec(CommunicationProtocol.MODEL_INITIALIZED, None, None):
-                        message = message[1:]
-                    else:
+            # Liveness digest
+            elif message[0] == CommunicationProtocol.LIVENESS:
+                try:
+                    # Divide messages and check length of message
+                    close_pos = message.index(
+                        CommunicationProtocol.LIVENESS_CLOSE
+                    )
+                    content = message[1:close_pos]
+                    message = message[close_pos + 1:]
+                    if len(content) % 3 != 0:
                         error = True
                         break
 
-                # Model Initialized
-                elif message[0] == CommunicationProtocol.TRANSFER_LEADERSHIP:
-                    if self.__exec(CommunicationProtocol.TRANSFER_LEADERSHIP, None, None):
-                        message = message[1:]
-                    else:
+                    # Get (node, version, role) entries
+                    entries = []
+                    for i in range(0, len(content), 3):
+                        entries.append((content[i], int(content[i + 1]), content[i + 2]))
+                    # Exec
+                    if not self.__exec(
+                            CommunicationProtocol.LIVENESS, None, None, entries
+                    ):
                         error = True
                         break
 
-                # Non Recognized message
+                except Exception as e:
+                    logging.exception(e)
+                    error = True
+                    break
+
+            # Model Initialized
+            elif message[0] == CommunicationProtocol.TRANSFER_LEADERSHIP:
+                if self.__exec(CommunicationProtocol.TRANSFER_LEADERSHIP, None, None):
+                    message = message[1:]
                 else:
                     error = True
                     break
 
-            # Return
-            return self.tmp_exec_msgs, error
+            # Non Recognized message
+            else:
+                error = True
+                break
+
+        # Return
+        return self.tmp_exec_msgs, error
+
+    def process_params(self, fragment, done):
+        """
+        Processes a fragment of a ``PARAMS`` message (binary) and executes the callback associated with it (from ``command_dict``).
+
+        Args:
+            fragment: The fragment of the serialized model.
+            done: True if it is the last fragment of the model.
+
+        Returns:
+            bool: True if there was an error.
+        """
+        self.tmp_exec_msgs = {}
+        return not self.__exec(CommunicationProtocol.PARAMS, None, None, fragment, done)
 
     # Exec callbacks
     def __exec(self, action, hash_, cmd_text, *args):
         try:
             # Check if you can be executed
-            if hash_ not in self.last_messages or hash_ is None:
+            # (the hash is saved before executing, so the same message received from another connection is not executed twice)
+            if hash_ is None or self.last_messages.add(hash_):
                 self.command_dict[action].execute(*args)
                 # Save to gossip
                 if hash_ is not None:
                     self.tmp_exec_msgs[hash_] = cmd_text
-                    self.add_processed_messages([hash_])
                 return True
             return True
         except Exception as e:
@@ -495,39 +590,59 @@ class CommunicationProtocol:
             return False
 
     @staticmethod
-    def check_collapse(msg):
+    def process_handshake(message):
         """
-        Static method that checks if in the message there is a collapse (a binary message (it should fill all the buffer) and a non-binary message before it).
-
-        Actually, collapses can only happen with ``PARAMS`` binary message.
+        Static method that parses an encryption handshake message (``HELLO``, ``SESSION_KEY`` or ``SESSION_RESUME``).
 
         Args:
-            msg: The message to check.
+            message: The message to parse.
 
         Returns:
-            Length of the collapse (number of bytes to the binary headear).
+            (header, args) or None if the message is not valid:
+                - HELLO: (public key, ticket or None, nonce)
+                - SESSION_KEY: (encrypted key, ticket or None)
+                - SESSION_RESUME: (nonce,)
         """
-        header = CommunicationProtocol.PARAMS.encode("utf-8")
-        header_pos = msg.find(header)
-        if header_pos != -1 and msg[0: len(header)] != header:
-            return header_pos
-
-        return 0
+        try:
+            message = message.decode("utf-8").split()
+            if message[0] == CommunicationProtocol.HELLO and len(message) == 4:
+                ticket = None if message[2] == "-" else message[2]
+                return message[0], (message[1].encode("utf-8"), ticket, base64.b64decode(message[3]))
+            elif message[0] == CommunicationProtocol.SESSION_KEY and len(message) == 3:
+                ticket = None if message[2] == "-" else message[2]
+                return message[0], (message[1].encode("utf-8"), ticket)
+            elif message[0] == CommunicationProtocol.SESSION_RESUME and len(message) == 2:
+                return message[0], (base64.b64decode(message[1]),)
+        except Exception as e:
+            pass
+        return None
 
     @staticmethod
-    def check_params_incomplete(msg, block_size):
+    def build_frame_header(frame_type, length):
         """
-        Checks if a params message is incomplete. If the message is complete or is not a params message, it returns 0.
+        Build the header of a frame.
+
+        Args:
+            frame_type: The type of the frame (``FRAME_TEXT``, ``FRAME_PARAMS`` or ``FRAME_PARAMS_END``).
+            length: The length of the payload (in bytes).
 
         Returns:
-            Number of bytes that needs to be complete
+            The encoded header.
         """
-        header = CommunicationProtocol.PARAMS.encode("utf-8")
-        if msg[0: len(header)] == header:
-            if len(msg) < block_size:
-                return block_size - len(msg)
+        return CommunicationProtocol.FRAME_HEADER.pack(CommunicationProtocol.WIRE_VERSION, frame_type, length)
 
-        return 0
+    @staticmethod
+    def parse_frame_header(header):
+        """
+        Parse the header of a frame.
+
+        Args:
+            header: The encoded header (``FRAME_HEADER.size`` bytes).
+
+        Returns:
+            tuple: (version, frame_type, length)
+        """
+        return CommunicationProtocol.FRAME_HEADER.unpack(header)
 
     #######################################
     #     MSG BUILDERS (Static Methods)   #
@@ -698,6 +813,26 @@ class CommunicationProtocol:
                 + "\n"
         ).encode("utf-8")
 
+    @staticmethod
+    def build_liveness_msg(entries):
+        """
+        Args:
+            entries: List of (node, version, role) of the liveness table.
+
+        Returns:
+            An encoded liveness digest message.
+        """
+        aux = ""
+        for node, version, role in entries:
+            aux = aux + " " + node + " " + str(version) + " " + role
+        return (
+                CommunicationProtocol.LIVENESS
+                + aux
+                + " "
+                + CommunicationProtocol.LIVENESS_CLOSE
+                + "\n"
+        ).encode("utf-8")
+
     @staticmethod
     def build_model_initialized_msg():
         """
@@ -706,6 +841,28 @@ class CommunicationProtocol:
         """
         return (CommunicationProtocol.MODEL_INITIALIZED + "\n").encode("utf-8")
 
+    @staticmethod
+    def build_compression_msg(quantization, delta, topk):
+        """
+        Args:
+            quantization: The quantization of the models (none, fp16, bf16 or int8).
+            delta: Whether to send the models as differences.
+            topk: Ratio of the elements of the differences that are sent (0 to send all of them).
+
+        Returns:
+            An encoded compression message.
+        """
+        return (
+                CommunicationProtocol.COMPRESSION
+                + " "
+                + quantization
+                + " "
+                + ("1" if delta else "0")
+                + " "
+                + str(topk)
+                + "\n"
+        ).encode("utf-8")
+
     @staticmethod
     def build_connect_msg(ip, port, broadcast, force):
         """
@@ -734,37 +891,88 @@ class CommunicationProtocol:
                 + "\n"
         ).encode("utf-8")
 
+    @staticmethod
+    def build_hello_msg(public_key, ticket, nonce):
+        """
+        Build the encryption handshake message of the node that starts the connection.
+
+        Args:
+            public_key: The RSA public key of the node (base64).
+            ticket: The session ticket issued by the other node (None if there is no ticket).
+            nonce: Random nonce (used if the session is resumed).
+
+        Returns:
+            An encoded hello message.
+        """
+        return (
+                CommunicationProtocol.HELLO
+                + " "
+                + public_key.decode("utf-8")
+                + " "
+                + (ticket if ticket is not None else "-")
+                + " "
+                + base64.b64encode(nonce).decode("utf-8")
+                + "\n"
+        ).encode("utf-8")
+
+    @staticmethod
+    def build_session_key_msg(encrypted_key, ticket):
+        """
+        Args:
+            encrypted_key: The key of the session and the secret of the ticket, encrypted with the RSA public key of the other node (base64).
+            ticket: The new session ticket (None if tickets are disabled).
+
+        Returns:
+            An encoded session key message.
+        """
+        return (
+                CommunicationProtocol.SESSION_KEY
+                + " "
+                + encrypted_key.decode("utf-8")
+                + " "
+                + (ticket if ticket is not None else "-")
+                + "\n"
+        ).encode("utf-8")
+
+    @staticmethod
+    def build_session_resume_msg(nonce):
+        """
+        Args:
+            nonce: Random nonce (the key of the session is derived from the secret of the ticket and both nonces).
+
+        Returns:
+            An encoded session resume message.
+        """
+        return (
+                CommunicationProtocol.SESSION_RESUME + " " + base64.b64encode(nonce).decode("utf-8") + "\n"
+        ).encode("utf-8")
+
     @staticmethod
     def build_params_msg(data, block_size):
         """
         Build model serialized messages.
         Not Hashed. Special case of message (binary message).
 
+        Fragments are views of ``data`` (no copies). The frame header is added when the fragment is sent.
+
         Args:
-            block_size:
             data: The model parameters to send (encoded).
+            block_size: Maximum size of each fragment (at most ``MAX_FRAME_LENGTH``).
 
         Returns:
-            A list of fragments messages of the params.
+            A list of (frame_type, fragment) tuples of the params.
         """
-        # Encoding Headers and ending
-        header = CommunicationProtocol.PARAMS.encode("utf-8")
-        end = CommunicationProtocol.PARAMS_CLOSE.encode("utf-8")
-
-        # Spliting data
-        size = block_size - len(header)
+        data = memoryview(data)
+        block_size = min(block_size, CommunicationProtocol.MAX_FRAME_LENGTH)
         data_msgs = []
-        for i in range(0, len(data), size):
-            data_msgs.append(header + (data[i: i + size]))
-
-        # Adding closing message
-        if len(data_msgs[-1]) + len(end) <= block_size:
-            data_msgs[-1] += end
-            data_msgs[-1] += b"\0" * (
-                    block_size - len(data_msgs[-1])
-            )  # padding to avoid message fragmentation
+        for i in range(0, len(data), block_size):
+            data_msgs.append((CommunicationProtocol.FRAME_PARAMS, data[i: i + block_size]))
+
+        # The last fragment closes the message
+        if len(data_msgs) > 0:
+            data_msgs[-1] = (CommunicationProtocol.FRAME_PARAMS_END, data_msgs[-1][1])
         else:
-            data_msgs.append(header + end)
+            data_msgs.append((CommunicationProtocol.FRAME_PARAMS_END, data))
 
         return data_msgs
 
@@ -80,6 +80,7 @@ class Controller:
         self.statistics_port = args.statsport if hasattr(args, "statsport") else 5100
         self.simulation = args.simulation
         self.docker = args.docker if hasattr(args, 'docker') else None
+        self.inprocess = args.inprocess if hasattr(args, 'inprocess') else None
         self.config_dir = args.config
         self.log_dir = args.logs
         self.env_path = args.env
@@ -304,6 +305,8 @@ class Controller:
         if self.simulation:
             if self.docker:
                 self.start_nodes_docker(idx_start_node)
+            elif self.inprocess:
+                self.start_nodes_inprocess()
             else:
                 self.start_nodes_cmd(idx_start_node)
         else:
@@ -484,6 +487,15 @@ class Controller:
         logging.info("Starting node {} with configuration {}".format(idx_start_node, self.config.participants[idx_start_node]))
         self.start_node(idx_start_node)
 
+    def start_nodes_inprocess(self):
+        # Start all the nodes in a single process (loopback transport, datasets loaded once)
+        logging.info("Starting {} nodes in a single process".format(self.n_nodes))
+        command = f'{self.python_path} -u {os.path.dirname(os.path.realpath(__file__))}/simulation_start.py {" ".join([str(path) for path in self.config.participants_path])}'
+        if sys.platform == "win32":
+            os.system("""start cmd /k "{}" """.format(command))
+        else:
+            os.system(command + " 2>&1 &")
+
     @classmethod
     def remove_files_by_scenario(cls, scenario_name):
         import shutil
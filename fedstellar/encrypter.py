@@ -17,6 +17,10 @@
 
 
 import base64
+import hashlib
+import hmac
+import threading
+import time
 
 from Crypto import Random
 from Crypto.Cipher import AES
@@ -48,6 +52,8 @@ class Encrypter:
 class RSACipher(Encrypter):
     """
     Class with methods to encrypt and decrypt messages using RSA asymetric encryption.
+
+    Generating the key is slow, so a node generates it once (identity key) and uses it in all its handshakes.
     """
 
     def __init__(self):
@@ -56,17 +62,19 @@ class RSACipher(Encrypter):
         self.__public_key = self.__private_key.publickey()
         self.__pair_public_key = None
 
-    def encrypt(self, message):
+    def encrypt(self, message, pair_key=None):
         """
         Encrypts a message using RSA. Message is encrypted using the public key of the pair (the other node key).
 
         Args:
             message: (bytes) The message to encrypt.
+            pair_key: The public key of the pair encoded at base64 (if None, the loaded one is used).
 
         Returns:
             message: (bytes) The encrypted message.
         """
-        cipher = PKCS1_OAEP.new(self.__pair_public_key)
+        key = self.__pair_public_key if pair_key is None else RSA.importKey(base64.b64decode(pair_key))
+        cipher = PKCS1_OAEP.new(key)
         return base64.b64encode(cipher.encrypt(message))
 
     def decrypt(self, message):
@@ -101,75 +109,186 @@ class RSACipher(Encrypter):
         return base64.b64encode(self.__public_key.exportKey("DER"))
 
 
-##############################
-#    Symmetric Encryption    #
-##############################
+#########################
+#    Session Tickets    #
+#########################
 
 
-class AESCipher(Encrypter):
+class SessionTickets:
+    """
+    Session tickets, used to resume encrypted sessions without the RSA exchange.
+
+    The node that accepts a connection issues a ticket (the identifier of a random secret) and the node that started it stores the ticket
+    with the address of the other node. When it connects again, it sends the ticket, and both nodes derive the key of the new session
+    from the secret and two fresh nonces (a key is never used in two sessions).
+
+    Args:
+        ttl: Seconds a ticket is valid (0 to disable the tickets).
+    """
+
     """
-    Class with methods to encrypt and decrypt messages using AES symetric encryption.
+    Length of the secret of a ticket (in bytes).
     """
+    SECRET_LEN = 32
 
-    def __init__(self, key=None):
-        self.bs = AES.block_size
-        self.key = key
-        if key is None:
-            self.key = get_random_bytes(16)  # 256 bits
-        self.cipher = AES.new(self.key, AES.MODE_ECB)
+    def __init__(self, ttl):
+        self.__ttl = ttl
+        self.__issued = {}
+        self.__received = {}
+        self.__lock = threading.Lock()
 
-    def encrypt(self, message):
+    def issue(self):
         """
-        Encrypts a message using AES. Message is encrypted using the shared key.
-        Keep in mind that AES uses a block cipher, so the message sould be filled with padding.
+        Issue a ticket (node that accepts the connection).
 
+        Returns:
+            (ticket, secret) or (None, None) if the tickets are disabled.
+        """
+        if self.__ttl <= 0:
+            return None, None
+        ticket = base64.b64encode(get_random_bytes(16)).decode("utf-8")
+        secret = get_random_bytes(SessionTickets.SECRET_LEN)
+        now = time.time()
+        self.__lock.acquire()
+        # Remove the expired tickets
+        self.__issued = {t: v for t, v in self.__issued.items() if v[1] > now}
+        self.__issued[ticket] = (secret, now + self.__ttl)
+        self.__lock.release()
+        return ticket, secret
+
+    def get_secret(self, ticket):
+        """
         Args:
-            message: (str) The message to encrypt.
+            ticket: A ticket issued by the node.
 
         Returns:
-            message: (str) The encrypted message.
+            The secret of the ticket, or None if it is unknown or expired.
+        """
+        self.__lock.acquire()
+        entry = self.__issued.get(ticket)
+        self.__lock.release()
+        if entry is None or entry[1] <= time.time():
+            return None
+        return entry[0]
+
+    def store(self, addr, ticket, secret):
         """
-        return self.cipher.encrypt(message)
+        Store a ticket received from a node (node that started the connection).
 
-    def decrypt(self, message):
+        Args:
+            addr: (host, port) of the node that issued the ticket.
+            ticket: The ticket.
+            secret: The secret of the ticket.
         """
-        Decrypts a message using AES. Message is decripted using the shared key.
-        Keep in mind that AES uses a block cipher, so the message can be a filled message with padding.
+        if self.__ttl <= 0 or ticket is None:
+            return
+        self.__lock.acquire()
+        self.__received[addr] = (ticket, secret, time.time() + self.__ttl)
+        self.__lock.release()
 
+    def get_ticket(self, addr):
+        """
         Args:
-            message: (bytes) The message to decrypt.
+            addr: (host, port) of the node.
 
         Returns:
-            message: (bytes) The decrypted message.
+            (ticket, secret) received from the node, or (None, None) if there is no valid ticket.
+        """
+        self.__lock.acquire()
+        entry = self.__received.get(addr)
+        if entry is not None and entry[2] <= time.time():
+            self.__received.pop(addr)
+            entry = None
+        self.__lock.release()
+        if entry is None:
+            return None, None
+        return entry[0], entry[1]
+
+    @staticmethod
+    def derive_key(secret, client_nonce, server_nonce):
         """
-        return self.cipher.decrypt(message)
+        Derive the key of a resumed session (HMAC-SHA256 of the nonces).
 
-    def add_padding(self, msg):
+        Returns:
+            The key of the session.
         """
-        Add padding to an encoded UTF-8 text. Adds " " charactets (1 byte) to fill the rest with the block.
-        Careful: in this case, the filling content doesn't affect to the meaning of messages.
+        return hmac.new(secret, client_nonce + server_nonce, hashlib.sha256).digest()[:AESCipher.key_len()]
+
+
+##############################
+#    Symmetric Encryption    #
+##############################
+
+
+class AESCipher(Encrypter):
+    """
+    Class with methods to encrypt and decrypt frames using AES-GCM (authenticated encryption, no padding).
+
+    Each frame is encrypted with a new nonce: a direction prefix (the node that started the connection uses a different one) and a counter.
+    Frames are decrypted in the same order they were encrypted, so both sides know the nonce without sending it.
+    The header of the frame is authenticated (associated data) and the ciphertext is followed by a ``TAG_SIZE`` bytes tag.
+
+    Args:
+        key: The shared key (a new one is generated if None).
+        initiator: True if the node started the connection.
+    """
+
+    """
+    Length of the authentication tag (in bytes).
+    """
+    TAG_SIZE = 16
+
+    def __init__(self, key=None, initiator=False):
+        self.key = key
+        if key is None:
+            self.key = get_random_bytes(AESCipher.key_len())
+        self.__send_prefix = b"\x00\x00\x00\x01" if initiator else b"\x00\x00\x00\x00"
+        self.__recv_prefix = b"\x00\x00\x00\x00" if initiator else b"\x00\x00\x00\x01"
+        self.__send_counter = 0
+        self.__recv_counter = 0
+
+    def encrypt(self, message, header=b""):
+        """
+        Encrypts a frame using AES-GCM. Frames have to be sent in the same order they are encrypted.
 
         Args:
-            msg: (bytes) The encoded text.
+            message: (bytes) The payload of the frame.
+            header: (bytes) The header of the frame (authenticated, not encrypted).
 
         Returns:
-            msg: (bytes) The encoded text with padding.
+            (ciphertext, tag) The encrypted payload and the authentication tag.
         """
-        # Calculate the number of bytes needed to fill the block
-        bytes_left = self.bs - len(msg) % self.bs
-        if bytes_left == self.bs:
-            bytes_left = 0
+        nonce = self.__send_prefix + self.__send_counter.to_bytes(8, "big")
+        self.__send_counter += 1
+        cipher = AES.new(self.key, AES.MODE_GCM, nonce=nonce, mac_len=AESCipher.TAG_SIZE)
+        cipher.update(header)
+        return cipher.encrypt_and_digest(message)
 
-        # Add padding
-        pading_char = " ".encode("utf-8")
-        for i in range(bytes_left):
-            msg += pading_char
+    def decrypt(self, message, tag, header=b"", output=None):
+        """
+        Decrypts a frame using AES-GCM and verifies it. Frames have to be decrypted in the same order they are received.
+
+        Args:
+            message: (bytes) The encrypted payload.
+            tag: (bytes) The authentication tag.
+            header: (bytes) The header of the frame.
+            output: (bytearray or memoryview) Buffer where the payload is decrypted (it can be ``message``). If None, a new one is returned.
 
-        return msg
+        Returns:
+            message: (bytes) The payload (or None if ``output`` is used).
+
+        Raises:
+            ValueError: If the frame is not authentic.
+        """
+        nonce = self.__recv_prefix + self.__recv_counter.to_bytes(8, "big")
+        self.__recv_counter += 1
+        cipher = AES.new(self.key, AES.MODE_GCM, nonce=nonce, mac_len=AESCipher.TAG_SIZE)
+        cipher.update(header)
+        return cipher.decrypt_and_verify(message, tag, output=output)
 
     def get_key(self):
         """
-        Get the shared RSA key.
+        Get the shared key.
 
         Returns:
             key: The shared key.
@@ -190,4 +309,4 @@ class AESCipher(Encrypter):
         Returns:
             key_len: (int) The length of the key in bytes.
         """
-        return 256
+        return 16
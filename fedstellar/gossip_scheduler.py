@@ -0,0 +1,176 @@
+#
+# This file is part of the fedstellar framework (see https://github.com/enriquetomasmb/fedstellar).
+# Copyright (c) 2022 Enrique Tomás Martínez Beltrán.
+#
+
+
+"""
+Module that implements the schedulers of the model gossip (which neighbors a model is sent to, and when).
+"""
+import random
+import time
+import weakref
+
+from fedstellar.config.config import Config
+
+
+#########################
+#    GossipScheduler    #
+#########################
+
+
+class GossipScheduler:
+    """
+    Scheduler of the model gossip (``GOSSIP_MODELS_SCHEDULER = "random"``). Every ``1 / GOSSIP_MODELS_FREC`` seconds,
+    the model is sent to ``GOSSIP_MODELS_PER_ROUND`` neighbors that need it, selected at random.
+
+    Args:
+        config: The configuration of the node.
+    """
+
+    def __init__(self, config: Config):
+        self.config = config
+
+    @staticmethod
+    def create(config: Config):
+        """
+        Create the scheduler set in the configuration (``GOSSIP_MODELS_SCHEDULER``).
+
+        Args:
+            config: The configuration of the node.
+
+        Returns:
+            GossipScheduler: The scheduler.
+        """
+        if config.participant["GOSSIP_MODELS_SCHEDULER"] == "adaptive":
+            return AdaptiveGossipScheduler(config)
+        return GossipScheduler(config)
+
+    def select(self, candidates, missing_function):
+        """
+        Select the neighbors that the model is sent to in an iteration of the gossip.
+
+        Args:
+            candidates: The neighbors that need the model.
+            missing_function: Function that returns the number of contributors (models) a neighbor is missing.
+
+        Returns:
+            list: The selected neighbors (at most ``GOSSIP_MODELS_PER_ROUND``).
+        """
+        samples = min(self.config.participant["GOSSIP_MODELS_PER_ROUND"], len(candidates))
+        return random.sample(candidates, samples)
+
+    def sent(self, nc, missing):
+        """
+        Notify that a model was sent (queued) to a neighbor.
+
+        Args:
+            nc: The neighbor.
+            missing: Number of contributors the neighbor was missing.
+        """
+        pass
+
+    def is_event_driven(self):
+        """
+        Returns:
+            True if an iteration starts as soon as a neighbor reports its status (instead of at the next period).
+        """
+        return False
+
+
+#################################
+#    AdaptiveGossipScheduler    #
+#################################
+
+
+class AdaptiveGossipScheduler(GossipScheduler):
+    """
+    Scheduler of the model gossip (``GOSSIP_MODELS_SCHEDULER = "adaptive"``) that uses the status of the neighbors and the statistics of the links:
+        - Neighbors that miss more contributors go first. Ties are broken by the expected delivery time of the link
+          (size of the last model / throughput + RTT), unknown links go first.
+        - Neighbors that are receiving a model are skipped: it is queued, or it was sent and the neighbor has not reported progress yet
+          (during ``RTT_BACKOFF`` times the RTT of the link, or a gossip period if it is not known).
+        - An iteration starts as soon as a neighbor reports its status (e.g. ``MODELS_AGGREGATED``), there is no need to wait for the next period.
+
+    The RTT of a link is the time since a model is sent until the neighbor reports that it misses fewer contributors.
+    """
+
+    """
+    Times the RTT of a link that a neighbor is skipped after sending it a model (if it does not report progress before).
+    """
+    RTT_BACKOFF = 2
+    """
+    Weight of the last sample of the RTT (exponential moving average).
+    """
+    RTT_SMOOTHING = 0.3
+
+    def __init__(self, config: Config):
+        GossipScheduler.__init__(self, config)
+        # Neighbor -> contributors missed when the last model was sent (until it reports progress)
+        self.__sent = weakref.WeakKeyDictionary()
+        # Neighbor -> RTT of the link
+        self.__rtt = weakref.WeakKeyDictionary()
+
+    def select(self, candidates, missing_function):
+        """
+        Select the neighbors that the model is sent to in an iteration of the gossip.
+
+        Args:
+            candidates: The neighbors that need the model.
+            missing_function: Function that returns the number of contributors (models) a neighbor is missing.
+
+        Returns:
+            list: The selected neighbors (at most ``GOSSIP_MODELS_PER_ROUND``), by priority.
+        """
+        now = time.monotonic()
+        ready = [nc for nc in candidates if not self.__is_receiving(nc, missing_function(nc), now)]
+        random.shuffle(ready)  # ties are broken at random (sort is stable)
+        ready.sort(key=lambda nc: (-missing_function(nc), self.__delivery_time(nc)))
+        return ready[:self.config.participant["GOSSIP_MODELS_PER_ROUND"]]
+
+    def sent(self, nc, missing):
+        """
+        Notify that a model was sent (queued) to a neighbor.
+
+        Args:
+            nc: The neighbor.
+            missing: Number of contributors the neighbor was missing.
+        """
+        self.__sent[nc] = missing
+
+    def is_event_driven(self):
+        """
+        Returns:
+            True, an iteration starts as soon as a neighbor reports its status.
+        """
+        return True
+
+    def __is_receiving(self, nc, missing, now):
+        if nc.get_pending_models() > 0:
+            return True
+        sent_missing = self.__sent.get(nc)
+        if sent_missing is None:
+            return False
+        _, _, sent_time = nc.get_link_stats()
+        if sent_time is None:
+            return True
+        # The neighbor reported progress, the model was received
+        if missing < sent_missing:
+            del self.__sent[nc]
+            rtt = now - sent_time
+            self.__rtt[nc] = rtt if nc not in self.__rtt else self.__rtt[nc] + AdaptiveGossipScheduler.RTT_SMOOTHING * (rtt - self.__rtt[nc])
+            return False
+        # Back off until the model is expected to be received
+        rtt = self.__rtt.get(nc)
+        backoff = rtt * AdaptiveGossipScheduler.RTT_BACKOFF if rtt is not None else 1 / self.config.participant["GOSSIP_MODELS_FREC"]
+        if now - sent_time < backoff:
+            return True
+        del self.__sent[nc]
+        return False
+
+    def __delivery_time(self, nc):
+        throughput, size, _ = nc.get_link_stats()
+        delivery_time = self.__rtt.get(nc, 0)
+        if throughput is not None:
+            delivery_time += size / throughput
+        return delivery_time
@@ -15,10 +15,14 @@
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 #
 
+import asyncio
+import heapq
 import logging
+import random
 import threading
 import time
 
+from fedstellar.communication_protocol import CommunicationProtocol
 from fedstellar.config.config import Config
 from fedstellar.utils.observer import Events, Observable
 
@@ -30,89 +34,152 @@ from fedstellar.utils.observer import Events, Observable
 
 class Gossiper(threading.Thread, Observable):
     """
-    Thread based gossiper. It gossips messages from list of pending messages. ``GOSSIP_MESSAGES_PER_ROUND`` are sended per iteration (``GOSSIP_FREC`` times per second).
+    Thread based gossiper. It gossips messages from a queue of pending messages. Up to ``GOSSIP_MESSAGES_PER_ROUND`` messages are sent
+    per iteration (``GOSSIP_MESSAGES_FREC`` times per second).
+
+    Pending messages are identified by their hash and stored in a priority queue (learning control messages go before ROLE, METRICS and BEAT,
+    FIFO otherwise). Every message keeps the bitset of the neighbors that already have it (ids of ``NeighborRegistry``), so an iteration only
+    visits the messages at the head of the queue. A message leaves the queue when every neighbor has it, when it was sent to
+    ``GOSSIP_MESSAGES_FANOUT`` neighbors (0 = no limit) or when it is older than ``GOSSIP_MESSAGES_TTL`` seconds.
 
     Communicates with node via observer pattern.
 
     Args:
         nodo_padre (str): Name of the parent node.
-        neighbors (list): List of neighbors.
+        neighbors (NeighborRegistry): Neighbors of the node.
 
     """
 
+    """
+    Priority of the gossiped messages (lower goes first). Messages with other headers have the lowest priority.
+    """
+    PRIORITIES = {
+        CommunicationProtocol.START_LEARNING.encode("utf-8"): 0,
+        CommunicationProtocol.STOP_LEARNING.encode("utf-8"): 0,
+        CommunicationProtocol.VOTE_TRAIN_SET.encode("utf-8"): 0,
+        CommunicationProtocol.ROLE.encode("utf-8"): 1,
+        CommunicationProtocol.METRICS.encode("utf-8"): 1,
+        CommunicationProtocol.BEAT.encode("utf-8"): 2,
+    }
+
     def __init__(self, node_name, neighbors, config: Config):
         Observable.__init__(self)
         threading.Thread.__init__(self, name=("gossiper-" + node_name))
         self.node_name = node_name
-        self.__neighbors = neighbors  # list as reference of the original neighbors list
+        self.__neighbors = neighbors  # registry of the neighbors of the node (only read)
         self.config = config
+        # Pending messages by hash: [message, bitset of the neighbors that have it, sends left (None = no limit), expiration time]
         self.__msgs = {}
+        # Priority queue of the hashes: (priority, sequence, hash)
+        self.__queue = []
+        self.__sequence = 0
         self.__add_lock = threading.Lock()
+        self.__pending = threading.Event()
         self.__terminate_flag = threading.Event()
 
     def add_messages(self, msgs, node):
         """
-        Add messages to the list of pending messages.
+        Add messages to the queue of pending messages.
 
         Args:
-            msgs (list): List of messages to add.
-            node (Node): Node that sent the messages.
+            msgs (dict): Messages to add (hash -> message).
+            node (NodeConnection): Neighbor that sent the messages (it is not sent them back).
         """
+        node_id = self.__neighbors.get_id(node)
+        node_bit = 0 if node_id is None else 1 << node_id
+        fanout = self.config.participant["GOSSIP_MESSAGES_FANOUT"]
+        expiration = time.monotonic() + self.config.participant["GOSSIP_MESSAGES_TTL"]
         self.__add_lock.acquire()
-        for msg in msgs:
-            self.__msgs[msg] = [node]
+        for hash_, msg in msgs.items():
+            entry = self.__msgs.get(hash_)
+            if entry is not None:
+                entry[1] |= node_bit
+                continue
+            self.__msgs[hash_] = [msg, node_bit, fanout if fanout > 0 else None, expiration]
+            priority = Gossiper.PRIORITIES.get(msg.split(b" ", 1)[0], len(Gossiper.PRIORITIES))
+            heapq.heappush(self.__queue, (priority, self.__sequence, hash_))
+            self.__sequence += 1
+        self.__pending.set()
         self.__add_lock.release()
 
     def run(self):
         """
-        Gossiper Main Loop. Sends `GOSSIP_MODEL_SENDS_BY_ROUND` messages ``GOSSIP_FREC`` times per second.
+        Gossiper Main Loop. Sends up to ``GOSSIP_MESSAGES_PER_ROUND`` messages ``GOSSIP_MESSAGES_FREC`` times per second.
+        While there are no pending messages, it waits for them.
         """
         while not self.__terminate_flag.is_set():
-
-            messages_left = self.config.participant["GOSSIP_MESSAGES_PER_ROUND"]
-
-            # Lock
-            self.__add_lock.acquire()
-            begin = time.time()
-
-            # Send to all the nodes except the ones that the message was already sent to
-            if len(self.__msgs) > 0:
-                msg_list = list(self.__msgs.items()).copy()
-                logging.debug("[GOSSIPER] Message list: {}".format(msg_list))
-                nei = set(self.__neighbors.copy())  # copy to avoid concurrent problems
-
-                for msg, nodes in msg_list:
-                    nodes = set(nodes)
-                    sended = len(nei - nodes)
-
-                    if messages_left - sended >= 0:
-                        logging.debug("[GOSSIPER] Send msg: {} --> to {}".format(msg, list(nodes)))
-                        self.notify(Events.GOSSIP_BROADCAST_EVENT, (msg, list(nodes)))
-                        del self.__msgs[msg]
-                        messages_left = messages_left - sended
-                        if messages_left == 0:
-                            break
-                    else:
-                        # Lists to concatenate / Sets to difference
-                        excluded = (list(nei - nodes))[: abs(messages_left - sended)]
-                        logging.debug("[GOSSIPER] Send msg: {} --> to {} | Excluded: {}".format(msg, list(nodes) + excluded, excluded))
-                        self.notify(
-                            Events.GOSSIP_BROADCAST_EVENT, (msg, list(nodes) + excluded)
-                        )
-                        self.__msgs[msg] = list(nodes) + list(nei - set(excluded))
-                        break
-
-            # Unlock
-            self.__add_lock.release()
-
-            # Wait to guarantee the frequency of gossipping
-            time_diff = time.time() - begin
-            time_sleep = 1 / self.config.participant["GOSSIP_MESSAGES_FREC"] - time_diff
+            time_sleep = self.gossip()
             if time_sleep > 0:
                 time.sleep(time_sleep)
+            self.__pending.wait()
+
+    async def run_async(self):
+        """
+        Coroutine version of ``run`` (used by the asyncio transport instead of starting the thread).
+        """
+        while not self.__terminate_flag.is_set():
+            time_sleep = self.gossip()
+            await asyncio.sleep(max(time_sleep, 0))
+
+    def gossip(self):
+        """
+        Gossip iteration. Sends up to ``GOSSIP_MESSAGES_PER_ROUND`` messages, starting from the head of the queue.
+
+        Returns:
+            float: Time to wait until the next iteration (to guarantee the frequency of gossipping).
+        """
+        begin = time.monotonic()
+        messages_left = self.config.participant["GOSSIP_MESSAGES_PER_ROUND"]
+        by_id, neighbors_mask = self.__neighbors.snapshot_ids()  # snapshot, not modified by other threads
+        sends = []
+
+        # Lock
+        self.__add_lock.acquire()
+        while self.__queue and messages_left > 0:
+            hash_ = self.__queue[0][2]
+            entry = self.__msgs[hash_]
+            msg, served, sends_left, expiration = entry
+            missing = neighbors_mask & ~served
+            if missing and expiration > begin:
+                # Ids of the neighbors that do not have the message
+                ids = []
+                while missing:
+                    bit = missing & -missing
+                    ids.append(bit.bit_length() - 1)
+                    missing ^= bit
+                limit = messages_left if sends_left is None else min(messages_left, sends_left)
+                if len(ids) > limit:
+                    ids = random.sample(ids, limit)
+                for id_ in ids:
+                    served |= 1 << id_
+                entry[1] = served
+                if sends_left is not None:
+                    sends_left -= len(ids)
+                    entry[2] = sends_left
+                messages_left -= len(ids)
+                sends.append((msg, [by_id[id_] for id_ in ids]))
+                # The message stays at the head of the queue if the budget of the iteration ran out
+                if neighbors_mask & ~served and sends_left != 0 and messages_left == 0:
+                    break
+            # Every neighbor has the message, its fan-out is exhausted or it expired
+            heapq.heappop(self.__queue)
+            del self.__msgs[hash_]
+        if not self.__queue:
+            self.__pending.clear()
+        # Unlock
+        self.__add_lock.release()
+
+        for msg, nodes in sends:
+            logging.debug("[GOSSIPER] Send msg: {} --> to {}".format(msg, nodes))
+            self.notify(Events.GOSSIP_SEND_EVENT, (msg, nodes))
+
+        # Wait to guarantee the frequency of gossipping
+        time_diff = time.monotonic() - begin
+        return 1 / self.config.participant["GOSSIP_MESSAGES_FREC"] - time_diff
 
     def stop(self):
         """
         Stop the gossiper.
         """
         self.__terminate_flag.set()
+        self.__pending.set()
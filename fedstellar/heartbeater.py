@@ -16,10 +16,13 @@
 #
 
 
+import asyncio
 import logging
 import threading
 import time
+import weakref
 
+from fedstellar.communication_protocol import CommunicationProtocol
 from fedstellar.config.config import Config
 from fedstellar.utils.observer import Events, Observable
 
@@ -36,6 +39,13 @@ class Heartbeater(threading.Thread, Observable):
     It also maintains a list of active neighbors, which is created by receiving different heartbear messages.
     Neighbors from which a heartbeat is not received in ``NODE_TIMEOUT`` will be eliminated
 
+    With ``HEARTBEAT_MODE = "digest"``, BEAT and ROLE messages are not gossiped. Instead:
+        - Any frame received from a neighbor counts as a heartbeat of the neighbor.
+        - Every node keeps a liveness table (version vector): node -> (version, role). The node increases its own version
+          every ``NODE_TIMEOUT / 3`` seconds, and a node is alive while its version keeps increasing.
+        - Each neighbor is sent a digest with the entries of the table that it does not have yet (``LIVENESS`` message), when there are any.
+          An empty digest is only sent (as a beat) if nothing was sent to the neighbor during the last ``HEARTBEAT_PERIOD``.
+
     Communicates with node via observer pattern.
 
     Args:
@@ -57,6 +67,14 @@ class Heartbeater(threading.Thread, Observable):
         self.__nodes = {}
         self.__nodes_role = {}
 
+        # Liveness table (digest mode): node -> version, own version and versions already sent to each neighbor
+        self.__digest = config.participant["HEARTBEAT_MODE"] == "digest"
+        self.__versions = {}
+        self.__version = 0
+        self.__version_time = None
+        self.__sent_versions = weakref.WeakKeyDictionary()
+        self.__versions_lock = threading.Lock()
+
     def run(self):
         """
         Send a beat every HEARTBEAT_PERIOD seconds to all the neighbors of the node.
@@ -64,41 +82,78 @@ class Heartbeater(threading.Thread, Observable):
         It happend ``HEARTBEATER_REFRESH_NEIGHBORS_BY_PERIOD`` per HEARTBEAT_PERIOD
         """
         while not self.__terminate_flag.is_set():
-            # We do not check if the message was sent
-            #   - If the model is sending, a beat is not necessary
-            #   - If the connection its down timeouts will destroy connections
-            self.notify(Events.SEND_BEAT_EVENT, None)
-            # self.get_nodes(print=True)
-            self.update_config_with_neighbors()
-            self.__count += 1
-            # Send role notify each 10 beats
-            if self.__count % 2 == 0:
-                self.notify(Events.SEND_ROLE_EVENT, None)
-                # Report my status to the controller
-                self.notify(Events.REPORT_STATUS_TO_CONTROLLER_EVENT, None)
+            self.beat()
 
             # Wait and refresh node list
             for _ in range(self.config.participant["HEARTBEATER_REFRESH_NEIGHBORS_BY_PERIOD"]):
                 self.clear_nodes()
+                self.send_digests()
                 time.sleep(
                     self.config.participant["HEARTBEAT_PERIOD"]
                     / self.config.participant["HEARTBEATER_REFRESH_NEIGHBORS_BY_PERIOD"]
                 )
 
+    async def run_async(self):
+        """
+        Coroutine version of ``run`` (used by the asyncio transport instead of starting the thread).
+        Beats are executed in the default executor because some observers of the beat events are blocking (e.g. reports to the controller).
+        """
+        loop = asyncio.get_running_loop()
+        while not self.__terminate_flag.is_set():
+            await loop.run_in_executor(None, self.beat)
+
+            # Wait and refresh node list
+            for _ in range(self.config.participant["HEARTBEATER_REFRESH_NEIGHBORS_BY_PERIOD"]):
+                self.clear_nodes()
+                self.send_digests()
+                await asyncio.sleep(
+                    self.config.participant["HEARTBEAT_PERIOD"]
+                    / self.config.participant["HEARTBEATER_REFRESH_NEIGHBORS_BY_PERIOD"]
+                )
+
+    def beat(self):
+        """
+        Send a beat to the neighbors (role and status are also sent every 2 beats).
+        In digest mode, the own version is increased if it is due and the role travels in the liveness digests.
+        """
+        # We do not check if the message was sent
+        #   - If the model is sending, a beat is not necessary
+        #   - If the connection its down timeouts will destroy connections
+        if self.__digest:
+            self.__increase_version()
+        else:
+            self.notify(Events.SEND_BEAT_EVENT, None)
+        # self.get_nodes(print=True)
+        self.update_config_with_neighbors()
+        self.__count += 1
+        # Send role notify each 10 beats
+        if self.__count % 2 == 0:
+            if not self.__digest:
+                self.notify(Events.SEND_ROLE_EVENT, None)
+            # Report my status to the controller
+            self.notify(Events.REPORT_STATUS_TO_CONTROLLER_EVENT, None)
+
     def clear_nodes(self):
         """
         Clear the list of neighbors.
         """
+        now = time.monotonic()
+        if self.__digest:
+            # Any frame received from a neighbor is a heartbeat
+            for nc in self.__neighbors.snapshot():
+                last_received = nc.get_last_received()
+                if last_received > self.__nodes.get(nc.get_name(), 0):
+                    self.__nodes[nc.get_name()] = last_received
         for n in [
             node
             for node, t in list(self.__nodes.items())
-            if time.time() - t > self.config.participant["NODE_TIMEOUT"]
+            if now - t > self.config.participant["NODE_TIMEOUT"]
         ]:
             logging.debug(
                 "[HEARTBEATER] Removed {} from the network ".format(n)
             )
             self.__nodes.pop(n)
-            self.__nodes_role.pop(n)
+            self.__nodes_role.pop(n, None)
 
     def add_node(self, node):
         """
@@ -108,7 +163,7 @@ class Heartbeater(threading.Thread, Observable):
             node (Node): Node to add to the list of neighbors.
         """
         if node != self.__node_name:
-            self.__nodes[node] = time.time()
+            self.__nodes[node] = time.monotonic()
 
     def add_node_role(self, node, role):
         """
@@ -121,6 +176,82 @@ class Heartbeater(threading.Thread, Observable):
         if node != self.__node_name:
             self.__nodes_role[node] = role
 
+    ####################################
+    #    Liveness Table (digest mode)   #
+    ####################################
+
+    def add_digest(self, nc, entries):
+        """
+        Merge a liveness digest received from a neighbor. Nodes whose version increased are alive.
+
+        Args:
+            nc: Connection with the neighbor that sent the digest.
+            entries: List of (node, version, role).
+
+        Returns:
+            list: Nodes that were not in the list of neighbors.
+        """
+        now = time.monotonic()
+        new_nodes = []
+        self.__versions_lock.acquire()
+        sent = self.__sent_versions.setdefault(nc, {})
+        for node, version, role in entries:
+            # The neighbor has this version, there is no need to send it back
+            if version > sent.get(node, -1):
+                sent[node] = version
+            if node == self.__node_name or version <= self.__versions.get(node, -1):
+                continue
+            self.__versions[node] = version
+            if node not in self.__nodes:
+                new_nodes.append(node)
+            self.__nodes[node] = now
+            self.__nodes_role[node] = role
+        self.__versions_lock.release()
+        return new_nodes
+
+    def send_digests(self, nodes=None):
+        """
+        Send the liveness digests to the neighbors (digest mode). Each neighbor is sent the entries that it does not have,
+        or an empty digest if nothing was sent to it during the last ``HEARTBEAT_PERIOD``.
+
+        Args:
+            nodes: Connections to send the digests to (None for all the neighbors).
+        """
+        if not self.__digest:
+            return
+        if nodes is None:
+            nodes = self.__neighbors.snapshot()
+        own_role = self.config.participant["device_args"]["role"]
+        self.__versions_lock.acquire()
+        # Only the entries of the nodes that are alive are spread
+        table = [(self.__node_name, self.__version, own_role)] + [
+            (node, version, self.__nodes_role.get(node, own_role))
+            for node, version in self.__versions.items()
+            if node in self.__nodes
+        ]
+        digests = []
+        for nc in nodes:
+            sent = self.__sent_versions.setdefault(nc, {})
+            name = nc.get_name()
+            entries = [entry for entry in table if entry[0] != name and entry[1] > sent.get(entry[0], -1)]
+            if entries or nc.is_idle(self.config.participant["HEARTBEAT_PERIOD"]):
+                for node, version, _ in entries:
+                    sent[node] = version
+                digests.append((nc, entries))
+        self.__versions_lock.release()
+
+        for nc, entries in digests:
+            self.notify(Events.SEND_LIVENESS_EVENT, (nc, CommunicationProtocol.build_liveness_msg(entries)))
+
+    def __increase_version(self):
+        now = time.monotonic()
+        if self.__version_time is None or now - self.__version_time >= self.config.participant["NODE_TIMEOUT"] / 3:
+            self.__versions_lock.acquire()
+            # Versions are based on the clock, so they keep increasing if the node is restarted
+            self.__version = max(self.__version + 1, int(time.time() * 1000))
+            self.__version_time = now
+            self.__versions_lock.release()
+
     def get_nodes(self, print=False):
         """
         Print the list of actual neighbors.
@@ -147,9 +278,4 @@ class Heartbeater(threading.Thread, Observable):
         """
         Update the config with the actual neighbors.
         """
-        neigbors = ''
-        for node in self.__neighbors:
-            neigbors += node.get_addr()[0] + ":" + str(node.get_addr()[1])
-            if node != self.__neighbors[-1]:
-                neigbors += " "
-        self.config.participant["network_args"]['neighbors'] = neigbors
+        self.config.participant["network_args"]['neighbors'] = " ".join(node.get_name() for node in self.__neighbors.snapshot())
@@ -32,9 +32,9 @@ class Aggregator(threading.Thread, Observable):
         self.__aggregated_waited_model = False
         self.__stored_models = [] if self.role == Role.PROXY else None
         self.__models = {}
+        self.__partial_aggregations = {}  # frozenset(models) -> (model, nodes, weight). Reset when a model is added
         self.__lock = threading.Lock()
-        self.__aggregation_lock = threading.Lock()
-        self.__aggregation_lock.acquire()
+        self.__aggregation_ready = threading.Event()  # set when all the models have been added (or the aggregation is forced)
         self.__thread_executed = False
 
     def run(self):
@@ -44,11 +44,8 @@ class Aggregator(threading.Thread, Observable):
         self.__thread_executed = True
 
         # Wait for all models to be added or TIMEOUT
-        try:
-            logging.info("[Aggregator] __aggregation_lock.acquire() during {} seconds".format(self.config.participant["AGGREGATION_TIMEOUT"]))
-            self.__aggregation_lock.acquire(timeout=self.config.participant["AGGREGATION_TIMEOUT"])
-        except Exception as e:
-            logging.error("[Aggregator] Error waiting for aggregation: {}".format(e))
+        logging.info("[Aggregator] Waiting for the models during {} seconds".format(self.config.participant["AGGREGATION_TIMEOUT"]))
+        self.__aggregation_ready.wait(timeout=self.config.participant["AGGREGATION_TIMEOUT"])
 
         logging.info("[Aggregator] Aggregating models, timeout reached.")
 
@@ -81,6 +78,21 @@ class Aggregator(threading.Thread, Observable):
         """
         print("Not implemented")
 
+    def add_to_aggregation(self, key, model, weight):
+        """
+        Called when a model is added (before it is stored). Aggregators that support incremental aggregation can fold the model
+        into a running aggregation and return the representation of the model that will be stored (and passed to ``aggregate``).
+
+        Args:
+            key: Key of the model (nodes that collaborated to get the model).
+            model: Model to add.
+            weight: Number of samples used to get the model.
+
+        Returns:
+            The model to store. By default, the model itself.
+        """
+        return model
+
     def set_nodes_to_aggregate(self, listnodes):
         """
         List with the name of nodes to aggregate.
@@ -148,7 +160,9 @@ class Aggregator(threading.Thread, Observable):
                     # Check if all nodes are not aggregated
                     if all([n not in models_added for n in nodes]):
                         # Aggregate model
-                        self.__models[" ".join(nodes)] = (model, weight)
+                        self.__models[" ".join(nodes)] = (self.add_to_aggregation(" ".join(nodes), model, weight), weight)
+                        self.__partial_aggregations = {}
+                        self.notify(Events.AGGREGATION_MODEL_ADDED_EVENT, nodes)
                         logging.info(
                             "[Aggregator] Model added ({}/{}) from {}".format(
                                 str(len(models_added) + len(nodes)),
@@ -178,34 +192,65 @@ class Aggregator(threading.Thread, Observable):
                 logging.debug("[Aggregator] __waiting_aggregated_model = False,  model received by difusion")
         return None
 
-    def get_partial_aggregation(self, except_nodes):
+    def __get_partial_models(self, except_nodes):
         """
-        Get the partial aggregation of the models.
+        Get the models of the partial aggregation.
 
         Args:
             except_nodes: Nodes to exclude.
 
         Returns:
-            (model, nodes, weight): Model, nodes and number of samples for the partial aggregation.
+            (models, nodes, weight): Models, nodes and number of samples for the partial aggregation.
         """
-        logging.info("[Aggregator] Getting partial aggregation from {}, except {}".format(self.__models.keys(), except_nodes))
         dict_aux = {}
         nodes_aggregated = []
         aggregation_weight = 0
-        models = self.__models.copy()
-        for n, (m, s) in list(models.items()):
+        except_nodes = set(except_nodes)
+        for n, (m, s) in list(self.__models.items()):
             splited_nodes = n.split()
-            if all([n not in except_nodes for n in splited_nodes]):
+            if except_nodes.isdisjoint(splited_nodes):
                 dict_aux[n] = (m, s)
                 nodes_aggregated += splited_nodes
                 aggregation_weight += s
+        return dict_aux, nodes_aggregated, aggregation_weight
+
+    def get_partial_aggregation_nodes(self, except_nodes):
+        """
+        Get the nodes that would contribute to the partial aggregation (without aggregating).
+
+        Args:
+            except_nodes: Nodes to exclude.
+
+        Returns:
+            list: Nodes of the partial aggregation.
+        """
+        return self.__get_partial_models(except_nodes)[1]
+
+    def get_partial_aggregation(self, except_nodes):
+        """
+        Get the partial aggregation of the models.
+        Partial aggregations are memoized by the set of models they include until a new model is added.
+
+        Args:
+            except_nodes: Nodes to exclude.
+
+        Returns:
+            (model, nodes, weight): Model, nodes and number of samples for the partial aggregation.
+        """
+        logging.info("[Aggregator] Getting partial aggregation from {}, except {}".format(self.__models.keys(), except_nodes))
+        dict_aux, nodes_aggregated, aggregation_weight = self.__get_partial_models(except_nodes)
 
         # If there are no models to aggregate
         if len(dict_aux) == 0:
             logging.info("[Aggregator.get_partial_aggregation] No models to aggregate")
             return None, None, None
 
-        return (self.aggregate(dict_aux), nodes_aggregated, aggregation_weight)
+        # Entries are never modified once added, so a cached result is valid for the same set of models
+        key = frozenset(dict_aux.keys())
+        partial_aggregations = self.__partial_aggregations
+        if key not in partial_aggregations:
+            partial_aggregations[key] = (self.aggregate(dict_aux), nodes_aggregated, aggregation_weight)
+        return partial_aggregations[key]
 
     def check_and_run_aggregation(self, force=False):
         """
@@ -218,15 +263,12 @@ class Aggregator(threading.Thread, Observable):
         models_added = [
             element for sublist in models_added for element in sublist
         ]  # Flatten list
-        # Try Unloock
-        try:
-            if (
-                    force or len(models_added) >= len(self.__train_set)
-            ) and self.__train_set != []:
-                logging.info("[Aggregator] __aggregation_lock.release() --> __models = {}".format(self.__models.keys()))
-                self.__aggregation_lock.release()
-        except threading.ThreadError:
-            pass
+        # Start the aggregation
+        if (
+                force or len(models_added) >= len(self.__train_set)
+        ) and self.__train_set != []:
+            logging.info("[Aggregator] Aggregation ready --> __models = {}".format(self.__models.keys()))
+            self.__aggregation_ready.set()
 
     def clear(self):
         """
@@ -5,6 +5,8 @@
 
 
 import logging
+import threading
+from collections import OrderedDict
 
 import torch
 
@@ -15,14 +17,94 @@ class FedAvg(Aggregator):
     """
     Federated Averaging (FedAvg) [McMahan et al., 2016]
     Paper: https://arxiv.org/abs/1602.05629
+
+    Models are flattened into the rows of a single (K x P) buffer using a cached layout of the layers,
+    so the weighted average is computed with one matrix-vector product instead of one operation per layer and model.
+    The aggregated layers are views of the output buffer.
+
+    If ``aggregator_args.incremental`` is enabled, each model is folded into a running weighted sum when it is added.
+    Models are stored as flat weighted sums (one per contributor group). The final aggregation only normalizes the running sum,
+    and partial aggregations subtract the excluded groups from it when that is cheaper than adding the included ones.
     """
 
     def __init__(self, node_name="unknown", config=None):
         super().__init__(node_name, config)
         self.config = config
         self.role = self.config.participant["device_args"]["role"]
+        self.__layout = None
+        # Incremental aggregation
+        self.__incremental = self.config.participant["aggregator_args"]["incremental"]
+        self.__running_sum = None
+        self.__running_weight = 0
+        self.__running_models = {}  # key -> (flat weighted model, weight)
+        self.__running_lock = threading.Lock()
         logging.info("[FedAvg] My config is {}".format(self.config))
 
+    def __get_layout(self, model):
+        """
+        Get the layout of the flattened model (cached while the layers do not change).
+
+        Args:
+            model: Model (state_dict) used as reference.
+
+        Returns:
+            (signature, dtype, [(layer, shape, dtype, offset, numel)], size)
+        """
+        signature = tuple((layer, tuple(value.shape), value.dtype) for layer, value in model.items())
+        if self.__layout is None or self.__layout[0] != signature:
+            float_dtypes = [dtype for _, _, dtype in signature if dtype.is_floating_point]
+            buffer_dtype = torch.float32
+            for dtype in float_dtypes:
+                buffer_dtype = torch.promote_types(buffer_dtype, dtype)
+            layers = []
+            offset = 0
+            for layer, shape, dtype in signature:
+                numel = 1
+                for dim in shape:
+                    numel *= dim
+                layers.append((layer, shape, dtype, offset, numel))
+                offset += numel
+            self.__layout = (signature, buffer_dtype, layers, offset)
+        return self.__layout
+
+    @staticmethod
+    def __flatten(model, layers, out):
+        torch.cat([model[layer].reshape(-1).to(out.device) for layer, _, _, _, _ in layers], out=out)
+        return out
+
+    @staticmethod
+    def __unflatten(flat, layers):
+        accum = OrderedDict()
+        for layer, shape, dtype, offset, numel in layers:
+            value = flat[offset: offset + numel].view(shape)
+            if not dtype.is_floating_point:
+                value = value.round()
+            accum[layer] = value.to(dtype)
+        return accum
+
+    def add_to_aggregation(self, key, model, weight):
+        """
+        Fold the model into the running weighted sum (incremental aggregation).
+
+        Returns:
+            The flat weighted model (incremental aggregation) or the model itself.
+        """
+        if not self.__incremental:
+            return model
+        _, buffer_dtype, layers, size = self.__get_layout(model)
+        device = next(iter(model.values())).device
+        flat = FedAvg.__flatten(model, layers, torch.empty(size, dtype=buffer_dtype, device=device))
+        flat.mul_(weight)
+        self.__running_lock.acquire()
+        if self.__running_sum is None:
+            self.__running_sum = flat.clone()
+        else:
+            self.__running_sum.add_(flat)
+        self.__running_weight += weight
+        self.__running_models[key] = (flat, weight)
+        self.__running_lock.release()
+        return flat
+
     def aggregate(self, models):
         """
         Ponderated average of the models.
@@ -37,24 +119,50 @@ class FedAvg(Aggregator):
             )
             return None
 
+        logging.info("[FedAvg.aggregate] Aggregating models: num={}".format(len(models)))
+        if self.__incremental:
+            return self.__aggregate_incremental(models)
+
         models = list(models.values())
+        _, buffer_dtype, layers, size = self.__get_layout(models[-1][0])
+        device = next(iter(models[-1][0].values())).device
 
         # Total Samples
         total_samples = sum([y for _, y in models])
+        weights = torch.tensor([w / total_samples for _, w in models], dtype=buffer_dtype, device=device)
 
-        # Create a Zero Model
-        accum = (models[-1][0]).copy()
-        for layer in accum:
-            accum[layer] = torch.zeros_like(accum[layer])
+        # Flatten the models (one row per model)
+        stacked = torch.empty((len(models), size), dtype=buffer_dtype, device=device)
+        for i, (m, _) in enumerate(models):
+            FedAvg.__flatten(m, layers, stacked[i])
 
-        # Add weighteds models
-        logging.info("[FedAvg.aggregate] Aggregating models: num={}".format(len(models)))
-        for m, w in models:
-            for layer in m:
-                accum[layer] = accum[layer] + m[layer] * w
+        # Weighted average
+        flat = torch.mv(stacked.t(), weights)
 
-        # Normalize Accum
-        for layer in accum:
-            accum[layer] = accum[layer] / total_samples
+        # Unflatten (views of the output buffer)
+        return FedAvg.__unflatten(flat, layers)
 
-        return accum
+    def __aggregate_incremental(self, models):
+        """
+        Ponderated average of flat weighted models (incremental aggregation).
+        The result is the running weighted sum minus the excluded models (total - excluded) / (remaining weight),
+        unless adding the included models requires fewer operations.
+        """
+        _, _, layers, _ = self.__layout
+        self.__running_lock.acquire()
+        excluded = [v for k, v in self.__running_models.items() if k not in models]
+        if len(excluded) < len(models):
+            flat = self.__running_sum.clone()
+            weight = self.__running_weight
+            for m, w in excluded:
+                flat.sub_(m)
+                weight -= w
+        else:
+            flat = None
+            weight = 0
+            for m, w in models.values():
+                flat = m.clone() if flat is None else flat.add_(m)
+                weight += w
+        flat.div_(weight)
+        self.__running_lock.release()
+        return FedAvg.__unflatten(flat, layers)
@@ -47,7 +47,7 @@ class NodeLearner:
         """
         pass
 
-    def encode_parameters(self, params=None, contributors=None, weight=None):
+    def encode_parameters(self, params=None, contributors=None, weight=None, compressor=None):
         """
         Encode the parameters of the model. (binary)
         If params are not provided, self parameters are encoded.
@@ -56,18 +56,20 @@ class NodeLearner:
             params: The parameters of the model. (non-binary)
             contributors: The contributors of the model.
             weight: The weight of the model.
+            compressor: The compression state of the connection the model is sent to (None to send it uncompressed).
 
         Returns:
             The encoded parameters of the model (params, contributors, weight).
         """
         pass
 
-    def decode_parameters(self, data):
+    def decode_parameters(self, data, compressor=None):
         """
         Decode the parameters of the model. (binary)
 
         Args:
             data: The encoded parameters of the model.
+            compressor: The compression state of the connection the model was received from (used to reconstruct compressed models).
 
         Returns:
             The decoded parameters of the model. (params, contributors, weight)
@@ -131,9 +133,13 @@ class NodeLearner:
         """
         pass
 
-    def evaluate(self):
+    def evaluate(self, params=None):
         """
         Evaluate the model with actual parameters.
+
+        Args:
+            params: Snapshot of the parameters to evaluate instead (None to evaluate the model). The model is not modified,
+                so a snapshot can be evaluated while the model is being fitted.
         """
         pass
 
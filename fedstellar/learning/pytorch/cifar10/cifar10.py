@@ -4,6 +4,7 @@
 #
 from math import floor
 
+import numpy as np
 # To Avoid Crashes with a lot of nodes
 import torch.multiprocessing
 import lightning as pl
@@ -11,14 +12,38 @@ from torch.utils.data import DataLoader
 from torchvision import transforms as T
 from torchvision.datasets import CIFAR10
 
+from fedstellar.learning.pytorch.datastore import DatasetStore
+
 import re
 from pathlib import Path
 from PIL import Image
 import pandas as pd
 
 
+class StoredCIFAR10(CIFAR10):
+    """
+    CIFAR10 memory mapped from the dataset store (``data_args.shared_store``). The batches of torchvision are only read
+    (and downloaded) if the dataset is not in the store.
+    """
+
+    def __init__(self, root, train=True, transform=None, target_transform=None, download=False):
+        super(CIFAR10, self).__init__(root, transform=transform, target_transform=target_transform)
+        self.train = train
+        self.download = download
+        self.data, self.targets = DatasetStore.get(root, "cifar10_train" if train else "cifar10_test", self.__load)
+
+    def __load(self):
+        dataset = CIFAR10(root=self.root, train=self.train, download=self.download)
+        return dataset.data, np.array(dataset.targets, dtype=np.int64)
+
+
 class CIFAR10DataModule(pl.LightningDataModule):
-    def __init__(self, normalization="cifar10", loading="torchvision", sub_id=0, number_sub=1, num_workers=4, batch_size=32, iid=True, root_dir="./data"):
+    # Datasets loaded in the process (shared by the nodes, read-only)
+    datasets = {}
+    # Random crops and flips in each access (learners must not cache the transformed data)
+    random_transforms = True
+
+    def __init__(self, normalization="cifar10", loading="torchvision", sub_id=0, number_sub=1, num_workers=4, batch_size=32, iid=True, root_dir="./data", shared_store=False):
         super().__init__()
         self.sub_id = sub_id
         self.number_sub = number_sub
@@ -28,6 +53,7 @@ class CIFAR10DataModule(pl.LightningDataModule):
         self.root_dir = root_dir
         self.loading = loading
         self.normalization = normalization
+        self.shared_store = shared_store
         self.mean = self.set_normalization(normalization)["mean"]
         self.std = self.set_normalization(normalization)["std"]
 
@@ -46,12 +72,18 @@ class CIFAR10DataModule(pl.LightningDataModule):
 
     def get_dataset(self, train, transform, download=True):
         if self.loading == "torchvision":
-            dataset = CIFAR10(
-                root=self.root_dir,
-                train=train,
-                transform=transform,
-                download=download,
-            )
+            # The transform only depends on the split and the normalization, so the dataset is loaded once per process
+            key = (self.root_dir, train, self.normalization)
+            if key not in CIFAR10DataModule.datasets:
+                # Memory mapped from the dataset store (shared by the participants of the host)
+                dataset_class = StoredCIFAR10 if self.shared_store else CIFAR10
+                CIFAR10DataModule.datasets[key] = dataset_class(
+                    root=self.root_dir,
+                    train=train,
+                    transform=transform,
+                    download=download,
+                )
+            dataset = CIFAR10DataModule.datasets[key]
         elif self.loading == "custom":
             raise NotImplementedError
         else:
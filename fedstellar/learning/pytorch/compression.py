@@ -0,0 +1,229 @@
+#
+# This file is part of the fedstellar framework (see https://github.com/enriquetomasmb/fedstellar).
+# Copyright (c) 2022 Enrique Tomás Martínez Beltrán.
+#
+
+
+"""
+Module that implements the compression of the models sent to a neighbor (delta encoding, quantization and top-k sparsification).
+"""
+import threading
+from collections import OrderedDict
+
+import torch
+
+
+##########################
+#    ModelCompressor     #
+##########################
+
+
+class ModelCompressor:
+    """
+    Compression state of a connection. Each connection has its own compressor, which is used to compress the models sent
+    to the neighbor and to reconstruct the models received from it.
+
+    The compression settings are negotiated with the neighbor (see ``negotiate``), until then models are sent uncompressed:
+        - quantization: ``none``, ``fp16``, ``bf16`` or ``int8`` (with a scale per tensor).
+        - delta: Models are sent as the difference with the last model sent to the neighbor (the base).
+        - topk: Ratio of the elements of each difference that are sent (0 to send all of them). It requires ``delta``.
+
+    Both sides keep the same base: the sender stores the model as it is reconstructed by the receiver (with the quantization error), and
+    the frames of a connection are processed in order. This way, the error of the quantization and the elements that are not sent
+    (top-k) stay in the next difference, so they are sent later (error feedback).
+
+    Only floating point tensors are compressed, the rest of them (e.g. ``num_batches_tracked``) are sent as they are.
+    Models must be sent in the same order they are compressed.
+    """
+
+    """
+    Supported quantizations.
+    """
+    QUANTIZATIONS = ["none", "fp16", "bf16", "int8"]
+    """
+    Suffix of the key of the indexes of a sparse tensor (top-k).
+    """
+    INDEX_SUFFIX = "#idx"
+
+    def __init__(self):
+        self.__quantization = "none"
+        self.__delta = False
+        self.__topk = 0.0
+        self.__send_base = None
+        self.__recv_base = None
+        self.__lock = threading.Lock()
+
+    ##################
+    #    Settings    #
+    ##################
+
+    def negotiate(self, local, remote):
+        """
+        Set the compression settings of the connection. Only the settings enabled in both nodes are used.
+
+        Args:
+            local: (quantization, delta, topk) of the node.
+            remote: (quantization, delta, topk) of the neighbor.
+        """
+        self.__lock.acquire()
+        self.__quantization = local[0] if local[0] == remote[0] and local[0] in ModelCompressor.QUANTIZATIONS else "none"
+        self.__delta = local[1] and remote[1]
+        self.__topk = max(local[2], remote[2]) if self.__delta and local[2] > 0 and remote[2] > 0 else 0.0
+        if not self.__delta:
+            self.__send_base = None
+        self.__lock.release()
+
+    def get_settings(self):
+        """
+        Returns:
+            (quantization, delta, topk) used to send the models.
+        """
+        return self.__quantization, self.__delta, self.__topk
+
+    def is_enabled(self):
+        """
+        Returns:
+            True if the models sent are compressed.
+        """
+        return self.__quantization != "none" or self.__delta
+
+    def is_stateful(self):
+        """
+        Returns:
+            True if the compressed model depends on the models sent before (so it can not be shared with other connections).
+        """
+        return self.__delta
+
+    #####################
+    #    Compression    #
+    #####################
+
+    def compress(self, params):
+        """
+        Compress a model.
+
+        Args:
+            params: The parameters of the model.
+
+        Returns:
+            (params, info) The compressed tensors and the information needed to reconstruct them.
+        """
+        self.__lock.acquire()
+        try:
+            base = self.__send_base if self.__delta else None
+            info = {
+                "quantization": self.__quantization,
+                "base": base is not None,
+                "delta": self.__delta,
+                "scales": {},
+                "dtypes": {},
+            }
+            compressed = OrderedDict()
+            shapes = OrderedDict()
+            for key, value in params.items():
+                value = value.detach()
+                shapes[key] = tuple(value.shape)
+                if not value.is_floating_point():
+                    compressed[key] = value.cpu()
+                    continue
+                info["dtypes"][key] = str(value.dtype).replace("torch.", "")
+                # Copy, the model could be modified while (or after) it is sent
+                x = value.to("cpu", torch.float32, copy=True)
+                if base is not None:
+                    x = x.reshape(-1) - base[key][0]
+                    if self.__topk > 0:
+                        k = max(1, int(x.numel() * self.__topk))
+                        if k < x.numel():
+                            index = torch.topk(x.abs(), k, sorted=False).indices
+                            x = x[index]
+                            compressed[key + ModelCompressor.INDEX_SUFFIX] = index.to(torch.int32 if value.numel() < 2 ** 31 else torch.int64)
+                compressed[key] = ModelCompressor.__quantize(key, x, self.__quantization, info)
+
+            # The base is the model as it is reconstructed by the neighbor
+            if self.__delta:
+                self.__send_base = ModelCompressor.__reconstruct(compressed, info, shapes, base)[1]
+            return compressed, info
+        finally:
+            self.__lock.release()
+
+    def decompress(self, params, info):
+        """
+        Reconstruct a model received from the neighbor.
+
+        Args:
+            params: The compressed tensors.
+            info: The information needed to reconstruct them (from ``compress``).
+
+        Returns:
+            The parameters of the model.
+
+        Raises:
+            ValueError: If the model is a difference and there is no base.
+        """
+        self.__lock.acquire()
+        try:
+            if info["base"] and self.__recv_base is None:
+                raise ValueError("Compressed model without base")
+            shapes = OrderedDict()
+            for key, value in params.items():
+                if key.endswith(ModelCompressor.INDEX_SUFFIX):
+                    continue
+                if key in info["dtypes"]:
+                    shapes[key] = self.__recv_base[key][1] if info["base"] else tuple(value.shape)
+                else:
+                    shapes[key] = tuple(value.shape)
+            model, base = ModelCompressor.__reconstruct(params, info, shapes, self.__recv_base if info["base"] else None)
+            if info["delta"]:
+                self.__recv_base = base
+            return model
+        finally:
+            self.__lock.release()
+
+    @staticmethod
+    def __quantize(key, x, quantization, info):
+        if quantization == "fp16":
+            return x.half()
+        elif quantization == "bf16":
+            return x.bfloat16()
+        elif quantization == "int8":
+            scale = x.abs().max().item() / 127 if x.numel() > 0 else 0.0
+            scale = scale if scale > 0 else 1.0
+            info["scales"][key] = scale
+            return torch.round(x / scale).clamp_(-127, 127).to(torch.int8)
+        return x
+
+    @staticmethod
+    def __reconstruct(params, info, shapes, base):
+        """
+        Reconstruct the model from the compressed tensors. It is used by both sides, so they get the same result.
+
+        Args:
+            params: The compressed tensors.
+            info: The information needed to reconstruct them.
+            shapes: Shape of each tensor of the model.
+            base: The base of the difference (None if the model is not a difference).
+
+        Returns:
+            (model, base) The model and the new base (flattened float32 tensors with their shapes, None if it is not stored).
+        """
+        model = OrderedDict()
+        new_base = OrderedDict() if info["delta"] else None
+        for key, shape in shapes.items():
+            value = params[key]
+            if key not in info["dtypes"]:
+                model[key] = value
+                continue
+            x = value.float()
+            if key in info["scales"]:
+                x = x * info["scales"][key]
+            if base is not None:
+                index = params.get(key + ModelCompressor.INDEX_SUFFIX)
+                if index is not None:
+                    x = base[key][0].index_add(0, index.long(), x)
+                else:
+                    x = base[key][0] + x
+            x = x.reshape(shape)
+            if new_base is not None:
+                new_base[key] = (x.reshape(-1).clone(), tuple(shape))
+            model[key] = x.to(getattr(torch, info["dtypes"][key]))
+        return model, new_base
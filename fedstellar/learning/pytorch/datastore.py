@@ -0,0 +1,111 @@
+#
+# This file is part of the fedstellar framework (see https://github.com/enriquetomasmb/fedstellar).
+# Copyright (c) 2022 Enrique Tomás Martínez Beltrán.
+#
+
+
+"""
+Module that implements the dataset store shared by the participants of a host.
+"""
+import logging
+import os
+
+import numpy as np
+import torch
+
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows: processes materializing a dataset at the same time load it several times (the result is the same)
+    fcntl = None
+
+
+######################
+#    DatasetStore    #
+######################
+
+
+class DatasetStore:
+    """
+    Store of datasets as ``.npy`` files (``<root_dir>/store/<name>.data.npy`` and ``<name>.targets.npy``), used with ``data_args.shared_store``.
+
+    The first participant of a host that needs a dataset materializes it (loads it as usual, e.g. with ``torch.load`` or torchvision)
+    and writes it to the store. The participants (processes) memory map the files, so the dataset is loaded once and its pages are
+    shared through the page cache: a participant only reads the pages of the rows of its partition (``sub_id``).
+
+    Arrays are mapped copy-on-write, so the datasets can be modified in a process without changing the files (or the other processes).
+    """
+
+    # Arrays mapped in the process (shared by the nodes): path -> (data, targets)
+    arrays = {}
+
+    @staticmethod
+    def get(root_dir, name, loader):
+        """
+        Get a dataset from the store. It is materialized the first time.
+
+        Args:
+            root_dir: Data directory.
+            name: Name of the dataset in the store (e.g. ``femnist_train``). Datasets with different contents need different names.
+            loader: Function that loads the dataset, returns (data, targets) as tensors or arrays. Only called if it is not in the store.
+
+        Returns:
+            (data, targets) The memory mapped arrays.
+        """
+        path = os.path.join(root_dir, "store", name)
+        if path not in DatasetStore.arrays:
+            if not DatasetStore.__exists(path):
+                DatasetStore.__materialize(path, loader)
+            DatasetStore.arrays[path] = (
+                np.load(f"{path}.data.npy", mmap_mode="c"),
+                np.load(f"{path}.targets.npy", mmap_mode="c"),
+            )
+        return DatasetStore.arrays[path]
+
+    @staticmethod
+    def get_tensors(root_dir, name, loader):
+        """
+        Get a dataset from the store as tensors (sharing the memory of the mapped arrays).
+
+        Args:
+            root_dir: Data directory.
+            name: Name of the dataset in the store.
+            loader: Function that loads the dataset, returns (data, targets) as tensors or arrays.
+
+        Returns:
+            (data, targets) The tensors.
+        """
+        data, targets = DatasetStore.get(root_dir, name, loader)
+        return torch.from_numpy(data), torch.from_numpy(targets)
+
+    @staticmethod
+    def __exists(path):
+        return os.path.exists(f"{path}.data.npy") and os.path.exists(f"{path}.targets.npy")
+
+    @staticmethod
+    def __materialize(path, loader):
+        """
+        Load a dataset and write it to the store. Other processes of the host wait for it (lock file) instead of loading it too.
+        Files are written to a temporary file and renamed, so a dataset in the store is always complete.
+        """
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        lock = open(f"{path}.lock", "w")
+        try:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            if DatasetStore.__exists(path):
+                return
+            logging.info("[DatasetStore] Materializing {}".format(path))
+            data, targets = loader()
+            # Targets first, the data file marks the dataset as complete
+            for suffix, array in (("targets", targets), ("data", data)):
+                if isinstance(array, torch.Tensor):
+                    array = array.numpy()
+                tmp = f"{path}.{suffix}.{os.getpid()}.tmp"
+                with open(tmp, "wb") as f:
+                    np.save(f, np.ascontiguousarray(array))
+                os.replace(tmp, f"{path}.{suffix}.npy")
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+            lock.close()
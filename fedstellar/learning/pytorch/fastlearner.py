@@ -0,0 +1,201 @@
+#
+# This file is part of the fedstellar framework (see https://github.com/enriquetomasmb/fedstellar).
+# Copyright (c) 2022 Enrique Tomás Martínez Beltrán.
+#
+
+import logging
+
+import torch
+
+from fedstellar.learning.pytorch.lightninglearner import LightningLearner, SnapshotLogger
+
+
+#####################
+#    FastLearner    #
+#####################
+
+
+class FastLearner(LightningLearner):
+    """
+    Learner with a plain PyTorch training loop (``training_args.learner = "fast"``). It is intended for small models (e.g. ``MNISTModelMLP``
+    or ``SyscallModelMLP``), where the per-step overhead of Lightning (hooks, ``self.log`` and the metrics of the model) is higher than
+    the forward and backward passes.
+
+    The parameters are serialized as in ``LightningLearner``, so nodes with both learners can be mixed in the same network.
+
+    Differences with ``LightningLearner``:
+        - The datasets are read once (the transforms are applied once) and kept as tensors, which are shuffled and batched in each epoch.
+          Datamodules with random transforms (``random_transforms = True``, e.g. CIFAR10 and FEMNIST) are read through their dataloaders
+          in each epoch instead, so the augmentation is drawn again.
+        - The loss is ``model.criterion(model(x), y)`` (classification models), the optimizer is the one of ``configure_optimizers``.
+        - There is no validation during the fit. Loss and accuracy (macro) are computed at the end of each epoch
+          (``TrainEpoch/*`` and ``TestEpoch/*``), the metrics and hooks of the model are not used.
+
+    Atributes:
+        model: Model to train.
+        data: Data to train the model.
+        epochs: Number of epochs to train.
+        logger: Logger.
+    """
+
+    def __init__(self, model, data, config=None, logger=None):
+        LightningLearner.__init__(self, model, data, config=config, logger=logger)
+        # Dataset tensors by phase: (x, y, batch size)
+        self.__tensors = {}
+        self.__interrupted = False
+
+    def set_data(self, data):
+        LightningLearner.set_data(self, data)
+        self.__tensors = {}
+
+    def fit(self):
+        try:
+            if self.epochs > 0:
+                self.__interrupted = False
+                self.__fit()
+        except Exception as e:
+            logging.error("Something went wrong with the training loop. {}".format(e))
+
+    def interrupt_fit(self):
+        self.__interrupted = True
+
+    def evaluate(self, params=None):
+        try:
+            if self.epochs > 0 and params is not None:
+                return self.__evaluate(self.get_evaluation_model(params), SnapshotLogger(self.logger))
+            elif self.epochs > 0:
+                return self.__evaluate(self.model, self.logger)
+            else:
+                return None
+        except Exception as e:
+            logging.error("Something went wrong with the evaluation loop. {}".format(e))
+            return None
+
+    def create_trainer(self):
+        pass
+
+    def __fit(self):
+        device = self.__get_device()
+        model = self.model.to(device)
+        model.train()
+        optimizer = self.__configure_optimizer()
+        steps = 0
+        try:
+            for _ in range(self.epochs):
+                stats = None
+                for batch_x, batch_y in self.__get_batches("Train"):
+                    if self.__interrupted:
+                        return
+                    batch_x = batch_x.to(device, non_blocking=True)
+                    batch_y = batch_y.to(device, non_blocking=True)
+                    optimizer.zero_grad(set_to_none=True)
+                    y_pred = model(batch_x)
+                    loss = model.criterion(y_pred, batch_y)
+                    loss.backward()
+                    optimizer.step()
+                    steps += 1
+                    stats = FastLearner.__accumulate(stats, loss.detach(), y_pred.detach(), batch_y)
+                self.__log_epoch_metrics(self.logger, "Train", stats, steps)
+        finally:
+            model.cpu()
+
+    def __evaluate(self, model, logger):
+        device = self.__get_device()
+        model = model.to(device)
+        model.eval()
+        stats = None
+        try:
+            with torch.no_grad():
+                for batch_x, batch_y in self.__get_batches("Test"):
+                    batch_x = batch_x.to(device, non_blocking=True)
+                    batch_y = batch_y.to(device, non_blocking=True)
+                    y_pred = model(batch_x)
+                    stats = FastLearner.__accumulate(stats, model.criterion(y_pred, batch_y), y_pred, batch_y)
+        finally:
+            model.train()
+            model.cpu()
+        # Same step as the test of a new trainer
+        return self.__log_epoch_metrics(logger, "Test", stats, 0)
+
+    def __get_batches(self, phase):
+        """
+        Get the batches of an epoch. The training batches are shuffled.
+
+        Returns:
+            Iterator of (x, y) batches of the phase (Train or Test). They are sliced from the cached tensors, or read from the dataloader
+            if the datamodule has random transforms.
+        """
+        if getattr(self.data, "random_transforms", False):
+            return iter(self.data.train_dataloader() if phase == "Train" else self.data.test_dataloader())
+        x, y, batch_size = self.__get_tensors(phase)
+        indexes = torch.randperm(len(x)) if phase == "Train" else torch.arange(len(x))
+        return ((x[indexes[start:start + batch_size]], y[indexes[start:start + batch_size]]) for start in range(0, len(x), batch_size))
+
+    def __get_tensors(self, phase):
+        """
+        Returns:
+            (x, y, batch size) The dataset of the phase (Train or Test) as tensors. It is read from the dataloader the first time.
+        """
+        if phase not in self.__tensors:
+            loader = self.data.train_dataloader() if phase == "Train" else self.data.test_dataloader()
+            xs, ys = [], []
+            for batch_x, batch_y in loader:
+                xs.append(batch_x)
+                ys.append(batch_y)
+            self.__tensors[phase] = (torch.cat(xs), torch.cat(ys), loader.batch_size or len(xs[0]))
+        return self.__tensors[phase]
+
+    def __get_device(self):
+        accelerator = self.config.participant["device_args"]["accelerator"]
+        if accelerator in ("gpu", "cuda", "auto") and torch.cuda.is_available():
+            return torch.device("cuda")
+        return torch.device("cpu")
+
+    def __configure_optimizer(self):
+        optimizers = self.model.configure_optimizers()
+        if isinstance(optimizers, dict):
+            optimizers = optimizers["optimizer"]
+        if isinstance(optimizers, (list, tuple)):
+            optimizers = optimizers[0]
+        return optimizers
+
+    @staticmethod
+    def __accumulate(stats, loss, y_pred, y):
+        """
+        Accumulate the statistics of a batch (on the device, there is no synchronization until the end of the epoch).
+
+        Returns:
+            [loss sum, samples, samples by class, hits by class] (None entries if the output is not a classification).
+        """
+        if stats is None:
+            stats = [0, 0, None, None]
+        stats[0] = stats[0] + loss * len(y)
+        stats[1] += len(y)
+        if y_pred.dim() == 2 and y.dim() == 1 and not torch.is_floating_point(y):
+            classes = y_pred.shape[1]
+            hits = y[y_pred.argmax(dim=1) == y]
+            samples_by_class = torch.bincount(y, minlength=classes)
+            hits_by_class = torch.bincount(hits, minlength=classes)
+            stats[2] = samples_by_class if stats[2] is None else stats[2] + samples_by_class
+            stats[3] = hits_by_class if stats[3] is None else stats[3] + hits_by_class
+        return stats
+
+    def __log_epoch_metrics(self, logger, phase, stats, step):
+        """
+        Log the loss and the accuracy (macro, classes without samples are not counted) of an epoch.
+
+        Returns:
+            (loss, accuracy) The metrics (accuracy is None if the output is not a classification).
+        """
+        if stats is None:
+            return None
+        loss_sum, samples, samples_by_class, hits_by_class = stats
+        loss = float(loss_sum) / samples
+        metrics = {f"{phase}Epoch/Loss": loss}
+        accuracy = None
+        if samples_by_class is not None:
+            present = samples_by_class > 0
+            accuracy = float((hits_by_class[present].float() / samples_by_class[present].float()).mean())
+            metrics[f"{phase}Epoch/Accuracy"] = accuracy
+        logger.log_metrics(metrics, step=step)
+        return loss, accuracy
@@ -2,6 +2,7 @@
 # This file is part of the fedstellar framework (see https://github.com/enriquetomasmb/fedstellar).
 # Copyright (c) 2022 Enrique Tomás Martínez Beltrán.
 #
+import hashlib
 import json
 import os
 import shutil
@@ -18,11 +19,57 @@ from torchvision.datasets import MNIST, utils
 from torchvision import transforms
 import numpy as np
 
+from fedstellar.learning.pytorch.datastore import DatasetStore
+
 torch.multiprocessing.set_sharing_strategy("file_system")
 
 
+class FEMNISTContrastJitter:
+    """
+    Random contrast of a batch of images (a factor for each image), as ``ColorJitter(contrast=...)`` does with each PIL image.
+
+    Args:
+        contrast: How much to jitter the contrast (the factor is chosen uniformly from [max(0, 1 - contrast), 1 + contrast]).
+    """
+
+    def __init__(self, contrast):
+        self.low = max(0.0, 1.0 - contrast)
+        self.high = 1.0 + contrast
+
+    def __call__(self, images):
+        """
+        Args:
+            images: Batch of images (uint8, B x C x H x W).
+
+        Returns:
+            The batch of images (float, in [0, 1]).
+        """
+        images = images.float()
+        factor = torch.empty((len(images), 1, 1, 1)).uniform_(self.low, self.high)
+        # Blend with the (rounded) mean of each image, as PIL does
+        mean = images.mean(dim=(1, 2, 3), keepdim=True).add_(0.5).floor_()
+        return mean.add(factor * (images - mean)).clamp_(0, 255).floor_().div_(255)
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}(contrast=[{self.low}, {self.high}])"
+
+
 class FEMNIST(MNIST):
-    def __init__(self, sub_id, number_sub, root_dir, train=True, transform=None, target_transform=None, download=False):
+    """
+    FEMNIST dataset.
+
+    If ``preprocess`` is set, it is applied once to each image and the results are cached (``<data file>.<preprocess hash>.pt``,
+    or the dataset store with ``shared_store``). Then, ``transform`` is applied to batches of cached images (uint8, B x 1 x H x W)
+    by ``__getitems__``, so the deterministic transforms do not run on every access and the random ones are vectorized.
+
+    Args:
+        preprocess: Deterministic transforms of the PIL images (e.g. crop and resize), None to apply ``transform`` to each PIL image.
+    """
+
+    # Whole datasets loaded in the process (shared by the nodes, read-only)
+    datasets = {}
+
+    def __init__(self, sub_id, number_sub, root_dir, train=True, transform=None, target_transform=None, download=False, shared_store=False, preprocess=None):
         super(MNIST, self).__init__(root_dir, transform=transform, target_transform=target_transform)
         self.sub_id = sub_id
         self.number_sub = number_sub
@@ -47,11 +94,74 @@ class FEMNIST(MNIST):
         else:
             data_file = self.test_file
 
-        # Whole dataset
-        data_and_targets = torch.load(data_file)
+        self.preprocess = preprocess
+        key = data_file
+        load = lambda: torch.load(data_file)[:2]
+        if preprocess is not None:
+            key = "{}.{}.pt".format(data_file[:-len(".pt")], hashlib.md5(repr(preprocess).encode()).hexdigest()[:8])
+            load = lambda: FEMNIST.__preprocess(data_file, preprocess)
+
+        # Whole dataset (loaded once per process)
+        if key not in FEMNIST.datasets:
+            if shared_store:
+                # Memory mapped from the dataset store (shared by the participants of the host)
+                name = os.path.basename(key)[:-len(".pt")]
+                FEMNIST.datasets[key] = DatasetStore.get_tensors(self.root, name, load)
+            elif preprocess is not None:
+                FEMNIST.datasets[key] = FEMNIST.__load_cache(key, load)
+            else:
+                FEMNIST.datasets[key] = torch.load(data_file)
+        data_and_targets = FEMNIST.datasets[key]
         self.data, self.targets = data_and_targets[0], data_and_targets[1]
 
+    @staticmethod
+    def __preprocess(data_file, preprocess):
+        """
+        Apply the deterministic transforms to each image of a data file.
+
+        Returns:
+            (data, targets) The transformed images (uint8, N x 1 x H x W) and the targets.
+        """
+        print(f'Preprocessing {data_file}...')
+        data, targets = torch.load(data_file)[:2]
+        images = [transforms.functional.pil_to_tensor(preprocess(Image.fromarray(img.numpy(), mode='F'))) for img in data]
+        return torch.stack(images), targets
+
+    @staticmethod
+    def __load_cache(cache_file, load):
+        """
+        Load the preprocessed dataset from the cache file, it is created the first time (written to a temporary file and renamed).
+        """
+        if not os.path.exists(cache_file):
+            data, targets = load()
+            tmp = f'{cache_file}.{os.getpid()}.tmp'
+            torch.save([data, targets], tmp)
+            os.replace(tmp, cache_file)
+            return data, targets
+        return tuple(torch.load(cache_file))
+
+    def __getitems__(self, indexes):
+        """
+        Get a batch of samples. Cached images are transformed together.
+
+        Args:
+            indexes: Indexes of the samples.
+
+        Returns:
+            List of (image, target).
+        """
+        if self.preprocess is None:
+            return [self[index] for index in indexes]
+        images, targets = self.data[indexes], self.targets[indexes].tolist()
+        if self.transform is not None:
+            images = self.transform(images)
+        if self.target_transform is not None:
+            targets = [self.target_transform(target) for target in targets]
+        return list(zip(images.unbind(0), targets))
+
     def __getitem__(self, index):
+        if self.preprocess is not None:
+            return self.__getitems__([index])[0]
         img, target = self.data[index], int(self.targets[index])
         img = Image.fromarray(img.numpy(), mode='F')
         if self.transform is not None:
@@ -101,6 +211,9 @@ class FEMNISTDataModule(LightningDataModule):
 
     """
 
+    # The contrast is jittered in each access (learners must not cache the transformed data)
+    random_transforms = True
+
     # Singleton
     femnist_train = None
     femnist_val = None
@@ -113,6 +226,7 @@ class FEMNISTDataModule(LightningDataModule):
             num_workers=4,
             val_percent=0.1,
             root_dir=None,
+            shared_store=False,
     ):
         super().__init__()
         self.sub_id = sub_id
@@ -122,18 +236,21 @@ class FEMNISTDataModule(LightningDataModule):
         self.val_percent = val_percent
         self.root_dir = root_dir
 
-        transform_data = transforms.Compose(
+        # Deterministic transforms (applied once, cached) and random ones (applied to each batch)
+        preprocess_data = transforms.Compose(
             [
                 transforms.CenterCrop((96, 96)),
                 transforms.Grayscale(num_output_channels=1),
-                transforms.Resize((28, 28)),
-                transforms.ColorJitter(contrast=3),
-                transforms.ToTensor(),
+                transforms.Resize((28, 28))]
+        )
+        transform_data = transforms.Compose(
+            [
+                FEMNISTContrastJitter(contrast=3),
                 transforms.Normalize((0.1307,), (0.3081,))]
         )
 
-        self.train = FEMNIST(sub_id=self.sub_id, number_sub=self.number_sub, root_dir=root_dir, train=True, transform=transform_data, target_transform=None, download=True)
-        self.test = FEMNIST(sub_id=self.sub_id, number_sub=self.number_sub, root_dir=root_dir, train=False, transform=transform_data, target_transform=None, download=True)
+        self.train = FEMNIST(sub_id=self.sub_id, number_sub=self.number_sub, root_dir=root_dir, train=True, transform=transform_data, target_transform=None, download=True, shared_store=shared_store, preprocess=preprocess_data)
+        self.test = FEMNIST(sub_id=self.sub_id, number_sub=self.number_sub, root_dir=root_dir, train=False, transform=transform_data, target_transform=None, download=True, shared_store=shared_store, preprocess=preprocess_data)
 
         if len(self.test) < self.number_sub:
             raise ValueError("Too many partitions")
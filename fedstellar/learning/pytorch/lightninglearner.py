@@ -15,8 +15,11 @@
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 #
 
+import copy
+import hashlib
+import json
 import logging
-import pickle
+import struct
 import time
 from collections import OrderedDict
 
@@ -25,11 +28,53 @@ from lightning import Trainer
 from lightning.pytorch.callbacks import ModelSummary
 from lightning.pytorch.callbacks import RichProgressBar, RichModelSummary
 from lightning.pytorch.callbacks.progress.rich_progress import RichProgressBarTheme
+from lightning.pytorch.loggers.logger import Logger
 
 from fedstellar.learning.exceptions import DecodingParamsError, ModelNotMatchingError
 from fedstellar.learning.learner import NodeLearner
 
 
+########################
+#    SnapshotLogger    #
+########################
+
+
+class SnapshotLogger(Logger):
+    """
+    Logger of the evaluations of parameter snapshots, which run in the background while the trainer of the round logs its metrics.
+    It forwards the metrics to the logger of the node, at a step of the current round (``log_round_metrics``), so the step of the round
+    is not modified. The rest of the attributes (e.g. ``experiment``) are the ones of the logger of the node.
+
+    Args:
+        logger: Logger of the node.
+    """
+
+    def __init__(self, logger):
+        super().__init__()
+        self.__logger = logger
+
+    @property
+    def name(self):
+        return self.__logger.name
+
+    @property
+    def version(self):
+        return self.__logger.version
+
+    @property
+    def experiment(self):
+        return self.__logger.experiment
+
+    def log_hyperparams(self, params, *args, **kwargs):
+        pass
+
+    def log_metrics(self, metrics, step=None):
+        if hasattr(self.__logger, "log_round_metrics"):
+            self.__logger.log_round_metrics(metrics, step or 0)
+        else:
+            self.__logger.log_metrics(metrics, step)
+
+
 ###########################
 #    LightningLearner     #
 ###########################
@@ -44,8 +89,33 @@ class LightningLearner(NodeLearner):
         data: Data to train the model.
         epochs: Number of epochs to train.
         logger: Logger.
+
+    Parameters are serialized with a tensor-native layout (no pickle):
+        MAGIC | header length (4 bytes) | header (JSON) | padding | raw tensor bytes
+
+    The header contains the contributors, the weight, the layout hash and, for each tensor, its key, dtype, shape and offset.
+    If the model is compressed (see ``ModelCompressor``), the header also contains the information needed to reconstruct it.
+    Each tensor is aligned to ``ALIGNMENT`` bytes, so it can be decoded without copies using ``torch.frombuffer``.
+
+    ``evaluate`` can also evaluate a snapshot of the parameters (e.g. in a background worker while the model is fitted): the snapshot is
+    loaded in a copy of the model and evaluated by another trainer (with the test dataloader, not the datamodule), which logs through
+    a ``SnapshotLogger``.
+
+    By default, a ``Trainer`` is created for each fit and evaluation. With ``training_args.reuse_trainer``, the trainer is created once
+    (per experiment) and each fit advances ``max_epochs`` by the number of epochs of the round (it depends on internals of Lightning,
+    see ``__can_reuse_trainer``).
+    With ``training_args.headless``, the trainer has no callbacks (progress bar and model summary), which is intended for simulations.
     """
 
+    """
+    Magic bytes of the serialized parameters.
+    """
+    MAGIC = b"FSTP"
+    """
+    Alignment (in bytes) of each tensor in the serialized parameters.
+    """
+    ALIGNMENT = 64
+
     def __init__(self, model, data, config=None, logger=None):
         self.model = model
         # self.model = torch.compile(model)  # PyTorch 2.0
@@ -53,6 +123,10 @@ class LightningLearner(NodeLearner):
         self.config = config
         self.logger = logger
         self.__trainer = None
+        self.__reuse_trainer = config.participant["training_args"]["reuse_trainer"]
+        self.__headless = config.participant["training_args"]["headless"]
+        self.__evaluation_model = None
+        self.__layout = None
         self.epochs = 1
         logging.getLogger("lightning.pytorch").setLevel(logging.WARNING)
 
@@ -66,35 +140,124 @@ class LightningLearner(NodeLearner):
 
     def set_model(self, model):
         self.model = model
+        self.__evaluation_model = None
+        self.__layout = None
 
     def set_data(self, data):
         self.data = data
 
-    def encode_parameters(self, params=None, contributors=None, weight=None):
+    @staticmethod
+    def __align(n):
+        return n + (-n % LightningLearner.ALIGNMENT)
+
+    @staticmethod
+    def __build_layout(params):
+        """
+        Build the layout of the parameters.
+
+        Args:
+            params: The parameters of the model. (non-binary)
+
+        Returns:
+            (layout, layout_hash, data_size): layout is a list of (key, dtype, shape, offset, numel) tuples.
+        """
+        layout = []
+        offset = 0
+        for key, value in params.items():
+            layout.append((key, value.dtype, tuple(value.shape), offset, value.numel()))
+            offset = LightningLearner.__align(offset + value.numel() * value.element_size())
+        description = [[key, str(dtype).replace("torch.", ""), shape, offset] for key, dtype, shape, offset, _ in layout]
+        layout_hash = hashlib.sha1(json.dumps(description).encode("utf-8")).hexdigest()
+        return layout, layout_hash, offset
+
+    def __get_layout(self):
+        """
+        Returns:
+            The layout of the local model (cached until the model changes).
+        """
+        if self.__layout is None:
+            self.__layout = LightningLearner.__build_layout(self.model.state_dict())
+        return self.__layout
+
+    def encode_parameters(self, params=None, contributors=None, weight=None, compressor=None):
         if params is None:
             params = self.model.state_dict()
-        array = [val.cpu().numpy() for _, val in params.items()]
-        return pickle.dumps((array, contributors, weight))
+        compression = None
+        if compressor is not None and compressor.is_enabled():
+            params, compression = compressor.compress(params)
+        layout, layout_hash, data_size = LightningLearner.__build_layout(params)
+        header = json.dumps({
+            "layout": layout_hash,
+            "contributors": contributors,
+            "weight": weight,
+            "compression": compression,
+            "tensors": [[key, str(dtype).replace("torch.", ""), shape, offset] for key, dtype, shape, offset, _ in layout],
+        }).encode("utf-8")
+        data_start = LightningLearner.__align(len(LightningLearner.MAGIC) + 4 + len(header))
+
+        # Write the tensors directly in the output buffer
+        data = bytearray(data_start + data_size)
+        data[0:len(LightningLearner.MAGIC)] = LightningLearner.MAGIC
+        struct.pack_into("!I", data, len(LightningLearner.MAGIC), len(header))
+        data[len(LightningLearner.MAGIC) + 4: len(LightningLearner.MAGIC) + 4 + len(header)] = header
+        for key, _, _, offset, numel in layout:
+            if numel == 0:
+                continue
+            value = params[key].detach().reshape(-1).view(torch.uint8)
+            torch.frombuffer(data, dtype=torch.uint8, count=value.numel(), offset=data_start + offset).copy_(value)
+        return data
 
-    def decode_parameters(self, data):
+    def decode_parameters(self, data, compressor=None):
         try:
-            params, contributors, weight = pickle.loads(data)
-            params_dict = zip(self.model.state_dict().keys(), params)
+            data = memoryview(data)
+            if bytes(data[0:len(LightningLearner.MAGIC)]) != LightningLearner.MAGIC:
+                raise ValueError("Invalid magic bytes")
+            (header_len,) = struct.unpack_from("!I", data, len(LightningLearner.MAGIC))
+            header = json.loads(bytes(data[len(LightningLearner.MAGIC) + 4: len(LightningLearner.MAGIC) + 4 + header_len]))
+            data_start = LightningLearner.__align(len(LightningLearner.MAGIC) + 4 + header_len)
+
+            # If the layout is the same as the local model, the cached layout is used
+            layout, layout_hash, _ = self.__get_layout()
+            if header["layout"] != layout_hash:
+                layout = []
+                for key, dtype, shape, offset in header["tensors"]:
+                    dtype = getattr(torch, dtype)
+                    if not isinstance(dtype, torch.dtype):
+                        raise ValueError("Invalid dtype")
+                    numel = 1
+                    for dim in shape:
+                        numel *= dim
+                    layout.append((key, dtype, tuple(shape), offset, numel))
+
+            # Tensors are views of the received buffer (no copies)
+            params = OrderedDict()
+            for key, dtype, shape, offset, numel in layout:
+                if numel == 0:
+                    params[key] = torch.empty(shape, dtype=dtype)
+                else:
+                    params[key] = torch.frombuffer(data, dtype=dtype, count=numel, offset=data_start + offset).view(shape)
+
+            # Reconstruct the compressed model
+            if header.get("compression") is not None:
+                if compressor is None:
+                    raise ValueError("Compressed parameters without compression state")
+                params = compressor.decompress(params, header["compression"])
             return (
-                OrderedDict({k: torch.tensor(v) for k, v in params_dict}),
-                contributors,
-                weight,
+                params,
+                header["contributors"],
+                header["weight"],
             )
-        except DecodingParamsError:
-            raise DecodingParamsError("Error decoding parameters")
+        except Exception as e:
+            raise DecodingParamsError("Error decoding parameters: {}".format(e))
 
     def check_parameters(self, params):
+        layout, _, _ = self.__get_layout()
         # Check ordered dict keys
-        if set(params.keys()) != set(self.model.state_dict().keys()):
+        if set(params.keys()) != set(key for key, _, _, _, _ in layout):
             return False
         # Check tensor shapes
-        for key, value in params.items():
-            if value.shape != self.model.state_dict()[key].shape:
+        for key, _, shape, _, _ in layout:
+            if tuple(params[key].shape) != shape:
                 return False
         return True
 
@@ -113,9 +276,16 @@ class LightningLearner(NodeLearner):
     def fit(self):
         try:
             if self.epochs > 0:
-                self.create_trainer()
+                if self.__can_reuse_trainer():
+                    # The trainer stopped at max_epochs, the round trains the next epochs
+                    self.__trainer.fit_loop.max_epochs = self.__trainer.current_epoch + self.epochs
+                    self.__trainer.should_stop = False
+                    self.__reset_step()
+                else:
+                    self.create_trainer()
                 self.__trainer.fit(self.model, self.data)
-                self.__trainer = None
+                if not self.__reuse_trainer:
+                    self.__trainer = None
         except Exception as e:
             logging.error("Something went wrong with pytorch lightning. {}".format(e))
 
@@ -124,12 +294,28 @@ class LightningLearner(NodeLearner):
             self.__trainer.should_stop = True
             self.__trainer = None
 
-    def evaluate(self):
+    def evaluate(self, params=None):
         try:
-            if self.epochs > 0:
-                self.create_trainer()
-                self.__trainer.test(self.model, self.data, verbose=True)
-                self.__trainer = None
+            if self.epochs > 0 and params is not None:
+                trainer = Trainer(
+                    callbacks=[],
+                    accelerator=self.config.participant["device_args"]["accelerator"],
+                    devices="auto",
+                    logger=SnapshotLogger(self.logger),
+                    enable_checkpointing=False,
+                    enable_model_summary=False,
+                    enable_progress_bar=False,
+                )
+                # Only the test dataloader: the datamodule (and its hooks) belongs to the trainer of the fit, which can be running
+                trainer.test(self.get_evaluation_model(params), dataloaders=self.data.test_dataloader(), verbose=False)
+            elif self.epochs > 0:
+                if self.__can_reuse_trainer():
+                    self.__reset_step()
+                else:
+                    self.create_trainer()
+                self.__trainer.test(self.model, self.data, verbose=not self.__headless)
+                if not self.__reuse_trainer:
+                    self.__trainer = None
                 # results = self.__trainer.test(self.model, self.data, verbose=True)
                 # loss = results[0]["Test/Loss"]
                 # metric = results[0]["Test/Accuracy"]
@@ -142,6 +328,21 @@ class LightningLearner(NodeLearner):
             logging.error("Something went wrong with pytorch lightning. {}".format(e))
             return None
 
+    def get_evaluation_model(self, params):
+        """
+        Get the model used to evaluate parameter snapshots (a copy of the model, created once), with the parameters of a snapshot.
+
+        Args:
+            params: The parameters of the snapshot.
+
+        Returns:
+            The copy of the model.
+        """
+        if self.__evaluation_model is None:
+            self.__evaluation_model = copy.deepcopy(self.model)
+        self.__evaluation_model.load_state_dict(params)
+        return self.__evaluation_model
+
     def log_validation_metrics(self, loss, metric, round=None, name=None):
         self.logger.log_metrics({"Test/Loss": loss, "Test/Accuracy": metric}, step=self.logger.global_step)
         pass
@@ -154,6 +355,8 @@ class LightningLearner(NodeLearner):
 
     def init(self):
         self.close()
+        # A new experiment starts with a new trainer
+        self.__trainer = None
 
     def close(self):
         if self.logger is not None:
@@ -164,8 +367,47 @@ class LightningLearner(NodeLearner):
         self.logger.local_step = 0
         pass
 
+    def __can_reuse_trainer(self):
+        """
+        Check if the trainer can be reused (``training_args.reuse_trainer`` and a trainer was created).
+
+        Reusing it relies on internals of the fit loop of Lightning (``fit_loop.max_epochs`` and ``fit_loop.epoch_loop._batches_that_stepped``,
+        tested with lightning 2.6). If they are missing, a new trainer is created for each fit and evaluation.
+
+        Returns:
+            True if the trainer can be reused.
+        """
+        if not self.__reuse_trainer or self.__trainer is None:
+            return False
+        fit_loop = getattr(self.__trainer, "fit_loop", None)
+        if hasattr(fit_loop, "max_epochs") and hasattr(getattr(fit_loop, "epoch_loop", None), "_batches_that_stepped"):
+            return True
+        logging.warning("[LightningLearner] The trainer cannot be reused with this version of lightning, creating a new one")
+        self.__trainer = None
+        return False
+
+    def __reset_step(self):
+        """
+        Restart the step of the reused trainer, so the metrics are logged with the same steps as a new trainer (the logger adds the
+        steps of the previous rounds, see ``finalize_round``).
+        """
+        self.__trainer.fit_loop.epoch_loop._batches_that_stepped = 0
+
     def create_trainer(self):
         logging.info("[Learner] Creating trainer with accelerator: {}".format(self.config.participant["device_args"]["accelerator"]))
+        if self.__headless:
+            self.__trainer = Trainer(
+                callbacks=[],
+                max_epochs=self.epochs,
+                accelerator=self.config.participant["device_args"]["accelerator"],
+                devices="auto",
+                logger=self.logger,
+                log_every_n_steps=20,
+                enable_checkpointing=False,
+                enable_model_summary=False,
+                enable_progress_bar=False,
+            )
+            return
         progress_bar = RichProgressBar(
             theme=RichProgressBarTheme(
                 description="green_yellow",
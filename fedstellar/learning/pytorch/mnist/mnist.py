@@ -25,9 +25,35 @@ from torch.utils.data import DataLoader, Subset, random_split
 from torchvision import transforms
 from torchvision.datasets import MNIST
 
+from fedstellar.learning.pytorch.datastore import DatasetStore
+
 torch.multiprocessing.set_sharing_strategy("file_system")
 
 
+class StoredMNIST(MNIST):
+    """
+    MNIST memory mapped from the dataset store (``data_args.shared_store``).
+
+    Args:
+        sort: Sort the dataset by target (non-IID partitions). The sorted dataset is kept in the store too.
+    """
+
+    def __init__(self, root, train=True, transform=None, target_transform=None, download=False, sort=False):
+        self.sort = sort
+        super().__init__(root, train=train, transform=transform, target_transform=target_transform, download=download)
+
+    def _load_data(self):
+        name = "mnist_{}{}".format("train" if self.train else "test", "_sorted" if self.sort else "")
+        return DatasetStore.get_tensors(self.root, name, self.__load)
+
+    def __load(self):
+        data, targets = MNIST._load_data(self)
+        if self.sort:
+            sorted_indexes = targets.sort()[1]
+            data, targets = data[sorted_indexes], targets[sorted_indexes]
+        return data, targets
+
+
 #######################################
 #    FederatedDataModule for MNIST    #
 #######################################
@@ -43,6 +69,7 @@ class MNISTDataModule(LightningDataModule):
         batch_size: The batch size of the data.
         num_workers: The number of workers of the data.
         val_percent: The percentage of the validation set.
+        shared_store: Memory map the dataset from the dataset store (shared by the participants of the host).
     """
 
     # Singleton
@@ -57,6 +84,7 @@ class MNISTDataModule(LightningDataModule):
             num_workers=4,
             val_percent=0.1,
             iid=True,
+            shared_store=False,
     ):
         super().__init__()
         self.sub_id = sub_id
@@ -69,6 +97,16 @@ class MNISTDataModule(LightningDataModule):
         if not os.path.exists(f"{sys.path[0]}/data"):
             os.makedirs(f"{sys.path[0]}/data")
 
+        if shared_store:
+            if MNISTDataModule.mnist_train is None:
+                MNISTDataModule.mnist_train = StoredMNIST(
+                    f"{sys.path[0]}/data", train=True, download=True, transform=transforms.ToTensor(), sort=not iid
+                )
+            if MNISTDataModule.mnist_val is None:
+                MNISTDataModule.mnist_val = StoredMNIST(
+                    f"{sys.path[0]}/data", train=False, download=True, transform=transforms.ToTensor(), sort=not iid
+                )
+
         if MNISTDataModule.mnist_train is None:
             MNISTDataModule.mnist_train = MNIST(
                 f"{sys.path[0]}/data", train=True, download=True, transform=transforms.ToTensor()
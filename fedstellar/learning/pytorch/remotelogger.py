@@ -173,6 +173,15 @@ class FedstellarWBLogger(Logger):
         else:
             self.experiment.log(metrics)
 
+    @rank_zero_only
+    def log_round_metrics(self, metrics: Mapping[str, float], step: int = 0) -> None:
+        """
+        Log metrics at a step of the current round, without updating the step of the round (``local_step``).
+        It is used by the evaluations that run in the background while the trainer logs the metrics of the round.
+        """
+        metrics = _add_prefix(metrics, self._prefix, self.LOGGER_JOIN_CHAR)
+        self.experiment.log(dict(metrics, **{"trainer/global_step": self.global_step + step}))
+
     @rank_zero_only
     def log_table(
             self,
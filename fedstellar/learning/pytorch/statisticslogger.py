@@ -133,20 +133,29 @@ class FedstellarLogger(Logger):
         assert rank_zero_only.rank == 0, "experiment tried to log from global_rank != 0"
         # FL round information
         self.local_step = step
-        __step = self.global_step + self.local_step
+        self.__write_metrics(metrics, self.global_step + self.local_step)
 
+    @rank_zero_only
+    def log_round_metrics(self, metrics: Mapping[str, float], step: int = 0) -> None:
+        """
+        Log metrics at a step of the current round, without updating the step of the round (``local_step``).
+        It is used by the evaluations that run in the background while the trainer logs the metrics of the round.
+        """
+        self.__write_metrics(metrics, self.global_step + step)
+
+    def __write_metrics(self, metrics: Mapping[str, float], step: int) -> None:
         metrics = _add_prefix(metrics, self._prefix, self.LOGGER_JOIN_CHAR)
-        # logging.info(f"[Statisticslogger] Logging metrics: {metrics}, step: {__step}")
+        # logging.info(f"[Statisticslogger] Logging metrics: {metrics}, step: {step}")
 
         for k, v in metrics.items():
             if isinstance(v, Tensor):
                 v = v.item()
 
             if isinstance(v, dict):
-                self.experiment.add_scalars(k, v, __step)
+                self.experiment.add_scalars(k, v, step)
             else:
                 try:
-                    self.experiment.add_scalar(k, v, __step)
+                    self.experiment.add_scalar(k, v, step)
                 # todo: specify the possible exception
                 except Exception as ex:
                     m = f"\n you tried to log {v} which is currently not supported. Try a dict or a scalar/tensor."
@@ -15,11 +15,16 @@ from sklearn.model_selection import train_test_split
 from torch.utils.data import DataLoader, Subset, random_split, Dataset
 from torchvision.datasets import utils
 
+from fedstellar.learning.pytorch.datastore import DatasetStore
+
 torch.multiprocessing.set_sharing_strategy("file_system")
 
 
 class SYSCALL(Dataset):
-    def __init__(self, sub_id, number_sub, root_dir, train=True, transform=None, target_transform=None, download=False):
+    # Whole datasets loaded in the process (shared by the nodes, read-only)
+    datasets = {}
+
+    def __init__(self, sub_id, number_sub, root_dir, train=True, transform=None, target_transform=None, download=False, shared_store=False):
         self.transform = transform
         self.target_transform = target_transform
         self.sub_id = sub_id
@@ -45,8 +50,15 @@ class SYSCALL(Dataset):
         else:
             data_file = self.test_file
 
-        # Whole dataset
-        data_and_targets = torch.load(data_file)
+        # Whole dataset (loaded once per process)
+        if data_file not in SYSCALL.datasets:
+            if shared_store:
+                # Memory mapped from the dataset store (shared by the participants of the host)
+                name = "syscall_train" if self.train else "syscall_test"
+                SYSCALL.datasets[data_file] = DatasetStore.get_tensors(self.root, name, lambda: torch.load(data_file)[:2])
+            else:
+                SYSCALL.datasets[data_file] = torch.load(data_file)
+        data_and_targets = SYSCALL.datasets[data_file]
         self.data, self.targets = data_and_targets[0], data_and_targets[1]
 
     def __getitem__(self, index):
@@ -144,6 +156,7 @@ class SYSCALLDataModule(LightningDataModule):
             num_workers=4,
             val_percent=0.01,
             root_dir=None,
+            shared_store=False,
     ):
         super().__init__()
         self.sub_id = sub_id
@@ -153,8 +166,8 @@ class SYSCALLDataModule(LightningDataModule):
         self.val_percent = val_percent
         self.root_dir = root_dir
 
-        self.train = SYSCALL(sub_id=self.sub_id, number_sub=self.number_sub, root_dir=root_dir, train=True, download=True)
-        self.test = SYSCALL(sub_id=self.sub_id, number_sub=self.number_sub, root_dir=root_dir, train=False, download=True)
+        self.train = SYSCALL(sub_id=self.sub_id, number_sub=self.number_sub, root_dir=root_dir, train=True, download=True, shared_store=shared_store)
+        self.test = SYSCALL(sub_id=self.sub_id, number_sub=self.number_sub, root_dir=root_dir, train=False, download=True, shared_store=shared_store)
 
         if len(self.test.data) < self.number_sub:
             raise ValueError("Too many partitions")
@@ -0,0 +1,260 @@
+#
+# This file an adaptation and extension of the p2pfl library (https://pypi.org/project/p2pfl/).
+# Refer to the LICENSE file for licensing information.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+import logging
+import threading
+import time
+
+from fedstellar.communication_protocol import CommunicationProtocol
+from fedstellar.config.config import Config
+from fedstellar.node_connection import NodeConnection
+from fedstellar.utils.observer import Events
+
+
+#########################
+#    LoopbackNetwork    #
+#########################
+
+
+class LoopbackNetwork:
+    """
+    Registry of the nodes that use the loopback transport (``TRANSPORT = "loopback"``) in this process.
+    A node is registered with its address when it starts, so other nodes of the process can connect to it.
+    """
+
+    __nodes = {}
+    __lock = threading.Lock()
+    __next_port = 49152
+
+    @staticmethod
+    def register(addr, node):
+        """
+        Register a node.
+
+        Args:
+            addr: (host, port) of the node.
+            node: The node.
+        """
+        LoopbackNetwork.__lock.acquire()
+        LoopbackNetwork.__nodes[addr] = node
+        LoopbackNetwork.__lock.release()
+
+    @staticmethod
+    def unregister(addr):
+        """
+        Unregister a node.
+
+        Args:
+            addr: (host, port) of the node.
+        """
+        LoopbackNetwork.__lock.acquire()
+        LoopbackNetwork.__nodes.pop(addr, None)
+        LoopbackNetwork.__lock.release()
+
+    @staticmethod
+    def get_node(addr):
+        """
+        Args:
+            addr: (host, port) of the node.
+
+        Returns:
+            The node registered with the address, or None.
+        """
+        return LoopbackNetwork.__nodes.get(addr)
+
+    @staticmethod
+    def get_free_port():
+        """
+        Returns:
+            int: A port that is not used by the registered nodes (there are no sockets, so it is just an identifier).
+        """
+        LoopbackNetwork.__lock.acquire()
+        while any([port == LoopbackNetwork.__next_port for _, port in LoopbackNetwork.__nodes.keys()]):
+            LoopbackNetwork.__next_port += 1
+        port = LoopbackNetwork.__next_port
+        LoopbackNetwork.__next_port += 1
+        LoopbackNetwork.__lock.release()
+        return port
+
+
+################################
+#    LoopbackNodeConnection    #
+################################
+
+
+class LoopbackNodeConnection(NodeConnection):
+    """
+    Connection to a node of the same process (loopback transport). There are no sockets nor threads: frames are put
+    (without copying or encrypting them) in the inbox of the node at the other side, whose thread processes them in order.
+
+    Connections are created in pairs (see ``pair``). Closing one side puts an end of connection in the inbox of both nodes.
+    Like a socket with a full buffer, sending a model blocks until the other node takes it from its inbox (at most ``NODE_TIMEOUT`` seconds),
+    so models are not queued faster than they are processed.
+    It has the same interface (and notifies the same events) as ``NodeConnection``.
+
+    Args:
+        parent_node_name: The name of the parent node of this connection.
+        addr: The address of the node that is connected to.
+        inbox: The inbox (queue) of the parent node.
+        processed_messages: Set of processed messages shared by all the connections of the node.
+    """
+
+    ##############
+    #    Init    #
+    ##############
+
+    def __init__(self, parent_node_name, addr, inbox, config: Config = None, processed_messages=None):
+        NodeConnection.__init__(
+            self, parent_node_name, None, addr, None, config=config, processed_messages=processed_messages
+        )
+        self.__terminate_flag = threading.Event()
+        self.__closed = False
+        self.__inbox = inbox
+        self.__peer = None
+        self.__model_taken = threading.Event()
+
+    @staticmethod
+    def pair(nc1, nc2):
+        """
+        Pair two connections (each one is the other side of the other).
+        """
+        nc1.__peer = nc2
+        nc2.__peer = nc1
+
+    ###################
+    #    Main Loop    #
+    ###################
+
+    def start(self, force=False):
+        """
+        Start the connection. Frames are processed by the thread of the parent node (see ``deliver``).
+
+        Args:
+            force: Determine if connection is going to keep alive even if it should not.
+        """
+        self.notify(Events.NODE_CONNECTED_EVENT, (self, force))
+
+    def deliver(self, frame_type, msg):
+        """
+        Process a frame sent by the other side. It is called by the thread of the parent node.
+
+        Args:
+            frame_type: The type of the frame, None if the connection was closed.
+            msg: The payload of the frame.
+        """
+        if frame_type is None:
+            self.__close()
+            return
+        if frame_type == CommunicationProtocol.FRAME_PARAMS_END:
+            self.__peer.__model_taken.set()
+        if self.__terminate_flag.is_set():
+            return
+        try:
+            error = self.process_frame(frame_type, msg)
+        except Exception as e:
+            logging.info(
+                "[LOOPBACK_NODE_CONNECTION] Exception: {}".format(str(e))
+            )
+            error = True
+        if error:
+            logging.info(
+                "[LOOPBACK_NODE_CONNECTION] An error happened. Frame type: {} | Length: {}".format(frame_type, len(msg))
+            )
+            self.__close()
+
+    def __close(self):
+        # Down Connection (both sides)
+        if self.__closed:
+            return
+        self.__closed = True
+        self.__terminate_flag.set()
+        self.__model_taken.set()
+        self.__peer.__model_taken.set()
+        self.__peer.__inbox.put((self.__peer, None, None))
+        logging.info("[LOOPBACK_NODE_CONNECTION] Closed connection: {}".format(self.get_name()))
+        self.notify(Events.END_CONNECTION_EVENT, self)
+
+    def stop(self, local=False):
+        """
+        Stop the connection. The end of the connection is processed by the thread of the parent node.
+
+        Args:
+            local: If true, the connection will be closed without notifying the other node.
+        """
+        if not local:
+            self.send(CommunicationProtocol.build_stop_msg())
+        self.__terminate_flag.set()
+        self.__inbox.put((self, None, None))
+
+    ##################
+    #    Messages    #
+    ##################
+
+    def send(self, data, frame_type=CommunicationProtocol.FRAME_TEXT):
+        """
+        Send a message to the other node (it is put in its inbox).
+
+        Args:
+            data: The message to send.
+            frame_type: The type of the frame (text by default).
+
+        Returns:
+            True if the message was sent, False otherwise.
+        """
+        if not self.__terminate_flag.is_set():
+            self.record_frame_sent()
+            if frame_type == CommunicationProtocol.FRAME_PARAMS_END:
+                self.__model_taken.clear()
+                self.__peer.__inbox.put((self.__peer, frame_type, data))
+                self.__model_taken.wait(self.config.participant["NODE_TIMEOUT"])
+            else:
+                self.__peer.__inbox.put((self.__peer, frame_type, data))
+            return True
+        return False
+
+    def is_send_queue_full(self):
+        """
+        Returns:
+            False, there is no send queue.
+        """
+        return False
+
+    def get_pending_models(self):
+        """
+        Returns:
+            0, there is no send queue (``send_model`` returns when the model is taken).
+        """
+        return 0
+
+    def send_model(self, encoded_msgs):
+        """
+        Send a model (its fragments) to the other node. The fragments are not copied, so there is no send queue:
+        it returns when the other node takes the model (or after ``NODE_TIMEOUT`` seconds).
+
+        Args:
+            encoded_msgs: List of (frame_type, fragment) of the model.
+
+        Returns:
+            True if the model was sent, False otherwise.
+        """
+        start = time.monotonic()
+        for frame_type, msg in encoded_msgs:
+            if not self.send(msg, frame_type):
+                return False
+        self.record_model_sent(sum(len(msg) for _, msg in encoded_msgs), time.monotonic() - start)
+        return True
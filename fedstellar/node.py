@@ -14,6 +14,7 @@
 # You should have received a copy of the GNU General Public License
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 #
+import concurrent.futures
 import json
 import logging
 import math
@@ -41,11 +42,14 @@ from lightning.pytorch.loggers import WandbLogger, CSVLogger
 from fedstellar.base_node import BaseNode
 from fedstellar.communication_protocol import CommunicationProtocol
 from fedstellar.config.config import Config
+from fedstellar.gossip_scheduler import GossipScheduler
 from fedstellar.learning.aggregators.fedavg import FedAvg
 from fedstellar.learning.exceptions import DecodingParamsError, ModelNotMatchingError
+from fedstellar.learning.pytorch.compression import ModelCompressor
 from fedstellar.learning.pytorch.lightninglearner import LightningLearner
 from fedstellar.role import Role
 from fedstellar.utils.observer import Events, Observer
+from fedstellar.utils.round_state import RoundState
 
 
 class Node(BaseNode):
@@ -102,9 +106,12 @@ class Node(BaseNode):
         # Learning
         self.round = None
         self.totalrounds = None
-        self.__model_initialized = False
+        self.__round_state = RoundState()  # model initialization, aggregation and neighbors conditions of the learning process
         self.__initial_neighbors = []
         self.__start_thread_lock = threading.Lock()
+        # Evaluations of parameter snapshots (training_args.background_evaluation), one at a time
+        self.__evaluation_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="evaluation-" + str(idx))
+        self.__evaluation = None
 
         # Learner and learner logger
         # log_model="all" to log model
@@ -138,6 +145,21 @@ class Node(BaseNode):
 
         self.shared_metrics = False
 
+        # Encoded models (params messages) to gossip, encoded once for all the neighbors
+        # Key: (round, frozenset of contributors, compression settings) or (round, None, compression settings) at diffusion
+        self.__encoded_models = {}
+        self.__encoded_models_lock = threading.Lock()
+
+        # Scheduler of the model gossip
+        self.__gossip_scheduler = GossipScheduler.create(self.config)
+
+        # Compression of the models sent to the neighbors (negotiated with each neighbor)
+        self.__compression = (
+            self.config.participant["compression_args"]["quantization"],
+            self.config.participant["compression_args"]["delta"],
+            self.config.participant["compression_args"]["topk"],
+        )
+
         # Store the parameters of the model
         self.__stored_model_parameters = []
         self.__timeout = datetime.now()
@@ -149,10 +171,6 @@ class Node(BaseNode):
 
         # Locks
         self.__wait_votes_ready_lock = threading.Lock()
-        self.__finish_aggregation_lock = threading.Lock()
-        self.__finish_aggregation_lock.acquire()
-        self.__wait_init_model_lock = threading.Lock()
-        self.__wait_init_model_lock.acquire()
         # Grace period to wait for last transmission using Aggregator thread
         self.__wait_finish_experiment_lock = threading.Lock()
         self.__wait_finish_experiment_lock.acquire()
@@ -191,6 +209,7 @@ class Node(BaseNode):
         """
         if self.round is not None:
             self.__stop_learning()
+        self.__evaluation_executor.shutdown(wait=False)
         self.learner.close()
         super().stop()
 
@@ -221,6 +240,19 @@ class Node(BaseNode):
     #         Network Learning Management         #
     ###############################################
 
+    def wait_network(self, n_nodes, timeout):
+        """
+        Wait until the node knows (by heartbeats) ``n_nodes`` nodes of the network, itself included.
+
+        Args:
+            n_nodes: Number of nodes of the network.
+            timeout: Maximum time to wait.
+
+        Returns:
+            bool: True if the nodes are known.
+        """
+        return self.__round_state.wait_for(lambda: len(self.get_network_nodes()) >= n_nodes, timeout)
+
     def set_start_learning(self, rounds=1, epochs=1):
         """
         Start the learning process in the entire network.
@@ -247,10 +279,7 @@ class Node(BaseNode):
             )
             # Initialize model
             self.broadcast(CommunicationProtocol.build_model_initialized_msg())
-            self.__wait_init_model_lock.release()
-            self.__model_initialized = (
-                True  # esto seguramente sobre, con locks es suficiente
-            )
+            self.__round_state.set_model_initialized()
             # Learning Thread
             self.__start_learning_thread(rounds, epochs)
         else:
@@ -288,6 +317,7 @@ class Node(BaseNode):
         """
         self.__start_thread_lock.acquire()  # Used to avoid create duplicated training threads
         if self.round is None:
+            self.__round_state.start()
             self.round = 0
             self.totalrounds = rounds
             self.learner.init()
@@ -298,18 +328,18 @@ class Node(BaseNode):
             # Send the model parameters (initial model) to neighbors
             self.__gossip_model_difusion(initialization=True)
 
-            # Wait to guarantee new connection heartbeats convergence and fix neighbors
+            # Wait for the heartbeats of the neighbors (they are part of the train set only if they are in the network nodes),
+            # at most WAIT_HEARTBEATS_CONVERGENCE seconds
             wait_time = self.config.participant["WAIT_HEARTBEATS_CONVERGENCE"] - (time.time() - begin)
             if wait_time > 0:
-                time.sleep(wait_time)
+                self.__round_state.wait_for(self.__neighbors_in_network, wait_time)
             # TODO: Check this parameter
-            self.__initial_neighbors = (
+            self.__initial_neighbors = set(
                 self.get_neighbors()
             )  # used to restore the original list of neighbors after the learning round
 
             logging.info("[NODE.__start_learning] Learning started in node {} -> Round: {} | Epochs: {}".format(self.get_name(), self.round, epochs))
             self.learner.set_epochs(epochs)
-            self.learner.create_trainer()
             self.__train_step()
             logging.info("[NODE.__start_learning] Thread __start_learning finished in node {}".format(self.get_name()))
 
@@ -321,6 +351,8 @@ class Node(BaseNode):
         # Rounds
         self.round = None
         self.totalrounds = None
+        # Wake up the learning thread
+        self.__round_state.finish()
         # Leraner
         self.learner.interrupt_fit()
         # Aggregator
@@ -337,23 +369,31 @@ class Node(BaseNode):
     #         Model Aggregation         #
     ####################################
 
-    def add_model(self, m):
+    def add_model(self, m, nc=None):
         """
         Add a model. If the model isn't inicializated, the recieved model is used for it. Otherwise, the model is aggregated using the **aggregator**.
 
         Args:
             m: Encoded model. Contains model and their contributors
+            nc: Connection the model was received from (its compression state is used to reconstruct the model).
         """
+        # Decode the model (even if learning is not running, the compression state has to follow the models sent by the neighbor)
+        try:
+            (
+                decoded_model,
+                contributors,
+                weight,
+            ) = self.learner.decode_parameters(m, nc.get_compressor() if nc is not None else None)
+        except DecodingParamsError as e:
+            logging.error("[NODE] Error decoding parameters: " + str(e))
+            self.stop()
+            return
+
         # Check if Learning is running
         if self.round is not None:
             try:
-                if self.__model_initialized:
+                if self.__round_state.is_model_initialized():
                     # Add model to aggregator
-                    (
-                        decoded_model,
-                        contributors,
-                        weight,
-                    ) = self.learner.decode_parameters(m)
                     logging.info("[NODE.add_model] Model received from {} --using--> {} in the other node | Now I add the model using self.aggregator.add_model()".format(contributors, '__gossip_model_diffusion' if contributors is None and weight is None else '__gossip_model_aggregation'))
                     if self.learner.check_parameters(decoded_model):
                         models_added = self.aggregator.add_model(
@@ -370,17 +410,12 @@ class Node(BaseNode):
                     else:
                         raise ModelNotMatchingError("Not matching models")
                 else:
-                    self.__model_initialized = True
                     logging.info("[NODE] Initialization Model Weights")
                     # Initialize model
-                    model, _, _ = self.learner.decode_parameters(m)
-                    self.learner.set_parameters(model)
-                    self.__wait_init_model_lock.release()
-                    self.broadcast(CommunicationProtocol.build_model_initialized_msg())
-
-            except DecodingParamsError as e:
-                logging.error("[NODE] Error decoding parameters: " + str(e))
-                self.stop()
+                    self.learner.set_parameters(decoded_model)
+                    self.__clear_encoded_models()
+                    if self.__round_state.set_model_initialized():
+                        self.broadcast(CommunicationProtocol.build_model_initialized_msg())
 
             except ModelNotMatchingError as e:
                 logging.error("[NODE] Models not matching: " + str(e))
@@ -454,6 +489,8 @@ class Node(BaseNode):
                     self.__gossip_model_difusion()
                 else:
                     self.__gossip_model_aggregation()
+                    # The round finishes when the aggregation is done (the aggregator notifies it at most AGGREGATION_TIMEOUT seconds after the first model)
+                    self.__round_state.wait_aggregation_finished(self.round, self.config.participant["AGGREGATION_TIMEOUT"])
 
         elif self.config.participant["device_args"]["role"] == Role.TRAINER:
             logging.info("[NODE.__train_step] Role.TRAINER process...")
@@ -486,8 +523,9 @@ class Node(BaseNode):
 
                 self.__gossip_model_aggregation()
 
+                # Wait for the aggregated model (or the aggregation of the models received)
                 self.aggregator.set_waiting_aggregated_model()
-                time.sleep(5)
+                self.__round_state.wait_aggregation_finished(self.round, self.config.participant["AGGREGATION_TIMEOUT"])
 
         elif self.config.participant["device_args"]["role"] == Role.PROXY:
             # If the node is a proxy, it stores the parameters received from the neighbors.
@@ -534,6 +572,14 @@ class Node(BaseNode):
         if self.round is not None:
             self.__on_round_finished()
 
+    def __neighbors_in_network(self):
+        """
+        Returns:
+            bool: True if a heartbeat has been received from every neighbor.
+        """
+        network_nodes = self.get_network_nodes()
+        return all(nc.get_name() in network_nodes for nc in self.get_neighbors())
+
     def __validate_train_set(self):
         # Verify if node set is valid (can happend that a node was down when the votes were being processed)
         for tsn in self.__train_set:
@@ -597,15 +643,43 @@ class Node(BaseNode):
         logging.info("[NODE.__train] Start training...")
         print("[NODE.__train] Start training...")
         self.learner.fit()
+        self.__clear_encoded_models()
         logging.info("[NODE.__train] Finish training...")
         print("[NODE.__train] Finish training...")
 
-    def __evaluate(self):
-        logging.info("[NODE.__evaluate] Start evaluation...")
-        print("[NODE.__evaluate] Start evaluation...")
-        self.learner.evaluate()
-        logging.info("[NODE.__evaluate] Finish evaluation...")
-        print("[NODE.__evaluate] Finish evaluation...")
+    def __evaluate(self, background=None):
+        """
+        Evaluate the model. With ``training_args.background_evaluation``, a snapshot of the parameters is evaluated in the
+        evaluation thread, so the training of the round starts without waiting for it (see ``__wait_evaluation``).
+
+        Args:
+            background: Evaluate in the background (None to use the configuration).
+        """
+        if background is None:
+            background = self.config.participant["training_args"]["background_evaluation"]
+        if not background:
+            logging.info("[NODE.__evaluate] Start evaluation...")
+            print("[NODE.__evaluate] Start evaluation...")
+            self.learner.evaluate()
+            logging.info("[NODE.__evaluate] Finish evaluation...")
+            print("[NODE.__evaluate] Finish evaluation...")
+            return
+        self.__wait_evaluation()
+        snapshot = {k: v.detach().clone() for k, v in self.learner.get_parameters().items()}
+        logging.info("[NODE.__evaluate] Start evaluation (background)...")
+        self.__evaluation = self.__evaluation_executor.submit(self.learner.evaluate, snapshot)
+
+    def __wait_evaluation(self):
+        """
+        Wait for the evaluation running in the background (if any).
+        """
+        if self.__evaluation is not None:
+            try:
+                self.__evaluation.result()
+                logging.info("[NODE.__evaluate] Finish evaluation (background)...")
+            except Exception as e:
+                logging.error("[NODE.__evaluate] Background evaluation failed: {}".format(e))
+            self.__evaluation = None
         # if results is not None:
         #     logging.info(
         #         "[NODE] Evaluated. Loss: {}, Metric: {}".format(
@@ -636,7 +710,10 @@ class Node(BaseNode):
                 self.rm_neighbor(nc)
         # Set Next Round
         self.aggregator.clear()
+        self.__clear_encoded_models()
         logging.info("[NODE] Finalizing round: {}".format(self.round))
+        # The metrics of the evaluation are logged at the steps of the round
+        self.__wait_evaluation()
         self.learner.finalize_round()  # TODO: Fix to improve functionality
         self.round = self.round + 1
         self.learner.logger.log_metrics({"Round": self.round}, step=self.learner.logger.global_step)
@@ -659,8 +736,8 @@ class Node(BaseNode):
             self.__train_step()
         else:
             logging.debug("[NODE] FL finished | Models aggregated = {}".format([nc.get_models_aggregated() for nc in self.get_neighbors()]))
-            # At end, all nodes compute metrics
-            self.__evaluate()
+            # At end, all nodes compute metrics (there is no training to overlap with)
+            self.__evaluate(background=False)
             # Finish
             logging.info(
                 "[NODE] FL experiment finished | Round: {} | Total rounds: {} | [!] Both to None".format(
@@ -669,7 +746,7 @@ class Node(BaseNode):
             )
             self.round = None
             self.totalrounds = None
-            self.__model_initialized = False
+            self.__round_state.finish()
             # logging.info("[NODE] FL experiment finished | __stop_learning()")
             # self.__stop_learning()  # TODO: 20-12-22 | This is a temporal fix to avoid the node to continue training after the FL experiment is finished
 
@@ -694,44 +771,140 @@ class Node(BaseNode):
         # Anonymous functions
         candidate_condition = lambda nc: nc.get_name() in self.__train_set and len(nc.get_models_aggregated()) < len(self.__train_set)
         status_function = lambda nc: (nc.get_name(), len(nc.get_models_aggregated()))
-        model_function = lambda nc: self.aggregator.get_partial_aggregation(nc.get_models_aggregated())
+        missing_function = lambda nc: len(self.__train_set) - len(nc.get_models_aggregated())
+        model_function = lambda nc: self.__encode_partial_aggregation(nc.get_models_aggregated(), nc.get_compressor())
 
         # Gossip
-        self.__gossip_model(candidate_condition, status_function, model_function)
+        self.__gossip_model(candidate_condition, status_function, missing_function, model_function)
 
     def __gossip_model_difusion(self, initialization=False):
         logging.info("[NODE.__gossip_model_difusion] Gossiping...")
         # Send model parameters using gossiping
         # Wait a model (init or aggregated)
         if initialization:
-            self.__wait_init_model_lock.acquire()
+            self.__round_state.wait_model_initialized()
             logging.info("[NODE.__gossip_model_difusion] Initialization=True")
             candidate_condition = lambda nc: not nc.get_model_initialized()
         else:
-            self.__finish_aggregation_lock.acquire()
+            self.__round_state.wait_aggregation_finished(self.round)
             logging.info("[NODE.__gossip_model_difusion] Initialization=False")
             candidate_condition = lambda nc: nc.get_model_ready_status() < self.round
 
         # Anonymous functions
         status_function = lambda nc: nc.get_name()
-        model_function = lambda _: (
-            self.learner.get_parameters(),
-            None,
-            None,
-        )  # At diffusion, contributors are not relevant
+        missing_function = lambda nc: 1
+        model_function = lambda nc: self.__encode_local_model(nc.get_compressor())  # At diffusion, contributors are not relevant
 
         # Gossip
-        self.__gossip_model(candidate_condition, status_function, model_function)
+        self.__gossip_model(candidate_condition, status_function, missing_function, model_function)
+
+    def __encode_model(self, model, contributors, weight, compressor=None):
+        encoded_model = self.learner.encode_parameters(
+            params=model, contributors=contributors, weight=weight, compressor=compressor
+        )
+        logging.info("[NODE.__encode_model] Building params message | Contributors: {}".format(contributors))
+        return CommunicationProtocol.build_params_msg(encoded_model, self.config.participant["BLOCK_SIZE"])
+
+    def __get_encoded_model(self, key):
+        self.__encoded_models_lock.acquire()
+        encoded_msgs = self.__encoded_models.get(key)
+        self.__encoded_models_lock.release()
+        return encoded_msgs
+
+    def __set_encoded_model(self, key, encoded_msgs):
+        self.__encoded_models_lock.acquire()
+        self.__encoded_models[key] = encoded_msgs
+        self.__encoded_models_lock.release()
+
+    def __clear_encoded_models(self):
+        self.__encoded_models_lock.acquire()
+        self.__encoded_models = {}
+        self.__encoded_models_lock.release()
+
+    @staticmethod
+    def __get_compression_settings(compressor):
+        """
+        Returns:
+            The compression settings used with a connection (part of the key of the encoded models), None if the models are not compressed.
+        """
+        if compressor is None or not compressor.is_enabled():
+            return None
+        return compressor.get_settings()
 
-    def __gossip_model(self, candidate_condition, status_function, model_function):
+    def __encode_partial_aggregation(self, except_nodes, compressor=None):
+        """
+        Get the params messages of the partial aggregation. Neighbors missing the same contributors share the same messages,
+        so the aggregation and the encoding are only done once. If the models sent to the neighbor are differences (delta compression),
+        the messages are encoded for the neighbor.
+
+        Args:
+            except_nodes: Nodes to exclude.
+            compressor: The compression state of the connection.
+
+        Returns:
+            The params messages, or None if there is no model to send.
+        """
+        nodes = self.aggregator.get_partial_aggregation_nodes(except_nodes)
+        if not nodes:
+            return None
+        if compressor is not None and compressor.is_stateful():
+            model, contributors, weight = self.aggregator.get_partial_aggregation(except_nodes)
+            if model is None:
+                return None
+            return self.__encode_model(model, contributors, weight, compressor)
+        settings = Node.__get_compression_settings(compressor)
+        encoded_msgs = self.__get_encoded_model((self.round, frozenset(nodes), settings))
+        if encoded_msgs is None:
+            model, contributors, weight = self.aggregator.get_partial_aggregation(except_nodes)
+            if model is None:
+                return None
+            encoded_msgs = self.__encode_model(model, contributors, weight, compressor)
+            # Contributors could have changed (a model could be added meanwhile)
+            self.__set_encoded_model((self.round, frozenset(contributors), settings), encoded_msgs)
+        return encoded_msgs
+
+    def __encode_local_model(self, compressor=None):
+        """
+        Get the params messages of the local model (diffusion). It is encoded once per round (and compression settings),
+        except if the models sent to the neighbor are differences (delta compression).
+
+        Args:
+            compressor: The compression state of the connection.
+
+        Returns:
+            The params messages.
+        """
+        if compressor is not None and compressor.is_stateful():
+            return self.__encode_model(self.learner.get_parameters(), None, None, compressor)
+        settings = Node.__get_compression_settings(compressor)
+        encoded_msgs = self.__get_encoded_model((self.round, None, settings))
+        if encoded_msgs is None:
+            encoded_msgs = self.__encode_model(self.learner.get_parameters(), None, None, compressor)
+            self.__set_encoded_model((self.round, None, settings), encoded_msgs)
+        return encoded_msgs
+
+    def __gossip_model(self, candidate_condition, status_function, missing_function, model_function):
+        """
+        Gossip a model until the neighbors that need it (``candidate_condition``) have it. The neighbors of each iteration are selected by the gossip scheduler.
+
+        Args:
+            candidate_condition: Function that returns True if a neighbor needs the model.
+            status_function: Function that returns the status of a neighbor (gossip stops if it does not change in ``GOSSIP_EXIT_ON_X_EQUAL_ROUNDS`` periods).
+            missing_function: Function that returns the number of contributors a neighbor is missing.
+            model_function: Function that returns the params messages for a neighbor.
+        """
         logging.debug("[NODE.__gossip_model] Traceback", stack_info=True)
         # Initialize list with status of nodes in the last X iterations
         last_x_status = []
         j = 0
+        next_gossip = time.time()
 
         while True:
-            # Get time to calculate frequency
-            begin = time.time()
+            # A new period starts (not if the iteration was started by a status update of a neighbor)
+            periodic = time.time() >= next_gossip
+            if periodic:
+                next_gossip = time.time() + 1 / self.config.participant["GOSSIP_MODELS_FREC"]
+            changes = self.__round_state.get_changes()
 
             # If the trainning has been interrupted, stop waiting
             if self.round is None:
@@ -739,18 +912,16 @@ class Node(BaseNode):
                     "[NODE] Stopping model gossip process.")
                 return
 
-            # Get nodes which need models
-            logging.info("---------------------Feedback about neighbors---------------------")
-            logging.info("[NODE.__gossip_model] Neighbors: {}".format(self.get_neighbors()))
-            for nc in self.get_neighbors():
-                logging.info("---------------------Feedback about neighbor {}---------------------".format(nc))
-                logging.info("[NODE.__gossip_model] Neighbor: {} | My __train_set: {} | Nc.modelsaggregated: {}".format(nc, self.__train_set, nc.get_models_aggregated()))
-                logging.info("[NODE.__gossip_model] Neighbor: {} | Candidate_condition return: {}".format(nc, candidate_condition(nc)))
-                logging.info("[NODE.__gossip_model] Neighbor: {} | Status_function return: {}".format(nc, status_function(nc)))
-                logging.info("---------------------End of feedback about neighbor {}---------------------".format(nc))
-            logging.info("------------------------------------------------------------------")
-
-            nei = [nc for nc in self.get_neighbors() if candidate_condition(nc)]
+            # Get nodes which need models (a single snapshot of the neighbors per iteration)
+            neighbors = self.get_neighbors()
+            if logging.getLogger().isEnabledFor(logging.DEBUG):
+                logging.debug("[NODE.__gossip_model] Neighbors: {}".format(neighbors))
+                for nc in neighbors:
+                    logging.debug("[NODE.__gossip_model] Neighbor: {} | My __train_set: {} | Nc.modelsaggregated: {}".format(nc, self.__train_set, nc.get_models_aggregated()))
+                    logging.debug("[NODE.__gossip_model] Neighbor: {} | Candidate_condition return: {}".format(nc, candidate_condition(nc)))
+                    logging.debug("[NODE.__gossip_model] Neighbor: {} | Status_function return: {}".format(nc, status_function(nc)))
+
+            nei = [nc for nc in neighbors if candidate_condition(nc)]
             logging.info("[NODE.__gossip_model] Selected (to exclude) based on condition: {}".format(nei))
 
             # Determine end of gossip
@@ -758,55 +929,59 @@ class Node(BaseNode):
                 logging.info("[NODE] Gossip finished.")
                 return
 
-            # Save state of neighbors. If nodes are not responding gossip will stop
-            if len(last_x_status) != self.config.participant["GOSSIP_EXIT_ON_X_EQUAL_ROUNDS"]:
-                last_x_status.append([status_function(nc) for nc in nei])
-            else:
-                last_x_status[j] = str([status_function(nc) for nc in nei])
-                j = (j + 1) % self.config.participant["GOSSIP_EXIT_ON_X_EQUAL_ROUNDS"]
-
-                # Check if las messages are the same
-                for i in range(len(last_x_status) - 1):
-                    if last_x_status[i] != last_x_status[i + 1]:
-                        break
-                    logging.info(
-                        "[NODE] Gossiping exited for {} equal rounds.".format(
-                            self.config.participant["GOSSIP_EXIT_ON_X_EQUAL_ROUNDS"]
+            # Save state of neighbors (once per period). If nodes are not responding gossip will stop
+            if periodic:
+                if len(last_x_status) != self.config.participant["GOSSIP_EXIT_ON_X_EQUAL_ROUNDS"]:
+                    last_x_status.append([status_function(nc) for nc in nei])
+                else:
+                    last_x_status[j] = str([status_function(nc) for nc in nei])
+                    j = (j + 1) % self.config.participant["GOSSIP_EXIT_ON_X_EQUAL_ROUNDS"]
+
+                    # Check if las messages are the same
+                    for i in range(len(last_x_status) - 1):
+                        if last_x_status[i] != last_x_status[i + 1]:
+                            break
+                        logging.info(
+                            "[NODE] Gossiping exited for {} equal rounds.".format(
+                                self.config.participant["GOSSIP_EXIT_ON_X_EQUAL_ROUNDS"]
+                            )
                         )
-                    )
-                    return
+                        return
 
-            # Select a random subset of neighbors
-            samples = min(self.config.participant["GOSSIP_MODELS_PER_ROUND"], len(nei))
-            nei = random.sample(nei, samples)
-            logging.info("[NODE.__gossip_model] Selected a random subset of neighbors (to exclude): {}".format(nei))
+            # Select the neighbors of this iteration
+            nei = self.__gossip_scheduler.select(nei, missing_function)
+            logging.info("[NODE.__gossip_model] Selected a subset of neighbors (to exclude): {}".format(nei))
 
             # Generate and Send Model Partial Aggregations (model, node_contributors)
             for nc in nei:
-                model, contributors, weights = model_function(nc)
+                # Check the queue before encoding (compressed models can not be discarded once they are encoded)
+                if nc.is_send_queue_full():
+                    logging.info("[NODE.__gossip_model] Send queue of {} is full".format(nc))
+                    continue
+                encoded_msgs = model_function(nc)
                 # Send Partial Aggregation
-                if model is not None:
+                if encoded_msgs is not None:
                     logging.info(
                         "[NODE] Gossiping model to {}.".format(
                             nc.get_name()
                         )
                     )
-                    encoded_model = self.learner.encode_parameters(
-                        params=model, contributors=contributors, weight=weights
-                    )
-                    logging.info("[NODE.__gossip_model] Building params message | Contributors: {}".format(contributors))
-                    encoded_msgs = CommunicationProtocol.build_params_msg(encoded_model, self.config.participant["BLOCK_SIZE"])
                     logging.info("[NODE.__gossip_model] Sending params message to {}".format(nc))
-                    # Send Fragments
-                    for msg in encoded_msgs:
-                        nc.send(msg)
+                    # Queue the fragments (each connection sends them in its own writer)
+                    if nc.send_model(encoded_msgs):
+                        self.__gossip_scheduler.sent(nc, missing_function(nc))
+                    else:
+                        logging.info("[NODE.__gossip_model] Model not sent to {} (send queue full)".format(nc))
                 else:
                     logging.info("[NODE.__gossip_model] Model returned by model_function is None")
-            # Wait to guarantee the frequency of gossipping
-            time_diff = time.time() - begin
-            time_sleep = 1 / self.config.participant["GOSSIP_MODELS_FREC"] - time_diff
-            if time_sleep > 0:
-                time.sleep(time_sleep)
+            # Wait to guarantee the frequency of gossipping. Changes in the status of the neighbors wake the loop up,
+            # so the end of the gossip is detected as soon as all of them have the model (and event-driven schedulers start a new iteration)
+            while time.time() < next_gossip and self.round is not None:
+                if not self.__round_state.wait_change(changes, next_gossip - time.time()):
+                    break
+                changes = self.__round_state.get_changes()
+                if not any(candidate_condition(nc) for nc in self.get_neighbors()) or self.__gossip_scheduler.is_event_driven():
+                    break
 
     ###########################
     #     Observer Events     #
@@ -833,6 +1008,16 @@ class Node(BaseNode):
                 )
                 n.stop()
                 return
+            # Compression state of the connection (the settings are negotiated with the neighbor)
+            n.set_compressor(ModelCompressor())
+            if self.__compression[0] != "none" or self.__compression[1]:
+                n.send(CommunicationProtocol.build_compression_msg(*self.__compression))
+
+        elif event == Events.COMPRESSION_RECEIVED_EVENT:
+            n, quantization, delta, topk = obj
+            if n.get_compressor() is not None:
+                n.get_compressor().negotiate(self.__compression, (quantization, delta, topk))
+                logging.info("[NODE] Compression with {}: {}".format(n.get_name(), n.get_compressor().get_settings()))
 
         elif event == Events.SEND_ROLE_EVENT:
             self.broadcast(CommunicationProtocol.build_role_msg(self.get_name(), self.config.participant["device_args"]["role"]))
@@ -842,8 +1027,13 @@ class Node(BaseNode):
             # obj = (node_name, role)
             self.heartbeater.add_node_role(obj[0], obj[1])
 
+        elif event == Events.AGGREGATION_MODEL_ADDED_EVENT:
+            # Partial aggregations have changed
+            self.__clear_encoded_models()
+
         elif event == Events.AGGREGATION_FINISHED_EVENT:
             # Set parameters and communate it to the training process
+            self.__clear_encoded_models()
             if obj is not None:
                 logging.info("[NODE.update] Override the local model with obj received")
                 self.learner.set_parameters(obj)
@@ -856,11 +1046,7 @@ class Node(BaseNode):
                 # TODO: Testing 20-12-2022 (remove stop and add broadcast)
                 # self.stop()
                 # self.broadcast(CommunicationProtocol.build_models_ready_msg(self.round))
-            try:
-                self.__finish_aggregation_lock.release()
-                logging.info("[NODE.__finish_aggregation_lock] __finish_aggregation_lock.release()")
-            except threading.ThreadError:
-                pass
+            self.__round_state.set_aggregation_finished(self.round)
 
         elif event == Events.START_LEARNING_EVENT:
             self.__start_learning_thread(obj[0], obj[1])
@@ -870,7 +1056,7 @@ class Node(BaseNode):
 
         elif event == Events.PARAMS_RECEIVED_EVENT:
             logging.info("[NODE] Params received")
-            self.add_model(obj)
+            self.add_model(obj[0], obj[1])
 
         elif event == Events.METRICS_RECEIVED_EVENT:
             # name, round, loss, metric = obj
@@ -904,15 +1090,15 @@ class Node(BaseNode):
                     "[NODE] Error storing the model parameters"
                 )
                 self.stop()
-            try:
-                self.__finish_aggregation_lock.release()
-                logging.info("[NODE.__finish_aggregation_lock] __finish_aggregation_lock.release()")
-            except threading.ThreadError:
-                pass
+            self.__round_state.set_aggregation_finished(self.round)
 
         # Execute BaseNode update
         super().update(event, obj)
 
+        # Conditions of the learning process could hold now (e.g. all the neighbors have the model)
+        if event == Events.NEIGHBOR_STATUS_EVENT or event == Events.BEAT_RECEIVED_EVENT or event == Events.LIVENESS_RECEIVED_EVENT:
+            self.__round_state.notify_change()
+
     def __report_status_to_controller(self):
         """
         Report the status of the node to the controller.
@@ -19,10 +19,13 @@
 import logging
 import socket
 import threading
+import time
+from collections import deque
 
 from fedstellar.command import *
 from fedstellar.communication_protocol import CommunicationProtocol
 from fedstellar.config.config import Config
+from fedstellar.encrypter import AESCipher
 from fedstellar.utils.observer import Events, Observable
 
 
@@ -41,18 +44,33 @@ class NodeConnection(threading.Thread, Observable):
 
     Be careful, if the connection is broken, it will be closed. If the user wants to reconnect, he/she should create a new connection.
 
+    Messages are not sent by the caller: they are queued and a writer thread (one per connection) sends them, so a slow neighbor does not
+    block the others. There are two queues: text messages (control) are sent before the fragments of the models (bulk), so they are
+    not blocked behind a model. At most ``SEND_QUEUE_SIZE`` models are queued per connection.
+    Text messages are coalesced: the pending ones (queued at most ``SEND_MAX_LATENCY`` seconds ago) are sent with a single ``sendmsg``.
+
     Args:
         parent_node: The parent node of this connection.
         s: The socket of the connection.
         addr: The address of the node that is connected to.
+        processed_messages: Set of processed messages shared by all the connections of the node.
     """
 
+    """
+    Maximum number of text messages sent with a single ``sendmsg`` (each message uses up to 3 buffers, the limit of buffers is usually 1024).
+    """
+    MAX_BATCH_MESSAGES = 256
+    """
+    Weight of the last sample in the statistics of the link (exponential moving average).
+    """
+    LINK_STATS_SMOOTHING = 0.3
+
     ##############
     #    Init    #
     ##############
 
     def __init__(
-            self, parent_node_name, s, addr, aes_cipher, tcp_buffer_size=(None, None), config: Config = None
+            self, parent_node_name, s, addr, aes_cipher, tcp_buffer_size=(None, None), config: Config = None, processed_messages=None
     ):
         # Init supers
         threading.Thread.__init__(
@@ -70,7 +88,18 @@ class NodeConnection(threading.Thread, Observable):
         # Connection Loop
         self.__terminate_flag = threading.Event()
         self.__socket = s
-        self.__socket_lock = threading.Lock()
+
+        # Outbound queues (sent by the writer thread)
+        self.__control_frames = deque()
+        self.__control_time = 0
+        self.__bulk_frames = deque()
+        self.__queued_models = 0
+        self.__send_condition = threading.Condition()
+        self.__writer_thread = threading.Thread(
+            target=self.__write_loop,
+            name="node_connection_writer-" + parent_node_name + "-" + str(addr[0]) + ":" + str(addr[1]),
+            daemon=True,
+        )
 
         if tcp_buffer_size[0] is not None:
             self.__socket.setsockopt(
@@ -86,11 +115,20 @@ class NodeConnection(threading.Thread, Observable):
 
         # Atributes
         self.__addr = addr
-        self.__param_bufffer = b""
+        self.__param_bufffer = bytearray()
+        self.__param_bufffer_len = 0
         self.__model_ready = -1
         self.__aes_cipher = aes_cipher
         self.__model_initialized = False
         self.__models_aggregated = []
+        self.__compressor = None
+        # Statistics of the link (models sent): throughput (bytes/s), size of the last model and time it was sent
+        self.__link_throughput = None
+        self.__last_model_size = 0
+        self.__model_sent_time = None
+        # Activity of the link (time.monotonic): last frame received and last frame queued to be sent
+        self.__last_received = time.monotonic()
+        self.__last_sent = 0
         # Communication Protocol
         self.comm_protocol = CommunicationProtocol(
             {
@@ -107,8 +145,11 @@ class NodeConnection(threading.Thread, Observable):
                 CommunicationProtocol.MODELS_AGGREGATED: Models_aggregated_cmd(self),
                 CommunicationProtocol.MODEL_INITIALIZED: Model_initialized_cmd(self),
                 CommunicationProtocol.TRANSFER_LEADERSHIP: Transfer_leadership_cmd(self),
+                CommunicationProtocol.COMPRESSION: Compression_cmd(self),
+                CommunicationProtocol.LIVENESS: Liveness_cmd(self),
             },
             self.config,
+            processed_messages,
         )
 
     ##############
@@ -141,86 +182,62 @@ class NodeConnection(threading.Thread, Observable):
             force: Determine if connection is going to keep alive even if it should not.
         """
         self.notify(Events.NODE_CONNECTED_EVENT, (self, force))
+        self.__writer_thread.start()
         return super().start()
 
     def run(self):
         """
         NodeConnection loop. Receive and process messages.
+
+        Each frame is read in two steps: the fixed-size header (which includes the payload length) and the payload, which is received
+        directly into a preallocated buffer. Then, the payload is dispatched using its frame type.
         """
         self.__socket.settimeout(self.config.participant["NODE_TIMEOUT"])
-        amount_pending_params = 0
-        param_buffer = b""
+        header = bytearray(CommunicationProtocol.FRAME_HEADER.size)
+        buffer = bytearray(self.config.participant["BLOCK_SIZE"])
         while not self.__terminate_flag.is_set():
             try:
-                # Receive message
-                og_msg = b""
-                if amount_pending_params == 0:
-                    og_msg = self.__socket.recv(self.config.participant["BLOCK_SIZE"])
-
-                else:
-                    pending_fragment = self.__socket.recv(amount_pending_params)
-                    og_msg = param_buffer + pending_fragment  # alinear el colapso
-                    param_buffer = b""
-                    amount_pending_params = 0
-
-                # Decrypt message
+                # Receive frame header
+                if not NodeConnection.__recv_into(self.__socket, memoryview(header)):
+                    break
+                version, frame_type, length = CommunicationProtocol.parse_frame_header(header)
+                if version != CommunicationProtocol.WIRE_VERSION:
+                    logging.info(
+                        "[NODE_CONNECTION] Unsupported wire version {} (expected {})".format(version, CommunicationProtocol.WIRE_VERSION)
+                    )
+                    self.__terminate_flag.set()
+                    break
+                if length > CommunicationProtocol.MAX_FRAME_LENGTH:
+                    logging.info(
+                        "[NODE_CONNECTION] Frame too long: {} bytes (maximum {})".format(length, CommunicationProtocol.MAX_FRAME_LENGTH)
+                    )
+                    self.__terminate_flag.set()
+                    break
+
+                # Receive payload (encrypted payloads are followed by the authentication tag)
+                wire_length = length
                 if self.__aes_cipher is not None:
-                    # Guarantee block size (if TCP sctream is slow)
-                    bytes_to_block_size = len(og_msg) % self.__aes_cipher.bs
-                    # Decrypt
-                    if bytes_to_block_size != 0:
-                        msg = self.__aes_cipher.decrypt(
-                            og_msg + self.__socket.recv(bytes_to_block_size)
-                        )
-                    else:
-                        msg = self.__aes_cipher.decrypt(og_msg)
-                else:
-                    msg = og_msg
-
-                # Process messages
-                if msg != b"":
-                    # Check if fragments are incomplete (collapse / TCP stream slow)
-                    overflow = CommunicationProtocol.check_collapse(msg)
-                    if overflow > 0:
-                        param_buffer = og_msg[overflow:]
-                        amount_pending_params = self.config.participant["BLOCK_SIZE"] - len(param_buffer)
-                        msg = msg[:overflow]
-                        logging.debug(
-                            "[NODE_CONNECTION] Collapse detected: {}".format(
-                                msg
-                            )
-                        )
+                    wire_length = length + AESCipher.TAG_SIZE
+                if wire_length > len(buffer):
+                    buffer = bytearray(wire_length)
+                msg = memoryview(buffer)[:wire_length]
+                if not NodeConnection.__recv_into(self.__socket, msg):
+                    break
+
+                # Decrypt message (in place)
+                if self.__aes_cipher is not None:
+                    self.__aes_cipher.decrypt(msg[:length], msg[length:], header=bytes(header), output=msg[:length])
+                    msg = msg[:length]
 
-                    else:
-                        # Check if all bytes of param_buffer are received
-                        amount_pending_params = (
-                            CommunicationProtocol.check_params_incomplete(msg, self.config.participant["BLOCK_SIZE"])
-                        )
-                        if amount_pending_params != 0:
-                            param_buffer = msg
-                            continue
-
-                    # Process message
-                    # if len(str(msg)) > 300:
-                    #     logging.info(
-                    #        "[NODE_CONNECTION] Processing message: Too long [...]"
-                    #    )
-                    # else:
-                    #    logging.info(
-                    #        "[NODE_CONNECTION] Processing message: {}".format(msg)
-                    #    )
-                    exec_msgs, error = self.comm_protocol.process_message(msg)
-                    if len(exec_msgs) > 0:
-                        self.notify(
-                            Events.PROCESSED_MESSAGES_EVENT, (self, exec_msgs)
-                        )  # Notify the parent node
-
-                    # Error happened
-                    if error:
-                        self.__terminate_flag.set()
-                        logging.info(
-                            "[NODE_CONNECTION] An error happened. Last error: {}".format(msg)
-                        )
+                # Process message
+                error = self.process_frame(frame_type, msg)
+
+                # Error happened
+                if error:
+                    self.__terminate_flag.set()
+                    logging.info(
+                        "[NODE_CONNECTION] An error happened. Frame type: {} | Length: {}".format(frame_type, length)
+                    )
 
             except socket.timeout:
                 logging.info(
@@ -236,11 +253,79 @@ class NodeConnection(threading.Thread, Observable):
                 self.__terminate_flag.set()
                 break
 
-        # Down Connection
+        # Down Connection (the writer sends the pending messages, e.g. STOP, before the socket is closed)
         logging.info("[NODE_CONNECTION] Closed connection: {}".format(self.get_name()))
         self.notify(Events.END_CONNECTION_EVENT, self)
+        self.__terminate_flag.set()
+        self.__wake_writer()
+        self.__writer_thread.join(self.config.participant["NODE_TIMEOUT"])
         self.__socket.close()
 
+    def process_frame(self, frame_type, msg):
+        """
+        Process the payload of a received frame using its frame type.
+
+        Args:
+            frame_type: The type of the frame.
+            msg: The payload of the frame (decrypted).
+
+        Returns:
+            bool: True if there was an error.
+        """
+        self.__last_received = time.monotonic()
+        if frame_type == CommunicationProtocol.FRAME_TEXT:
+            exec_msgs, error = self.comm_protocol.process_message(bytes(msg))
+            if len(exec_msgs) > 0:
+                self.notify(
+                    Events.PROCESSED_MESSAGES_EVENT, (self, exec_msgs)
+                )  # Notify the parent node
+            return error
+        elif frame_type in (CommunicationProtocol.FRAME_PARAMS, CommunicationProtocol.FRAME_PARAMS_END):
+            return self.comm_protocol.process_params(msg, frame_type == CommunicationProtocol.FRAME_PARAMS_END)
+        return True
+
+    @staticmethod
+    def __recv_into(s, view):
+        """
+        Fill the view with bytes received from the socket.
+
+        Args:
+            s: The socket.
+            view: (memoryview) The buffer to fill.
+
+        Returns:
+            False if the connection was closed before filling the view, True otherwise.
+        """
+        received = 0
+        while received < len(view):
+            n = s.recv_into(view[received:])
+            if n == 0:
+                return False
+            received += n
+        return True
+
+    @staticmethod
+    def recv_frame(s):
+        """
+        Receive a single text frame from a socket. It is used before the connection is established (handshake).
+
+        Args:
+            s: The socket.
+
+        Returns:
+            The payload of the frame, or None if the connection was closed or the frame is not a valid text frame.
+        """
+        header = bytearray(CommunicationProtocol.FRAME_HEADER.size)
+        if not NodeConnection.__recv_into(s, memoryview(header)):
+            return None
+        version, frame_type, length = CommunicationProtocol.parse_frame_header(header)
+        if version != CommunicationProtocol.WIRE_VERSION or frame_type != CommunicationProtocol.FRAME_TEXT or length > CommunicationProtocol.MAX_FRAME_LENGTH:
+            return None
+        payload = bytearray(length)
+        if not NodeConnection.__recv_into(s, memoryview(payload)):
+            return None
+        return bytes(payload)
+
     def stop(self, local=False):
         """
         Stop the connection. Stops the main loop and closes the socket.
@@ -251,6 +336,7 @@ class NodeConnection(threading.Thread, Observable):
         if not local:
             self.send(CommunicationProtocol.build_stop_msg())
         self.__terminate_flag.set()
+        self.__wake_writer()
 
     ############################
     #    Processed Messages    #
@@ -280,6 +366,7 @@ class NodeConnection(threading.Thread, Observable):
             round: The last ready round of the other node.
         """
         self.__model_ready = round
+        self.notify(Events.NEIGHBOR_STATUS_EVENT, self)
 
     def get_model_ready_status(self):
         """
@@ -300,6 +387,7 @@ class NodeConnection(threading.Thread, Observable):
             value: True if the model is initialized, false otherwise.
         """
         self.__model_initialized = value
+        self.notify(Events.NEIGHBOR_STATUS_EVENT, self)
 
     def get_model_initialized(self):
         """
@@ -320,6 +408,7 @@ class NodeConnection(threading.Thread, Observable):
             models: Models aggregated.
         """
         self.__models_aggregated = list(set(models + self.__models_aggregated))
+        self.notify(Events.NEIGHBOR_STATUS_EVENT, self)
 
     def clear_models_aggregated(self):
         """
@@ -334,68 +423,276 @@ class NodeConnection(threading.Thread, Observable):
         """
         return self.__models_aggregated
 
+    ########################
+    #    Link Statistics    #
+    ########################
+
+    def record_model_sent(self, size, elapsed):
+        """
+        Update the statistics of the link after a model is sent. It is called by the writer of the transport.
+
+        Args:
+            size: Size of the model (bytes).
+            elapsed: Time spent sending it (seconds).
+        """
+        if elapsed > 0:
+            throughput = size / elapsed
+            if self.__link_throughput is None:
+                self.__link_throughput = throughput
+            else:
+                self.__link_throughput += NodeConnection.LINK_STATS_SMOOTHING * (throughput - self.__link_throughput)
+        self.__last_model_size = size
+        self.__model_sent_time = time.monotonic()
+
+    def get_link_stats(self):
+        """
+        Returns:
+            (throughput, size, sent_time) Throughput of the link (bytes/s, None if no model has been sent), size of the last model sent
+            and time (``time.monotonic``) it was sent.
+        """
+        return self.__link_throughput, self.__last_model_size, self.__model_sent_time
+
+    def get_pending_models(self):
+        """
+        Returns:
+            Number of models queued or being sent.
+        """
+        return self.__queued_models
+
+    def record_frame_sent(self):
+        """
+        Update the activity of the link after a frame is queued to be sent. It is called by ``send`` and ``send_model`` of the transport.
+        """
+        self.__last_sent = time.monotonic()
+
+    def get_last_received(self):
+        """
+        Returns:
+            Time (``time.monotonic``) the last frame was received. Any frame shows that the other node is alive.
+        """
+        return self.__last_received
+
+    def is_idle(self, period):
+        """
+        Args:
+            period: Time (seconds).
+
+        Returns:
+            True if no frame was queued to be sent during the last ``period`` seconds and no model is being sent.
+        """
+        return self.get_pending_models() == 0 and time.monotonic() - self.__last_sent >= period
+
+    ####################
+    #    Compression    #
+    ####################
+
+    def set_compressor(self, compressor):
+        """
+        Set the compression state of the models sent and received by the connection.
+
+        Args:
+            compressor: The compression state (None if the models are not compressed).
+        """
+        self.__compressor = compressor
+
+    def get_compressor(self):
+        """
+        Returns:
+            The compression state of the connection (None if the models are not compressed).
+        """
+        return self.__compressor
+
     #######################
     #    Params Buffer    #
     #######################
 
     def add_param_segment(self, data):
         """
-        Add a segment of parameters to the buffer.
+        Add a segment of parameters to the buffer. The segment is written in place, the buffer only grows if the model is bigger than the expected size.
 
         Args:
             data: The segment of parameters.
         """
-        self.__param_bufffer = self.__param_bufffer + data
+        end = self.__param_bufffer_len + len(data)
+        if end <= len(self.__param_bufffer):
+            self.__param_bufffer[self.__param_bufffer_len:end] = data
+        else:
+            self.__param_bufffer[self.__param_bufffer_len:] = data
+        self.__param_bufffer_len = end
 
     def get_params(self):
         """
         Returns:
-            The parameters buffer content.
+            The parameters buffer content (memoryview, without copying the buffer).
         """
-        return self.__param_bufffer
+        return memoryview(self.__param_bufffer)[:self.__param_bufffer_len]
 
     def clear_buffer(self):
         """
-        Clear the params buffer.
+        Clear the params buffer. A new buffer is allocated (the previous one could still be referenced by ``get_params``), using the size of the last model as the expected size.
         """
-        self.__param_bufffer = b""
+        self.__param_bufffer = bytearray(self.__param_bufffer_len)
+        self.__param_bufffer_len = 0
 
     ##################
     #    Messages    #
     ##################
 
-    def send(self, data):
+    def send(self, data, frame_type=CommunicationProtocol.FRAME_TEXT):
         """
-        Tries to send a message to the other node.
+        Tries to send a message to the other node. The message is queued (text messages are sent before the fragments of the models).
 
         Args:
             data: The message to send.
+            frame_type: The type of the frame (text by default).
 
         Returns:
-            True if the message was sent, False otherwise.
+            True if the message was queued, False otherwise.
 
         """
+        # The other node would close the connection (text messages are not split)
+        if len(data) > CommunicationProtocol.MAX_FRAME_LENGTH:
+            logging.error(
+                "[NODE_CONNECTION] Message too long: {} bytes (maximum {})".format(len(data), CommunicationProtocol.MAX_FRAME_LENGTH)
+            )
+            return False
         # Check if the connection is still alive
-        if not self.__terminate_flag.is_set():
+        if self.__terminate_flag.is_set():
+            return False
+        self.__send_condition.acquire()
+        if frame_type == CommunicationProtocol.FRAME_TEXT:
+            if not self.__control_frames:
+                self.__control_time = time.monotonic()
+            self.__control_frames.append((frame_type, data))
+        else:
+            self.__bulk_frames.append((frame_type, data))
+            if frame_type == CommunicationProtocol.FRAME_PARAMS_END:
+                self.__queued_models += 1
+        self.__send_condition.notify()
+        self.__send_condition.release()
+        self.record_frame_sent()
+        return True
+
+    def send_model(self, encoded_msgs):
+        """
+        Tries to send a model (its fragments) to the other node. If there are ``SEND_QUEUE_SIZE`` models queued, the model is discarded
+        (it will be gossiped again).
+
+        Args:
+            encoded_msgs: List of (frame_type, fragment) of the model.
+
+        Returns:
+            True if the model was queued, False otherwise.
+        """
+        if self.__terminate_flag.is_set():
+            return False
+        self.__send_condition.acquire()
+        try:
+            if self.__queued_models >= self.config.participant["SEND_QUEUE_SIZE"]:
+                return False
+            self.__bulk_frames.extend(encoded_msgs)
+            self.__queued_models += 1
+            self.__send_condition.notify()
+            self.record_frame_sent()
+            return True
+        finally:
+            self.__send_condition.release()
+
+    def is_send_queue_full(self):
+        """
+        Returns:
+            True if there are ``SEND_QUEUE_SIZE`` models queued.
+        """
+        return self.__queued_models >= self.config.participant["SEND_QUEUE_SIZE"]
+
+    def __wake_writer(self):
+        self.__send_condition.acquire()
+        self.__send_condition.notify()
+        self.__send_condition.release()
+
+    def __write_loop(self):
+        """
+        Writer thread. Sends the queued messages (text messages first). When the connection is closed, the pending text messages are sent
+        and the fragments of the models are discarded.
+
+        If there are no fragments to send, it waits for more text messages (up to ``SEND_MAX_LATENCY`` seconds since the first one was queued),
+        so they are sent together.
+        """
+        max_latency = self.config.participant["SEND_MAX_LATENCY"]
+        # Model being sent (start time and bytes sent), used for the statistics of the link
+        model_start = None
+        model_size = 0
+        while True:
+            self.__send_condition.acquire()
+            while not self.__control_frames and not self.__bulk_frames and not self.__terminate_flag.is_set():
+                self.__send_condition.wait()
+            if self.__control_frames:
+                while not self.__bulk_frames and not self.__terminate_flag.is_set() and len(self.__control_frames) < NodeConnection.MAX_BATCH_MESSAGES:
+                    remaining = self.__control_time + max_latency - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.__send_condition.wait(remaining)
+                frames = [self.__control_frames.popleft() for _ in range(min(len(self.__control_frames), NodeConnection.MAX_BATCH_MESSAGES))]
+            elif self.__bulk_frames and not self.__terminate_flag.is_set():
+                frames = [self.__bulk_frames.popleft()]
+                if model_start is None:
+                    model_start = time.monotonic()
+                model_size += len(frames[0][1])
+            else:
+                self.__send_condition.release()
+                break
+            self.__send_condition.release()
+
             try:
-                # Encrypt message
-                if self.__aes_cipher is not None:
-                    data = self.__aes_cipher.add_padding(
-                        data
-                    )  # -> It cant broke the model because it fills all the block space
-                    data = self.__aes_cipher.encrypt(data)
-                # Send message
-                self.__socket_lock.acquire()
-                self.__socket.sendall(data)
-                self.__socket_lock.release()
-                return True
+                buffers = []
+                for frame_type, data in frames:
+                    # The header carries the length of the message
+                    header = CommunicationProtocol.build_frame_header(frame_type, len(data))
+                    buffers.append(header)
+                    # Encrypt message (the frames are encrypted in the same order they are sent)
+                    if self.__aes_cipher is not None:
+                        buffers.extend(self.__aes_cipher.encrypt(data, header=header))
+                    else:
+                        buffers.append(data)
+                # Send messages
+                NodeConnection.__send_buffers(self.__socket, buffers)
+
+                # Last fragment of a model
+                if frames[0][0] == CommunicationProtocol.FRAME_PARAMS_END:
+                    self.record_model_sent(model_size, time.monotonic() - model_start)
+                    model_start = None
+                    model_size = 0
+                    self.__send_condition.acquire()
+                    self.__queued_models -= 1
+                    self.__send_condition.release()
 
             except Exception as e:
                 # If some error happened, the connection is closed
                 self.__terminate_flag.set()
-                return False
-        else:
-            return False
+                break
+
+    @staticmethod
+    def __send_buffers(s, buffers):
+        """
+        Send a list of buffers using scatter-gather I/O (``sendmsg``), without joining them.
+
+        Args:
+            s: The socket.
+            buffers: The buffers to send (in order).
+        """
+        if not hasattr(s, "sendmsg"):
+            # Platforms without sendmsg (e.g. Windows)
+            s.sendall(b"".join(buffers))
+            return
+        buffers = [memoryview(b).cast("B") for b in buffers]
+        while buffers:
+            sent = s.sendmsg(buffers)
+            # Remove the buffers sent (the last one could be sent partially)
+            while buffers and sent >= len(buffers[0]):
+                sent -= len(buffers[0])
+                buffers.pop(0)
+            if buffers and sent > 0:
+                buffers[0] = buffers[0][sent:]
 
     ###########################
     #    Command Callbacks    #
@@ -435,7 +732,19 @@ class NodeConnection(threading.Thread, Observable):
         """
         Notify to the parent node that `PARAMS` has been received.
         """
-        self.notify(Events.PARAMS_RECEIVED_EVENT, (params))
+        self.notify(Events.PARAMS_RECEIVED_EVENT, (params, self))
+
+    def notify_compression(self, quantization, delta, topk):
+        """
+        Notify to the parent node that `COMPRESSION` has been received.
+        """
+        self.notify(Events.COMPRESSION_RECEIVED_EVENT, (self, quantization, delta, topk))
+
+    def notify_liveness(self, entries):
+        """
+        Notify to the parent node that `LIVENESS` has been received.
+        """
+        self.notify(Events.LIVENESS_RECEIVED_EVENT, (self, entries))
 
     def notify_metrics(self, node, round, loss, metric):
         """
@@ -1,5 +1,6 @@
 import logging
 import os
+import socket
 import sys
 import time
 
@@ -20,15 +21,23 @@ from fedstellar.learning.pytorch.cifar10.models.resnet import CIFAR10ModelResNet
 from fedstellar.learning.pytorch.cifar10.models.fastermobilenet import FasterMobileNet
 from fedstellar.learning.pytorch.cifar10.models.simplemobilenet import SimpleMobileNetV1
 from fedstellar.learning.pytorch.syscall.models.svm import SyscallModelSGDOneClassSVM
+from fedstellar.learning.pytorch.lightninglearner import LightningLearner
+from fedstellar.learning.pytorch.fastlearner import FastLearner
 from fedstellar.node import Node
 
 os.environ["PYTORCH_ENABLE_MPS_FALLBACK"] = "1"
 
 
-def main():
-    config_path = str(sys.argv[1])
-    config = Config(entity="participant", participant_config_file=config_path)
+def create_node(config):
+    """
+    Create the node of a participant (dataset, model and node) from its configuration.
 
+    Args:
+        config: Configuration of the participant.
+
+    Returns:
+        Node: The node (not started).
+    """
     n_nodes = config.participant["scenario_args"]["n_nodes"]
     experiment_name = config.participant["scenario_args"]["name"]
     model_name = config.participant["model_args"]["model"]
@@ -36,17 +45,14 @@ def main():
     hostdemo = config.participant["network_args"]["ipdemo"]
     host = config.participant["network_args"]["ip"]
     port = config.participant["network_args"]["port"]
-    neighbors = config.participant["network_args"]["neighbors"].split()
-
-    rounds = config.participant["scenario_args"]["rounds"]
-    epochs = config.participant["training_args"]["epochs"]
 
     aggregation_algorithm = config.participant["aggregator_args"]["algorithm"]
 
     dataset = config.participant["data_args"]["dataset"]
+    shared_store = config.participant["data_args"]["shared_store"]
     model = None
     if dataset == "MNIST":
-        dataset = MNISTDataModule(sub_id=idx, number_sub=n_nodes, iid=True)
+        dataset = MNISTDataModule(sub_id=idx, number_sub=n_nodes, iid=True, shared_store=shared_store)
         if model_name == "MLP":
             model = MNISTModelMLP()
         elif model_name == "CNN":
@@ -54,13 +60,13 @@ def main():
         else:
             raise ValueError(f"Model {model} not supported")
     elif dataset == "FEMNIST":
-        dataset = FEMNISTDataModule(sub_id=idx, number_sub=n_nodes, root_dir=f"{sys.path[0]}/data")
+        dataset = FEMNISTDataModule(sub_id=idx, number_sub=n_nodes, root_dir=f"{sys.path[0]}/data", shared_store=shared_store)
         if model_name == "CNN":
             model = FEMNISTModelCNN()
         else:
             raise ValueError(f"Model {model} not supported")
     elif dataset == "SYSCALL":
-        dataset = SYSCALLDataModule(sub_id=idx, number_sub=n_nodes, root_dir=f"{sys.path[0]}/data")
+        dataset = SYSCALLDataModule(sub_id=idx, number_sub=n_nodes, root_dir=f"{sys.path[0]}/data", shared_store=shared_store)
         if model_name == "MLP":
             model = SyscallModelMLP()
         elif model_name == "SVM":
@@ -70,7 +76,7 @@ def main():
         else:
             raise ValueError(f"Model {model} not supported")
     elif dataset == "CIFAR10":
-        dataset = CIFAR10DataModule(sub_id=idx, number_sub=n_nodes, root_dir=f"{sys.path[0]}/data")
+        dataset = CIFAR10DataModule(sub_id=idx, number_sub=n_nodes, root_dir=f"{sys.path[0]}/data", shared_store=shared_store)
         if model_name == "ResNet9":
             model = CIFAR10ModelResNet(classifier="resnet9")
         elif model_name == "ResNet18":
@@ -89,7 +95,15 @@ def main():
     else:
         raise ValueError(f"Aggregation algorithm {aggregation_algorithm} not supported")
 
-    node = Node(
+    learner = config.participant["training_args"]["learner"]
+    if learner == "lightning":
+        learner = LightningLearner
+    elif learner == "fast":
+        learner = FastLearner
+    else:
+        raise ValueError(f"Learner {learner} not supported")
+
+    return Node(
         idx=idx,
         experiment_name=experiment_name,
         model=model,
@@ -98,18 +112,49 @@ def main():
         host=host,
         port=port,
         config=config,
+        learner=learner,
         encrypt=False
     )
 
-    node.start()
-    print("Node started, grace time for network start-up (30s)")
-    time.sleep(30)  # Wait for the participant to start and register in the network
 
-    # Node Connection to the neighbors
+def connect_to_neighbors(node, neighbors, timeout):
+    """
+    Connect the node to its neighbors. A connection is retried until the neighbor accepts it (it could be still starting)
+    or the timeout expires.
+
+    Args:
+        node: The node.
+        neighbors: List of neighbors (``host:port``).
+        timeout: Maximum time to connect to all the neighbors.
+    """
+    deadline = time.time() + timeout
     for i in neighbors:
+        host, port = socket.gethostbyname(i.split(':')[0]), int(i.split(':')[1])
         print(f"Connecting to {i}")
-        node.connect_to(i.split(':')[0], int(i.split(':')[1]), full=False)
-        time.sleep(5)
+        retry_delay = 0.1
+        while node.connect_to(host, port, full=False) is None and node.get_neighbor(host, port) is None:
+            if time.time() + retry_delay > deadline:
+                logging.info(f"Can't connect to {i}")
+                break
+            time.sleep(retry_delay)
+            retry_delay = min(retry_delay * 2, 2)
+
+
+def main():
+    config_path = str(sys.argv[1])
+    config = Config(entity="participant", participant_config_file=config_path)
+
+    neighbors = config.participant["network_args"]["neighbors"].split()
+    rounds = config.participant["scenario_args"]["rounds"]
+    epochs = config.participant["training_args"]["epochs"]
+
+    node = create_node(config)
+    node.start()
+    print("Node started")
+
+    # Node Connection to the neighbors (as soon as they are listening, grace time for network start-up of 30s)
+    grace_time = 30 + 5 * len(neighbors)
+    connect_to_neighbors(node, neighbors, grace_time)
 
     logging.info(f"Neighbors: {node.get_neighbors()}")
     logging.info(f"Network nodes: {node.get_network_nodes()}")
@@ -117,6 +162,9 @@ def main():
     start_node = config.participant["device_args"]["start"]
 
     if start_node:
+        # Wait for the heartbeats of the rest of the participants (they could be still connecting to their neighbors)
+        if not node.wait_network(config.participant["scenario_args"]["n_nodes"], grace_time):
+            logging.info(f"Network nodes after the grace time: {node.get_network_nodes()}")
         node.set_start_learning(rounds=rounds, epochs=epochs)  # rounds=10, epochs=5
 
 
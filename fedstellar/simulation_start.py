@@ -0,0 +1,58 @@
+import logging
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))  # Parent directory where is the fedml_api module
+
+from fedstellar.config.config import Config
+from fedstellar.node_start import create_node
+
+os.environ["PYTORCH_ENABLE_MPS_FALLBACK"] = "1"
+
+
+def main():
+    """
+    Start all the participants of a scenario in this process. Nodes use the loopback transport (in-memory connections),
+    and the datasets are loaded once and shared by all the nodes (read-only).
+
+    Usage: python simulation_start.py participant_0.json participant_1.json ...
+    """
+    configs = []
+    for config_path in sys.argv[1:]:
+        config = Config(entity="participant", participant_config_file=str(config_path))
+        config.participant["TRANSPORT"] = "loopback"
+        configs.append(config)
+
+    # Neighbors are read before starting the nodes (the heartbeater updates them in the config)
+    neighbors = [config.participant["network_args"]["neighbors"].split() for config in configs]
+
+    nodes = [create_node(config) for config in configs]
+    for node in nodes:
+        node.start()
+    print("Nodes started ({})".format(len(nodes)))
+
+    # Node Connection to the neighbors (all the nodes are already registered, there is no need to wait)
+    for node, node_neighbors in zip(nodes, neighbors):
+        for i in node_neighbors:
+            node.connect_to(i.split(':')[0], int(i.split(':')[1]), full=False)
+
+    # Wait for the heartbeats to spread the network nodes (at most HEARTBEAT_PERIOD seconds)
+    deadline = time.time() + configs[0].participant["HEARTBEAT_PERIOD"]
+    for node in nodes:
+        node.wait_network(len(nodes), max(deadline - time.time(), 0))
+
+    for node, config in zip(nodes, configs):
+        logging.info(f"Neighbors: {node.get_neighbors()}")
+        logging.info(f"Network nodes: {node.get_network_nodes()}")
+
+    for node, config in zip(nodes, configs):
+        if config.participant["device_args"]["start"]:
+            node.set_start_learning(rounds=config.participant["scenario_args"]["rounds"], epochs=config.participant["training_args"]["epochs"])
+
+    for node in nodes:
+        node.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+#
+# This file is part of the fedstellar framework (see https://github.com/enriquetomasmb/fedstellar).
+# Copyright (c) 2022 Enrique Tomás Martínez Beltrán.
+#
+
+
+"""
+Module that implements the registry of the neighbors of a node (its connections).
+"""
+import threading
+
+
+class NeighborRegistry:
+    """
+    Connections of a node indexed by address (host, port) and by name. Lookups are O(1).
+
+    The registry is copy-on-write: adding or removing a connection builds new indexes and replaces them at once,
+    so readers never take the lock and always see a consistent snapshot (they can iterate it while it is modified).
+    Writes are serialized by an internal lock.
+
+    Every connection gets a small integer id when it is added, so sets of neighbors can be stored as bitsets (see ``Gossiper``).
+    Ids are not reused: a new connection never inherits the bit of a removed one.
+    """
+
+    def __init__(self):
+        # (connections by address, connections by name, connections in insertion order, ids by connection, connections by id, bitset of the ids)
+        self.__state = ({}, {}, (), {}, {}, 0)
+        self.__next_id = 0
+        self.__lock = threading.Lock()
+
+    def add(self, nc):
+        """
+        Add a connection, if there is no connection with the same address.
+
+        Args:
+            nc: The connection.
+
+        Returns:
+            bool: True if the connection was added.
+        """
+        self.__lock.acquire()
+        try:
+            by_addr, by_name, ordered, ids, by_id, mask = self.__state
+            if nc.get_addr() in by_addr:
+                return False
+            by_addr = dict(by_addr)
+            by_addr[nc.get_addr()] = nc
+            by_name = dict(by_name)
+            by_name[nc.get_name()] = nc
+            id_ = self.__next_id
+            self.__next_id += 1
+            ids = dict(ids)
+            ids[nc] = id_
+            by_id = dict(by_id)
+            by_id[id_] = nc
+            self.__state = (by_addr, by_name, ordered + (nc,), ids, by_id, mask | (1 << id_))
+            return True
+        finally:
+            self.__lock.release()
+
+    def remove(self, nc):
+        """
+        Remove a connection (only that connection, not a newer one with the same address).
+
+        Args:
+            nc: The connection.
+
+        Returns:
+            bool: True if the connection was removed.
+        """
+        self.__lock.acquire()
+        try:
+            by_addr, by_name, ordered, ids, by_id, mask = self.__state
+            if by_addr.get(nc.get_addr()) is not nc:
+                return False
+            by_addr = dict(by_addr)
+            del by_addr[nc.get_addr()]
+            by_name = dict(by_name)
+            del by_name[nc.get_name()]
+            ids = dict(ids)
+            id_ = ids.pop(nc)
+            by_id = dict(by_id)
+            del by_id[id_]
+            self.__state = (by_addr, by_name, tuple(n for n in ordered if n is not nc), ids, by_id, mask & ~(1 << id_))
+            return True
+        finally:
+            self.__lock.release()
+
+    def get(self, addr):
+        """
+        Args:
+            addr: (host, port) of the node.
+
+        Returns:
+            The connection with the node, or None.
+        """
+        return self.__state[0].get(addr)
+
+    def get_by_name(self, name):
+        """
+        Args:
+            name: Name of the node (``host:port``).
+
+        Returns:
+            The connection with the node, or None.
+        """
+        return self.__state[1].get(name)
+
+    def snapshot(self):
+        """
+        Returns:
+            tuple: The connections (immutable, it is not affected by later changes).
+        """
+        return self.__state[2]
+
+    def get_id(self, nc):
+        """
+        Args:
+            nc: The connection.
+
+        Returns:
+            int: The id of the connection, or None if it is not registered.
+        """
+        return self.__state[3].get(nc)
+
+    def snapshot_ids(self):
+        """
+        Returns:
+            tuple: (connections by id, bitset of the ids of the connections), both immutable.
+        """
+        state = self.__state
+        return state[4], state[5]
+
+    def __contains__(self, addr):
+        return addr in self.__state[0]
+
+    def __iter__(self):
+        return iter(self.__state[2])
+
+    def __len__(self):
+        return len(self.__state[2])
+
+    def __repr__(self):
+        return str(list(self.__state[2]))
@@ -36,6 +36,10 @@ class Events:
     """
     Used to notify that the aggregation was done. (arg: model or None)
     """
+    AGGREGATION_MODEL_ADDED_EVENT = "AGGREGATION_MODEL_ADDED_EVENT"
+    """
+    Used to notify that a model was added to the aggregator. (arg: nodes of the model)
+    """
     CONN_TO_EVENT = "CONN_TO_EVENT"
     """
     Used to notify when a node must connect to another. (arg: (host,port))
@@ -50,7 +54,7 @@ class Events:
     """
     PARAMS_RECEIVED_EVENT = "PARAMS_RECEIVED_EVENT"
     """
-    Used to notify when the parameters are received. (arg: params (encoded))
+    Used to notify when the parameters are received. (arg: (params (encoded), node connection))
     """
     METRICS_RECEIVED_EVENT = "METRICS_RECEIVED_EVENT"
     """
@@ -60,6 +64,18 @@ class Events:
     """
     Used to notify when a vote is received. (arg: (node,votes))
     """
+    COMPRESSION_RECEIVED_EVENT = "COMPRESSION_RECEIVED_EVENT"
+    """
+    Used to notify when the compression settings of a neighbor are received. (arg: (node connection, quantization, delta, topk))
+    """
+    LIVENESS_RECEIVED_EVENT = "LIVENESS_RECEIVED_EVENT"
+    """
+    Used to notify when a liveness digest is received. (arg: (node connection, [(node, version, role)]))
+    """
+    SEND_LIVENESS_EVENT = "SEND_LIVENESS_EVENT"
+    """
+    Used to notify when a liveness digest must be sent to a neighbor. (arg: (node connection, msg))
+    """
     NODE_CONNECTED_EVENT = "NODE_CONNECTED_EVENT"
     """
     Used to notify when a node is connected. (arg: (n, force))
@@ -68,14 +84,18 @@ class Events:
     """
     Used to notify when a node processes messages. (arg: (node, messages))
     """
-    GOSSIP_BROADCAST_EVENT = "GOSSIP_BROADCAST_EVENT"
+    GOSSIP_SEND_EVENT = "GOSSIP_SEND_EVENT"
     """
-    Used to notify when a node must send gossiped messages. (arg: (msg,nodes))
+    Used to notify when a node must send a gossiped message to some neighbors. (arg: (msg, nodes))
     """
     BEAT_RECEIVED_EVENT = "BEAT_RECEIVED_EVENT"
     """
     Used to notify when a node receives a beat. (arg: node)
     """
+    NEIGHBOR_STATUS_EVENT = "NEIGHBOR_STATUS_EVENT"
+    """
+    Used to notify when the learning status of a neighbor changes (model initialized, models aggregated or model ready). (arg: node connection)
+    """
     ROLE_RECEIVED_EVENT = "ROLE_RECEIVED_EVENT"
     """
     Used to notify when a node receives a role. (arg: node, role)
@@ -0,0 +1,65 @@
+#
+# This file is part of the fedstellar framework (see https://github.com/enriquetomasmb/fedstellar).
+# Copyright (c) 2022 Enrique Tomás Martínez Beltrán.
+#
+
+
+"""
+Module that implements the set of processed messages (used to avoid processing the same message twice).
+"""
+import threading
+from collections import OrderedDict
+
+
+class ProcessedMessages:
+    """
+    Bounded insertion-ordered set of message hashes. Adding, checking and evicting are O(1).
+    When the set is full, the oldest hashes are removed.
+
+    It is thread-safe, so a single instance can be shared by all the connections of a node.
+
+    Args:
+        max_size: Maximum number of hashes saved.
+    """
+
+    def __init__(self, max_size):
+        self.__max_size = max_size
+        self.__hashes = OrderedDict()
+        self.__lock = threading.Lock()
+
+    def add(self, hash_):
+        """
+        Add a hash to the set.
+
+        Args:
+            hash_: Hash of the message.
+
+        Returns:
+            bool: True if the hash was not in the set (the message has to be processed).
+        """
+        self.__lock.acquire()
+        try:
+            if hash_ in self.__hashes:
+                return False
+            self.__hashes[hash_] = None
+            if len(self.__hashes) > self.__max_size:
+                self.__hashes.popitem(last=False)
+            return True
+        finally:
+            self.__lock.release()
+
+    def add_all(self, hashes):
+        """
+        Add a list of hashes to the set.
+
+        Args:
+            hashes: List of hashes of the messages.
+        """
+        for hash_ in hashes:
+            self.add(hash_)
+
+    def __contains__(self, hash_):
+        return hash_ in self.__hashes
+
+    def __len__(self):
+        return len(self.__hashes)
@@ -0,0 +1,173 @@
+#
+# This file is part of the fedstellar framework (see https://github.com/enriquetomasmb/fedstellar).
+# Copyright (c) 2022 Enrique Tomás Martínez Beltrán.
+#
+
+
+"""
+Module that implements the synchronization of the learning process of a node.
+"""
+import threading
+
+
+class RoundState:
+    """
+    State of the learning process of a node, shared by the learning thread and the events of the node.
+
+    The learning thread waits for conditions (model initialized, aggregation of the round finished, changes in the neighbors)
+    instead of sleeping a fixed time. The events of the node signal them, so the thread resumes as soon as they hold.
+    All the waits end when the learning process is interrupted (see ``finish``).
+    """
+
+    def __init__(self):
+        self.__condition = threading.Condition()
+        self.__model_initialized = False
+        self.__aggregated_round = None
+        self.__interrupted = False
+        self.__changes = 0
+
+    def start(self):
+        """
+        Start a learning process (the model could be already initialized by the node that starts it).
+        """
+        self.__condition.acquire()
+        self.__interrupted = False
+        self.__aggregated_round = None
+        self.__condition.release()
+
+    def finish(self):
+        """
+        Finish (or interrupt) the learning process. Threads waiting for a condition are woken up.
+        """
+        self.__condition.acquire()
+        self.__interrupted = True
+        self.__model_initialized = False
+        self.__condition.notify_all()
+        self.__condition.release()
+
+    ###################
+    #    Signalling   #
+    ###################
+
+    def set_model_initialized(self):
+        """
+        Set the model as initialized.
+
+        Returns:
+            bool: True if the model was not initialized (only one caller gets True).
+        """
+        self.__condition.acquire()
+        try:
+            if self.__model_initialized:
+                return False
+            self.__model_initialized = True
+            self.__condition.notify_all()
+            return True
+        finally:
+            self.__condition.release()
+
+    def is_model_initialized(self):
+        """
+        Returns:
+            bool: True if the model is initialized.
+        """
+        return self.__model_initialized
+
+    def set_aggregation_finished(self, round):
+        """
+        Set the aggregation of a round as finished.
+
+        Args:
+            round: The round.
+        """
+        self.__condition.acquire()
+        self.__aggregated_round = round
+        self.__condition.notify_all()
+        self.__condition.release()
+
+    def notify_change(self):
+        """
+        Notify a change in the node or its neighbors (e.g. a neighbor aggregated a model). Threads waiting for a change are woken up.
+        """
+        self.__condition.acquire()
+        self.__changes += 1
+        self.__condition.notify_all()
+        self.__condition.release()
+
+    def get_changes(self):
+        """
+        Returns:
+            int: Number of changes notified (used by ``wait_change``).
+        """
+        return self.__changes
+
+    ###############
+    #    Waits    #
+    ###############
+
+    def wait_model_initialized(self, timeout=None):
+        """
+        Wait until the model is initialized.
+
+        Args:
+            timeout: Maximum time to wait (None to wait until the learning process is interrupted).
+
+        Returns:
+            bool: True if the model is initialized.
+        """
+        self.__condition.acquire()
+        try:
+            return self.__condition.wait_for(lambda: self.__model_initialized or self.__interrupted, timeout) and self.__model_initialized
+        finally:
+            self.__condition.release()
+
+    def wait_aggregation_finished(self, round, timeout=None):
+        """
+        Wait until the aggregation of a round is finished.
+
+        Args:
+            round: The round.
+            timeout: Maximum time to wait (None to wait until the learning process is interrupted).
+
+        Returns:
+            bool: True if the aggregation is finished.
+        """
+        self.__condition.acquire()
+        try:
+            return self.__condition.wait_for(lambda: self.__aggregated_round == round or self.__interrupted, timeout) and self.__aggregated_round == round
+        finally:
+            self.__condition.release()
+
+    def wait_change(self, changes, timeout):
+        """
+        Wait until a change is notified.
+
+        Args:
+            changes: Number of changes already seen (from ``get_changes``).
+            timeout: Maximum time to wait.
+
+        Returns:
+            bool: True if there were changes (False on timeout or if the learning process is interrupted).
+        """
+        self.__condition.acquire()
+        try:
+            return self.__condition.wait_for(lambda: self.__changes != changes or self.__interrupted, timeout) and not self.__interrupted
+        finally:
+            self.__condition.release()
+
+    def wait_for(self, predicate, timeout):
+        """
+        Wait until a condition holds. It is checked every time a change is notified.
+
+        Args:
+            predicate: Function that returns True when the condition holds.
+            timeout: Maximum time to wait.
+
+        Returns:
+            bool: The last result of the predicate.
+        """
+        self.__condition.acquire()
+        try:
+            return self.__condition.wait_for(predicate, timeout)
+        finally:
+            self.__condition.release()
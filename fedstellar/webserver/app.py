@@ -630,6 +630,7 @@ def fedstellar_scenario_deployment_run():
                 "topology": data["topology"],
                 "simulation": data["simulation"],
                 "docker": data["docker"],
+                "inprocess": data.get("inprocess", False),
                 "env": None,
                 "webserver": True,
                 "webport": request.host.split(":")[1] if ":" in request.host else 80,  # Get the port of the webserver, if not specified, use 80